@@ -0,0 +1,282 @@
+"""Synthesis resource and Fmax benchmark.
+
+Elaborates a matrix of UART configurations, and synthesizes each for the
+iCEBreaker's iCE40 UP5K with yosys and nextpnr-ice40 (the same flow as the
+loopback demo). Results are written as a CSV or JSON table with one row per
+configuration.
+
+Run from the repository root::
+
+    python -m bench.synth -j 4 -o bench_output.csv
+
+The ``YOSYS`` and ``NEXTPNR_ICE40`` environment variables override the tool
+names (e.g. ``YOSYS=yowasp-yosys NEXTPNR_ICE40=yowasp-nextpnr-ice40``).
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import product
+
+from amaranth import *
+from amaranth.back import rtlil
+from amaranth.hdl.ir import Fragment
+
+from uart.bank import UartBank
+from uart.core import Core, ShiftOut
+from uart.params import NumDataBits, Parity
+from uart.rx import ShiftIn
+
+
+class FixedFormat(Elaboratable):
+    """ShiftIn with the frame format tied to 8N1, so that synthesis removes
+       the logic for other data widths and parity."""
+    def __init__(self, **kwargs):
+        self.shift_in = ShiftIn(**kwargs)
+
+    def ports(self):
+        return [self.shift_in.rx, self.shift_in.divider_tick,
+                self.shift_in.rd_data, self.shift_in.rd_status,
+                self.shift_in.data, self.shift_in.status.as_value()]
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.shift_in = self.shift_in
+        m.d.comb += [
+            self.shift_in.num_data_bits.eq(NumDataBits.EIGHT),
+            self.shift_in.parity.eq(Parity.const({"enabled": 0})),
+        ]
+        return m
+
+
+class Harness(Elaboratable):
+    """
+    Connect all ports of a design to two pins, so that designs with more
+    ports than the package has I/Os can be placed and routed.
+
+    Inputs are driven from a shift register fed by ``scan_in``. Outputs are
+    registered, and XOR-reduced into ``scan_out``. Either way, every port
+    sees a registered path, like it would when connected to other logic.
+    """
+    def __init__(self, dut, ports):
+        self.dut = dut
+        self.scan_in = Signal(1)
+        self.scan_out = Signal(1)
+
+        dirs = Fragment.get(dut, None).prepare(ports=ports).ports
+        self.inputs = [p for p in ports if dirs[p] == "i"]
+        self.outputs = [p for p in ports if dirs[p] == "o"]
+
+    def elaborate(self, platform):
+        inputs = Cat(*self.inputs)
+        outputs = Cat(*self.outputs)
+        chain = Signal(len(inputs))
+        captured = Signal(len(outputs))
+
+        ###
+
+        m = Module()
+        m.submodules.dut = self.dut
+
+        m.d.sync += [
+            chain.eq(Cat(self.scan_in, chain[:-1])),
+            captured.eq(outputs),
+            self.scan_out.eq(captured.xor()),
+        ]
+        m.d.comb += inputs.eq(chain)
+
+        return m
+
+
+class Cores(Elaboratable):
+    """``num_cores`` independent Cores, to compare against a UartBank of as
+       many channels."""
+    def __init__(self, num_cores, divisor, **kwargs):
+        self.cores = [Core(divisor, **kwargs) for _ in range(num_cores)]
+
+    def ports(self):
+        return [p for core in self.cores for p in core.ports()]
+
+    def elaborate(self, platform):
+        m = Module()
+        for (i, core) in enumerate(self.cores):
+            m.submodules[f"core_{i}"] = core
+        return m
+
+
+def configs():
+    """Yield (name, params, factory) for each configuration to benchmark."""
+    for (oversample, depth, divisor, compact) in product((16, 4),
+                                                         (0, 16, 64),
+                                                         (None, 6),
+                                                         (False, True)):
+        params = {"kind": "Core", "oversample": oversample,
+                  "fifo_depth": depth,
+                  "divisor": "runtime" if divisor is None else divisor,
+                  "compact_fsm": compact, "pipelined_fsm": False,
+                  "parity": False}
+        name = (f"core_os{oversample}_fifo{depth}_"
+                f"div{params['divisor']}_{'compact' if compact else 'unrolled'}")  # noqa: E501
+
+        yield (name, params, partial(Core, divisor, oversample=oversample,
+                                     compact_fsm=compact, rx_fifo_depth=depth,
+                                     tx_fifo_depth=depth))
+
+    for (oversample, compact, pipelined, parity) in product((16, 8, 4),
+                                                            (False, True),
+                                                            (False, True),
+                                                            (False, True)):
+        params = {"kind": "ShiftIn", "oversample": oversample,
+                  "fifo_depth": 0, "divisor": "", "compact_fsm": compact,
+                  "pipelined_fsm": pipelined, "parity": parity}
+        name = (f"shift_in_os{oversample}_"
+                f"{'compact' if compact else 'unrolled'}_"
+                f"{'pipelined_' if pipelined else ''}"
+                f"{'parity' if parity else '8n1'}")
+
+        if parity:
+            factory = partial(ShiftIn, oversample, compact,
+                              pipelined=pipelined)
+        else:
+            factory = partial(FixedFormat, oversample=oversample,
+                              compact=compact, pipelined=pipelined)
+
+        yield (name, params, factory)
+
+    # A UartBank against the same number of Cores. Without FIFOs, so that
+    # 16 channels fit in an UP5K, and the difference isn't lost among the
+    # FIFOs that neither shares.
+    for (num_channels, divisor) in product((4, 8, 16), (None, 6)):
+        params = {"kind": "UartBank", "oversample": 16, "fifo_depth": 0,
+                  "divisor": "runtime" if divisor is None else divisor,
+                  "compact_fsm": True, "pipelined_fsm": False,
+                  "parity": False}
+        name = f"bank{num_channels}_div{params['divisor']}"
+        yield (name, params, partial(UartBank, num_channels, (divisor,),
+                                     compact_fsm=True, rx_fifo_depth=0,
+                                     tx_fifo_depth=0))
+
+        params = {**params, "kind": f"{num_channels}x Core"}
+        name = f"cores{num_channels}_div{params['divisor']}"
+        yield (name, params, partial(Cores, num_channels, divisor,
+                                     compact_fsm=True, rx_fifo_depth=0,
+                                     tx_fifo_depth=0))
+
+    yield ("shift_out", {"kind": "ShiftOut", "oversample": "",
+                         "fifo_depth": 0, "divisor": "", "compact_fsm": "",
+                         "pipelined_fsm": "", "parity": False}, ShiftOut)
+
+
+def run_tool(env_var, default, args, cwd):
+    tool = os.environ.get(env_var, default)
+    result = subprocess.run([tool] + args, cwd=cwd, capture_output=True,
+                            text=True)
+    if result.returncode:
+        raise RuntimeError(f"{tool} failed:\n{result.stderr}")
+
+
+def synth(name, params, factory, args):
+    """Synthesize one configuration, returning a row of results. File names
+       are relative to a scratch directory, since YoWASP tools can't see
+       absolute paths outside of the working directory."""
+    row = {"name": name, **params}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        dut = factory()
+        with open(os.path.join(workdir, "dut.il"), "w") as fp:
+            fp.write(rtlil.convert(dut, name="top", ports=dut.ports()))
+
+        dut = factory()
+        harness = Harness(dut, dut.ports())
+        with open(os.path.join(workdir, "top.il"), "w") as fp:
+            fp.write(rtlil.convert(harness, name="top",
+                                   ports=[harness.scan_in,
+                                          harness.scan_out]))
+
+        # Resource usage of the design alone.
+        run_tool("YOSYS", "yosys",
+                 ["-q", "-p", "read_rtlil dut.il; synth_ice40 -top top; "
+                  "tee -q -o stat.json stat -json"], workdir)
+        with open(os.path.join(workdir, "stat.json")) as fp:
+            cells = json.load(fp)["design"]["num_cells_by_type"]
+
+        row["luts"] = cells.get("SB_LUT4", 0)
+        row["ffs"] = sum(n for (c, n) in cells.items()
+                         if c.startswith("SB_DFF"))
+        row["carries"] = cells.get("SB_CARRY", 0)
+        row["brams"] = cells.get("SB_RAM40_4K", 0)
+        row["cells"] = sum(n for (c, n) in cells.items()
+                           if not c.startswith("$"))
+
+        # Fmax of the design inside the harness.
+        run_tool("YOSYS", "yosys",
+                 ["-q", "-p", "read_rtlil top.il; "
+                  "synth_ice40 -top top -json top.json"], workdir)
+        run_tool("NEXTPNR_ICE40", "nextpnr-ice40",
+                 ["-q", f"--{args.device}", "--package", args.package,
+                  "--freq", str(args.freq), "--seed", str(args.seed),
+                  "--json", "top.json", "--report", "report.json"], workdir)
+        with open(os.path.join(workdir, "report.json")) as fp:
+            report = json.load(fp)
+
+        row["fmax_mhz"] = round(min(c["achieved"]
+                                    for c in report["fmax"].values()), 2)
+
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="filter", default="",
+                        help="only run configurations whose name contains "
+                             "this string")
+    parser.add_argument("-j", dest="jobs", type=int, default=1,
+                        help="number of configurations to run in parallel")
+    parser.add_argument("-o", dest="output", default=None,
+                        help="output file (default: stdout)")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--device", default="up5k")
+    parser.add_argument("--package", default="sg48")
+    parser.add_argument("--freq", type=float, default=12,
+                        help="target frequency in MHz")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--list", action="store_true",
+                        help="list configuration names and exit")
+    args = parser.parse_args()
+
+    selected = [c for c in configs() if args.filter in c[0]]
+    if args.list:
+        for (name, _, _) in selected:
+            print(name)
+        return
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = [pool.submit(synth, *c, args) for c in selected]
+        rows = []
+        for f in futures:
+            rows.append(f.result())
+            print(f"{rows[-1]['name']}: {rows[-1]['luts']} LUTs, "
+                  f"{rows[-1]['fmax_mhz']} MHz", file=sys.stderr)
+
+    fp = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(rows, fp, indent=2)
+            fp.write("\n")
+        else:
+            writer = csv.DictWriter(fp, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if args.output:
+            fp.close()
+
+
+if __name__ == "__main__":
+    main()
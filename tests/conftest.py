@@ -1,41 +1,271 @@
 import pytest
 
+from amaranth import Elaboratable, Signal, Value
+from amaranth.hdl.ast import ValueCastable
+from amaranth.hdl.ir import Fragment
 from amaranth.sim import Simulator
 
+from cxxsim import CxxrtlSimulator
+from stimulus import *
+from tracer import Tracer
+
 
 def pytest_addoption(parser):
     parser.addoption(
         "--vcds",
         action="store_true",
-        help="generate Value Change Dump (vcds) from simulations",
+        help="generate Value Change Dump (vcds) from simulations; tests "
+             "with a trace marker only capture the signals and cycles it "
+             "names",
+    )
+    parser.addoption(
+        "--vcd-signals",
+        metavar="NAMES",
+        help="comma-separated names of the signals to capture with --vcds "
+             "or --vcd-ring (e.g. rx,status,shift_fsm.fsm_state), instead "
+             "of those in the trace marker",
+    )
+    parser.addoption(
+        "--vcd-ring",
+        type=int,
+        metavar="CYCLES",
+        help="keep the last CYCLES cycles of the traced signals (by "
+             "default, the attributes of the module under test), and write "
+             "a VCD only if the test fails",
+    )
+    parser.addoption(
+        "--sim-backend",
+        choices=("pysim", "cxxrtl"),
+        default="pysim",
+        help="simulate with Amaranth's Python simulator, or a CXXRTL model "
+             "compiled with the host C++ compiler ($CXX, default g++)",
     )
+    parser.addoption(
+        "--soak-bytes",
+        type=int,
+        default=2000,
+        help="number of bytes to send in soak tests (e.g. 1000000 with "
+             "--sim-backend=cxxrtl)",
+    )
+    parser.addoption(
+        "--no-elab-cache",
+        action="store_true",
+        help="elaborate a new module under test for every test",
+    )
+
+
+# Elaborated modules under test, keyed by configuration. Each pytest-xdist
+# worker is a separate process, and so gets a cache of its own.
+_elab_cache = {}
+
+
+def elaborate(factory, args, kwargs, cache=True):
+    """Construct and elaborate a module under test, returning the module and
+       its fragment. Modules with the same configuration share a fragment,
+       which is safe because all simulation state is owned by the
+       Simulator."""
+    try:
+        key = (factory, args, tuple(sorted(kwargs.items())))
+        hash(key)
+    except TypeError:
+        key = None
+
+    if not cache or key is None:
+        mod = factory(*args, **kwargs)
+        return (mod, Fragment.get(mod, None))
+
+    if key not in _elab_cache:
+        mod = factory(*args, **kwargs)
+        _elab_cache[key] = (mod, Fragment.get(mod, None))
+    return _elab_cache[key]
 
 
 class SimulatorFixture:
-    def __init__(self, req, cfg):
-        self.mod = req.node.get_closest_marker("module").args[0]
+    def __init__(self, req, cfg, module_kwargs):
+        # The module marker takes a class (or factory) and its arguments,
+        # so that no module instance is shared between tests at import time.
+        # Keyword arguments from the module_kwargs fixture are merged in.
+        # Use pytest.mark.module.with_args(cls, ...) to pass a class.
+        marker = req.node.get_closest_marker("module")
+        factory = marker.args[0]
+        if isinstance(factory, Elaboratable):
+            raise TypeError("module marker must be given a class or factory, "
+                            f"not an instance of {type(factory).__name__}")
+        kwargs = {**marker.kwargs, **module_kwargs}
+        self.mod, self.frag = elaborate(factory, marker.args[1:], kwargs,
+                                        not cfg.getoption("no_elab_cache"))
         self.name = req.node.name
-        self.sim = Simulator(self.mod)
+        clks = req.node.get_closest_marker("clks")
+        self.clks = clks.args[0]
+        self.domain_clks = clks.kwargs
         self.vcds = cfg.getoption("vcds")
+        self.backend = cfg.getoption("sim_backend")
+        if self.backend == "cxxrtl":
+            self.cache_dir = str(cfg.cache.mkdir("cxxrtl"))
+        self.top = Stimulus(self.frag)
 
-        for clk in req.node.get_closest_marker("clks").args[0]:
-            self.sim.add_clock(clk)
+        self.tracer = None
+        trace = req.node.get_closest_marker("trace")
+        signals = cfg.getoption("vcd_signals")
+        ring = cfg.getoption("vcd_ring")
+        if signals is not None:
+            names = signals.split(",")
+        elif trace is not None:
+            names = trace.args
+        else:
+            names = None
+        if ring is not None:
+            self.tracer = Tracer(self.trace_signals(names), ring=ring)
+        elif self.vcds and (trace is not None or signals is not None):
+            trigger = trace.kwargs.get("trigger") if trace else None
+            self.tracer = Tracer(
+                self.trace_signals(names),
+                trigger=None if trigger is None else self.find(trigger),
+                pre=trace.kwargs.get("pre", 0) if trace else 0,
+                post=trace.kwargs.get("post", 0) if trace else 0)
+
+    def find(self, name):
+        """Return the value called name in the module under test: a dotted
+           path of attributes (e.g. "status.frame"), or failing that, of
+           submodule names ending in the name of a signal driven there
+           (e.g. "shift_fsm.fsm_state")."""
+        try:
+            obj = self.mod
+            for attr in name.split("."):
+                obj = getattr(obj, attr)
+            return Value.cast(obj)
+        except (AttributeError, TypeError):
+            pass
+
+        *path, signal_name = name.split(".")
+        frag = self.frag
+        for sub in path:
+            frag = frag.find_subfragment(sub)
+        for (_, signal) in frag.iter_drivers():
+            if signal.name == signal_name:
+                return signal
+        raise NameError(f"no signal {name} in {type(self.mod).__name__}")
+
+    def trace_signals(self, names):
+        """Map names to the values to trace; all signal (and view)
+           attributes of the module under test if names is None."""
+        if names is None:
+            return {name: Value.cast(value)
+                    for (name, value) in vars(self.mod).items()
+                    if isinstance(value, (Signal, ValueCastable))}
+        return {name: self.find(name) for name in names}
+
+    def add_stimulus(self, module=None, connections=[]):
+        """Simulate module alongside the module under test, and connect
+           them with the given combinational statements."""
+        if module is not None:
+            self.top.modules.append(module)
+        self.top.connections += connections
 
     def run(self, sync_processes, processes=[]):
+        if self.backend == "cxxrtl":
+            self.sim = CxxrtlSimulator(self.top, cache_dir=self.cache_dir)
+        else:
+            self.sim = Simulator(self.top)
+        for clk in self.clks:
+            self.sim.add_clock(clk)
+        for (domain, clk) in self.domain_clks.items():
+            self.sim.add_clock(clk, domain=domain)
+
+        # A sync process may be given with the domain it runs in.
         for s in sync_processes:
-            self.sim.add_sync_process(s)
+            if isinstance(s, tuple):
+                self.sim.add_sync_process(s[0], domain=s[1])
+            else:
+                self.sim.add_sync_process(s)
 
         for p in processes:
             self.sim.add_process(p)
 
-        if self.vcds:
+        if self.tracer is not None:
+            self.sim.add_sync_process(self.tracer.process)
+            self.sim.run()
+            if self.vcds and self.tracer.samples.maxlen is None:
+                self.write_trace()
+        elif self.vcds:
             with self.sim.write_vcd(self.name + ".vcd", self.name + ".gtkw"):
                 self.sim.run()
         else:
             self.sim.run()
 
+    def write_trace(self):
+        self.tracer.write_vcd(self.name + ".vcd", self.clks[0])
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """Write the ring buffer of traced cycles when a test fails, whether in
+       a simulation process or afterwards."""
+    outcome = yield
+    report = outcome.get_result()
+    simfix = getattr(item, "simfix", None)
+    if report.when == "call" and report.failed and simfix is not None and \
+            simfix.tracer is not None and simfix.tracer.samples.maxlen:
+        simfix.write_trace()
+
 
 @pytest.fixture
-def sim_mod(request, pytestconfig):
-    simfix = SimulatorFixture(request, pytestconfig)
+def module_kwargs():
+    """Keyword arguments to construct a module marker given as a class.
+       Override in a test module to parametrize the module under test."""
+    return {}
+
+
+@pytest.fixture
+def sim_mod(request, pytestconfig, module_kwargs):
+    simfix = SimulatorFixture(request, pytestconfig, module_kwargs)
+    request.node.simfix = simfix
     return (simfix, simfix.mod)
+
+
+@pytest.fixture
+def soak_bytes(pytestconfig):
+    return pytestconfig.getoption("soak_bytes")
+
+
+@pytest.fixture
+def tick_gen(sim_mod):
+    """Add a TickGen to the simulation, driving tick every divisor
+       cycles."""
+    sim, _ = sim_mod
+
+    def make(tick, divisor):
+        gen = TickGen(divisor)
+        sim.add_stimulus(gen, [tick.eq(gen.tick)])
+        return gen
+
+    return make
+
+
+@pytest.fixture
+def frame_serializer(sim_mod):
+    """Add a FrameSerializer to the simulation, driving line from a memory
+       of words."""
+    sim, _ = sim_mod
+
+    def make(line, words, **kwargs):
+        ser = FrameSerializer(words, **kwargs)
+        sim.add_stimulus(ser, [line.eq(ser.tx)])
+        return ser
+
+    return make
+
+
+@pytest.fixture
+def line_player(sim_mod):
+    """Add a LinePlayer to the simulation, playing back a waveform of
+       samples on line."""
+    sim, _ = sim_mod
+
+    def make(line, tick, samples):
+        player = LinePlayer(samples)
+        sim.add_stimulus(player, [line.eq(player.line),
+                                  player.tick.eq(tick)])
+        return player
+
+    return make
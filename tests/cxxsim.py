@@ -0,0 +1,508 @@
+import ctypes
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from amaranth import *
+from amaranth.back import rtlil
+from amaranth.hdl.ast import (ArrayProxy, Assign, Operator, Part, SignalDict,
+                              Slice, Statement, ValueCastable)
+from amaranth.hdl.ir import Fragment
+from amaranth.sim import Active, Delay, Passive, Settle, Tick
+
+
+__all__ = ["CxxrtlSimulator"]
+
+
+# Step whole clock cycles without returning to Python in between, for
+# stretches of time where no process is waiting on a clock edge.
+_HARNESS_SRC = """
+extern "C"
+void harness_cycles(cxxrtl_handle handle, uint32_t *clk, size_t cycles) {
+	for (size_t i = 0; i < cycles; i++) {
+		clk[0] = 1;
+		cxxrtl_step(handle);
+		clk[0] = 0;
+		cxxrtl_step(handle);
+	}
+}
+"""
+
+_CXXRTL_INPUT = 1 << 0
+_CXXRTL_WIRE = 1
+_CXXRTL_OUTLINE = 4
+
+
+class _Object(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("width", ctypes.c_size_t),
+        ("lsb_at", ctypes.c_size_t),
+        ("depth", ctypes.c_size_t),
+        ("zero_at", ctypes.c_size_t),
+        ("curr", ctypes.POINTER(ctypes.c_uint32)),
+        ("next", ctypes.POINTER(ctypes.c_uint32)),
+        ("outline", ctypes.c_void_p),
+        ("attrs", ctypes.c_void_p),
+    ]
+
+
+def _runtime_dir():
+    import amaranth_yosys
+    return os.path.join(os.path.dirname(amaranth_yosys.__file__), "share",
+                        "include", "backends", "cxxrtl", "runtime")
+
+
+def build(fragment, cache_dir):
+    """Convert a prepared fragment to C++ and compile it into a shared
+       library, unless one built from identical source is already in
+       cache_dir. Returns the library and the fragment's name map."""
+    rtlil_text, name_map = rtlil.convert_fragment(fragment, name="top")
+    # At -O5 and above, write_cxxrtl can emit outlines that drop the result
+    # of asynchronous memory reads (e.g. SyncFIFO.r_data reads as 0).
+    script = f"read_rtlil <<rtlil\n{rtlil_text}\nrtlil\nwrite_cxxrtl -O4\n"
+    src = subprocess.run([sys.executable, "-m", "amaranth_yosys", "-q", "-"],
+                         input=script, capture_output=True, text=True,
+                         check=True).stdout
+    src += _HARNESS_SRC
+
+    cxx = os.environ.get("CXX", "g++")
+    flags = ["-shared", "-fPIC", "-O1", "-std=c++14", "-w",
+             "-DCXXRTL_INCLUDE_CAPI_IMPL", "-DCXXRTL_INCLUDE_VCD_CAPI_IMPL",
+             "-I" + _runtime_dir()]
+    key = hashlib.sha256(" ".join([cxx, *flags, src]).encode()).hexdigest()
+    lib_path = os.path.join(cache_dir, key[:16] + ".so")
+
+    if not os.path.exists(lib_path):
+        # Build under a unique name and rename, so that parallel test
+        # workers building the same design never see a partial file.
+        with tempfile.TemporaryDirectory(dir=cache_dir) as workdir:
+            src_path = os.path.join(workdir, "top.cc")
+            with open(src_path, "w") as fp:
+                fp.write(src)
+            tmp_path = os.path.join(workdir, "top.so")
+            subprocess.run([cxx, *flags, src_path, "-o", tmp_path],
+                           check=True)
+            os.replace(tmp_path, lib_path)
+
+    lib = ctypes.CDLL(lib_path)
+    lib.cxxrtl_design_create.restype = ctypes.c_void_p
+    lib.cxxrtl_create.restype = ctypes.c_void_p
+    lib.cxxrtl_create.argtypes = [ctypes.c_void_p]
+    lib.cxxrtl_destroy.argtypes = [ctypes.c_void_p]
+    lib.cxxrtl_step.argtypes = [ctypes.c_void_p]
+    lib.cxxrtl_get_parts.restype = ctypes.POINTER(_Object)
+    lib.cxxrtl_get_parts.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+                                     ctypes.POINTER(ctypes.c_size_t)]
+    lib.cxxrtl_outline_eval.argtypes = [ctypes.c_void_p]
+    lib.cxxrtl_vcd_create.restype = ctypes.c_void_p
+    lib.cxxrtl_vcd_destroy.argtypes = [ctypes.c_void_p]
+    lib.cxxrtl_vcd_timescale.argtypes = [ctypes.c_void_p, ctypes.c_int,
+                                         ctypes.c_char_p]
+    lib.cxxrtl_vcd_add_from.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+    lib.cxxrtl_vcd_sample.argtypes = [ctypes.c_void_p, ctypes.c_uint64]
+    lib.cxxrtl_vcd_read.argtypes = [ctypes.c_void_p,
+                                    ctypes.POINTER(ctypes.c_char_p),
+                                    ctypes.POINTER(ctypes.c_size_t)]
+    lib.harness_cycles.argtypes = [ctypes.c_void_p,
+                                   ctypes.POINTER(ctypes.c_uint32),
+                                   ctypes.c_size_t]
+    return (lib, name_map)
+
+
+class _Process:
+    def __init__(self, coroutine, default_cmd):
+        self.coroutine = coroutine
+        self.default_cmd = default_cmd
+        self.passive = False
+        self.done = False
+        # One of None (runnable), ("tick", domain), ("settle",) or
+        # ("delay", deadline).
+        self.wait = None
+
+
+class CxxrtlSimulator:
+    """
+    Run testbench processes against a CXXRTL model of a design, compiled
+    with the host C++ compiler.
+
+    Processes use the same commands as with :class:`amaranth.sim.Simulator`
+    (reading values, assigning to undriven signals, ``Tick``, ``Settle``,
+    ``Delay``, ``Passive`` and ``Active``), and see the same values at the
+    same points in time: reads right after a clock edge return values from
+    before the edge, and writes take effect along with the edge.
+
+    When no process waits on a clock edge (e.g. all are in a ``Delay``),
+    a single clock domain is stepped from C++ without returning to Python.
+    """
+    def __init__(self, fragment, *, cache_dir):
+        self._fragment = Fragment.get(fragment, None).prepare()
+        self._lib, name_map = build(self._fragment, cache_dir)
+        self._names = SignalDict((sig, " ".join(name[1:]))
+                                 for (sig, name) in name_map.items())
+
+        self._handle = self._lib.cxxrtl_create(
+            self._lib.cxxrtl_design_create())
+        self._objects = SignalDict()
+        # Signals that aren't part of the design (e.g. only ever used by
+        # processes) are simulated in Python.
+        self._shadow = SignalDict()
+        self._pending = SignalDict()
+
+        # Inputs start out as zero, rather than at their reset value.
+        for (signal, direction) in self._fragment.ports.items():
+            if direction == "i" and signal.reset:
+                self._write_signal(signal, signal.reset)
+
+        self._clocks = {}
+        self._processes = []
+        self._now = 0
+        self._vcd = None
+
+    def __del__(self):
+        if getattr(self, "_handle", None) is not None:
+            self._lib.cxxrtl_destroy(self._handle)
+
+    def _object(self, signal):
+        if signal not in self._objects:
+            obj = None
+            if signal in self._names:
+                parts = ctypes.c_size_t()
+                ptr = self._lib.cxxrtl_get_parts(
+                    self._handle, self._names[signal].encode(),
+                    ctypes.byref(parts))
+                if ptr and parts.value == 1:
+                    obj = ptr.contents
+                else:
+                    raise NameError(f"Signal {signal!r} is not observable "
+                                    "in the compiled design")
+            self._objects[signal] = obj
+        return self._objects[signal]
+
+    def _read_signal(self, signal):
+        obj = self._object(signal)
+        if obj is None:
+            return self._shadow.get(signal, signal.reset)
+        if obj.type == _CXXRTL_OUTLINE:
+            self._lib.cxxrtl_outline_eval(obj.outline)
+        raw = 0
+        for i in range((obj.width + 31) // 32):
+            raw |= obj.curr[i] << (32 * i)
+        return Const(raw, signal.shape()).value
+
+    def _write_signal(self, signal, value):
+        obj = self._object(signal)
+        if obj is None:
+            self._shadow[signal] = value
+            return
+        if not obj.flags & _CXXRTL_INPUT:
+            raise ValueError(f"Cannot assign to {signal!r}, which is driven "
+                             "by the design")
+        raw = value & ((1 << obj.width) - 1)
+        words = obj.next if obj.type == _CXXRTL_WIRE else obj.curr
+        for i in range((obj.width + 31) // 32):
+            words[i] = (raw >> (32 * i)) & 0xffffffff
+
+    def _eval(self, value):
+        if isinstance(value, Const):
+            return value.value
+        if isinstance(value, Signal):
+            return self._read_signal(value)
+
+        shape = value.shape()
+        if isinstance(value, Slice):
+            raw = self._eval(value.value) >> value.start
+            result = raw & ((1 << (value.stop - value.start)) - 1)
+        elif isinstance(value, Part):
+            raw = self._eval(value.value) & ((1 << len(value.value)) - 1)
+            result = raw >> (self._eval(value.offset) * value.stride)
+        elif isinstance(value, Cat):
+            result = 0
+            offset = 0
+            for part in value.parts:
+                result |= ((self._eval(part) & ((1 << len(part)) - 1))
+                           << offset)
+                offset += len(part)
+        elif isinstance(value, ArrayProxy):
+            index = self._eval(value.index)
+            elems = list(value.elems)
+            result = self._eval(Value.cast(elems[min(index, len(elems) - 1)]))
+        elif isinstance(value, Operator):
+            result = self._eval_operator(value)
+        else:
+            raise TypeError(f"Cannot evaluate {value!r} in a CXXRTL "
+                            "simulation")
+        return Const(result, shape).value
+
+    def _eval_operator(self, value):
+        op = value.operator
+        args = [self._eval(v) for v in value.operands]
+        if op == "m":
+            return args[1] if args[0] else args[2]
+        if len(args) == 1:
+            (a,) = args
+            width = len(value.operands[0])
+            if op == "~":
+                return ~a
+            if op == "-":
+                return -a
+            if op == "b" or op == "r|":
+                return int(a != 0)
+            if op == "r&":
+                return int(a & ((1 << width) - 1) == (1 << width) - 1)
+            if op == "r^":
+                return bin(a & ((1 << width) - 1)).count("1") & 1
+            if op in ("u", "s"):
+                return a
+        else:
+            (a, b) = args
+            if op == "+":
+                return a + b
+            if op == "-":
+                return a - b
+            if op == "*":
+                return a * b
+            if op == "//":
+                return a // b if b else 0
+            if op == "%":
+                return a % b if b else 0
+            if op == "&":
+                return a & b
+            if op == "|":
+                return a | b
+            if op == "^":
+                return a ^ b
+            if op == "<<":
+                return a << b
+            if op == ">>":
+                return a >> b
+            if op == "==":
+                return int(a == b)
+            if op == "!=":
+                return int(a != b)
+            if op == "<":
+                return int(a < b)
+            if op == "<=":
+                return int(a <= b)
+            if op == ">":
+                return int(a > b)
+            if op == ">=":
+                return int(a >= b)
+        raise TypeError(f"Unsupported operator {op!r} in a CXXRTL simulation")
+
+    def _assign(self, lhs, value):
+        if isinstance(lhs, Signal):
+            self._pending[lhs] = Const(value, lhs.shape()).value
+        elif isinstance(lhs, Slice):
+            width = lhs.stop - lhs.start
+            mask = ((1 << width) - 1) << lhs.start
+            curr = self._pending_value(lhs.value)
+            self._assign(lhs.value,
+                         (curr & ~mask) | ((value << lhs.start) & mask))
+        elif isinstance(lhs, Cat):
+            for part in lhs.parts:
+                self._assign(part, value & ((1 << len(part)) - 1))
+                value >>= len(part)
+        else:
+            raise TypeError(f"Cannot assign to {lhs!r} in a CXXRTL "
+                            "simulation")
+
+    def _pending_value(self, signal):
+        if signal in self._pending:
+            return self._pending[signal]
+        return self._eval(signal)
+
+    def _commit(self):
+        for (signal, value) in self._pending.items():
+            self._write_signal(signal, value)
+        self._pending.clear()
+
+    def _execute(self, statements):
+        if isinstance(statements, Statement):
+            statements = [statements]
+        for stmt in statements:
+            if not isinstance(stmt, Assign):
+                raise TypeError(f"Unsupported statement {stmt!r} in a CXXRTL "
+                                "simulation")
+            self._assign(stmt.lhs, self._eval(stmt.rhs))
+
+    def _run(self, process):
+        """Run a process until it waits for something."""
+        response = None
+        process.wait = None
+        while True:
+            try:
+                command = process.coroutine.send(response)
+            except StopIteration:
+                process.done = True
+                process.passive = True
+                return
+            if command is None:
+                command = process.default_cmd
+            response = None
+
+            if isinstance(command, ValueCastable):
+                command = Value.cast(command)
+            if isinstance(command, Value):
+                response = self._eval(command)
+            elif isinstance(command, (Statement, list)):
+                self._execute(command)
+            elif type(command) is Tick:
+                if command.domain not in self._clocks:
+                    raise NameError(f"Domain {command.domain!r} has no clock")
+                process.wait = ("tick", command.domain)
+                return
+            elif type(command) is Settle:
+                process.wait = ("settle",)
+                return
+            elif type(command) is Delay:
+                interval = int((command.interval or 0) * 1e12)
+                process.wait = ("delay", self._now + interval)
+                return
+            elif type(command) is Passive:
+                process.passive = True
+            elif type(command) is Active:
+                process.passive = False
+            elif command is None:
+                raise TypeError("Received default command from a process "
+                                "that was added with add_process()")
+            else:
+                raise TypeError(f"Received unsupported command {command!r}")
+
+    def add_clock(self, period, *, domain="sync"):
+        if domain in self._clocks:
+            raise ValueError(f"Domain {domain!r} already has a clock driving "
+                             "it")
+        if domain not in self._fragment.domains:
+            raise ValueError(f"Domain {domain!r} is not present in "
+                             "simulation")
+        period = int(period * 1e12)
+        clk = self._fragment.domains[domain].clk
+        # Like the Python simulator, the first (rising) edge is half a
+        # period in.
+        self._clocks[domain] = {"clk": clk, "period": period,
+                                "next": period // 2, "level": 0}
+
+    def add_process(self, process):
+        def wrapper():
+            yield Settle()
+            yield from process()
+        self._processes.append(_Process(wrapper(), None))
+
+    def add_sync_process(self, process, *, domain="sync"):
+        def wrapper():
+            yield Tick(domain)
+            yield from process()
+        self._processes.append(_Process(wrapper(), Tick(domain)))
+
+    def _step(self):
+        self._lib.cxxrtl_step(self._handle)
+        if self._vcd is not None:
+            self._lib.cxxrtl_vcd_sample(self._vcd, self._now)
+
+    def _settle(self):
+        """Commit pending writes, and resume processes waiting on Settle
+           until none remain."""
+        self._commit()
+        self._step()
+        while True:
+            batch = [p for p in self._processes
+                     if not p.done and p.wait == ("settle",)]
+            if not batch:
+                break
+            for p in batch:
+                self._run(p)
+            self._commit()
+            self._step()
+
+    def _fast_forward(self, deadline):
+        """Step the only clock domain from C++ up to deadline, if no process
+           needs to see any of those clock edges."""
+        if len(self._clocks) != 1 or self._vcd is not None:
+            return
+        if any(not p.done and p.wait[0] == "tick" for p in self._processes):
+            return
+        (clock,) = self._clocks.values()
+        if clock["level"]:
+            return
+        # Whole cycles whose falling edge is before the deadline.
+        cycles = (deadline - clock["next"]) // clock["period"]
+        if cycles <= 0:
+            return
+        obj = self._object(clock["clk"])
+        self._lib.harness_cycles(self._handle, obj.curr, cycles)
+        clock["next"] += cycles * clock["period"]
+        self._now = clock["next"] - clock["period"] // 2
+
+    def advance(self):
+        """Advance to the next clock edge or deadline. Returns True if any
+           active processes remain."""
+        delays = [p.wait[1] for p in self._processes
+                  if not p.done and p.wait[0] == "delay"]
+        if delays:
+            self._fast_forward(min(delays))
+
+        now = min([c["next"] for c in self._clocks.values()] + delays)
+        self._now = now
+
+        rising = []
+        for (domain, clock) in self._clocks.items():
+            if clock["next"] == now:
+                clock["level"] ^= 1
+                clock["next"] += clock["period"] // 2
+                if clock["level"]:
+                    rising.append(domain)
+
+        # Processes resumed at an edge see values from before it, and their
+        # writes are committed after the flops have been clocked.
+        for p in self._processes:
+            if p.done:
+                continue
+            if ((p.wait[0] == "tick" and p.wait[1] in rising) or
+                    (p.wait[0] == "delay" and p.wait[1] == now)):
+                self._run(p)
+
+        for clock in self._clocks.values():
+            self._write_signal(clock["clk"], clock["level"])
+        self._step()
+        self._settle()
+
+        return any(not p.passive for p in self._processes)
+
+    def run(self):
+        self._step()
+        for p in self._processes:
+            self._run(p)
+        self._settle()
+
+        while any(not p.passive for p in self._processes):
+            if not self._clocks and not any(
+                    not p.done and p.wait[0] == "delay"
+                    for p in self._processes):
+                raise RuntimeError("Processes are waiting, but nothing "
+                                   "can wake them")
+            self.advance()
+
+    @contextmanager
+    def write_vcd(self, vcd_file, gtkw_file=None):
+        self._vcd = self._lib.cxxrtl_vcd_create()
+        self._lib.cxxrtl_vcd_timescale(self._vcd, 1, b"ps")
+        self._lib.cxxrtl_vcd_add_from(self._vcd, self._handle)
+        try:
+            yield
+        finally:
+            data = ctypes.c_char_p()
+            size = ctypes.c_size_t()
+            with open(vcd_file, "wb") as fp:
+                while True:
+                    self._lib.cxxrtl_vcd_read(self._vcd, ctypes.byref(data),
+                                              ctypes.byref(size))
+                    if not size.value:
+                        break
+                    fp.write(ctypes.string_at(data, size.value))
+            self._lib.cxxrtl_vcd_destroy(self._vcd)
+            self._vcd = None
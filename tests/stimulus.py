@@ -0,0 +1,207 @@
+from amaranth import *
+
+
+class Stimulus(Elaboratable):
+    """Top level for simulation: the module under test (or its elaborated
+       fragment), plus hardware stimulus and the combinational connections
+       between them."""
+    def __init__(self, dut):
+        self.dut = dut
+        self.modules = []
+        self.connections = []
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.dut = self.dut
+        for i, mod in enumerate(self.modules):
+            m.submodules[f"stimulus_{i}"] = mod
+        m.d.comb += self.connections
+        return m
+
+
+class TickGen(Elaboratable):
+    """Assert ``tick`` once every ``divisor`` clock cycles (like a timing
+       generator supplied with a baud rate divisor register), starting on
+       the first cycle out of reset."""
+    def __init__(self, divisor):
+        self.divisor = divisor
+        self.tick = Signal(1)
+
+    def elaborate(self, platform):
+        count = Signal(range(self.divisor), reset=self.divisor - 1)
+
+        ###
+
+        m = Module()
+
+        # A divide-by-n counter requires n - 1 ticks per period.
+        with m.If(count == self.divisor - 1):
+            m.d.comb += self.tick.eq(1)
+            m.d.sync += count.eq(0)
+        with m.Else():
+            m.d.sync += count.eq(count + 1)
+
+        return m
+
+
+class FrameSerializer(Elaboratable):
+    """
+    Transmit UART frames on ``tx``, one per word in ``words``.
+
+    As soon as ``en`` is set, each word is sent LSB first as a START bit,
+    ``num_bits`` data (and parity) bits and a STOP bit, each lasting
+    ``bit_period`` clock cycles, followed by ``idle_bits`` bit periods of
+    idle. ``sent`` counts frames whose STOP bit has finished. If ``loop`` is
+    set, start over from the first word after the last one.
+    """
+    def __init__(self, words, *, bit_period, idle_bits=0, loop=False):
+        self.mem = Memory(width=9, depth=len(words), init=words)
+        self.bit_period = bit_period
+        self.idle_bits = idle_bits
+        self.loop = loop
+
+        self.en = Signal(1)
+        self.num_bits = Signal(range(10))
+        self.tx = Signal(1, reset=1)
+        self.sent = Signal(16)
+
+    def elaborate(self, platform):
+        addr = Signal(range(self.mem.depth))
+        timer = Signal(range(self.bit_period))
+        bit = Signal(range(12))
+        idle = Signal(range(self.idle_bits + 1))
+        bit_done = Signal(1)
+
+        ###
+
+        m = Module()
+        m.submodules.rdport = rdport = self.mem.read_port(domain="comb")
+
+        m.d.comb += [
+            rdport.addr.eq(addr),
+            bit_done.eq(timer == self.bit_period - 1),
+        ]
+
+        with m.If(bit_done):
+            m.d.sync += timer.eq(0)
+        with m.Else():
+            m.d.sync += timer.eq(timer + 1)
+
+        def next_word():
+            with m.If(addr == self.mem.depth - 1):
+                m.d.sync += addr.eq(0)
+                m.next = "FRAME" if self.loop else "DONE"
+            with m.Else():
+                m.d.sync += addr.eq(addr + 1)
+                m.next = "FRAME"
+
+        with m.FSM():
+            # Start the first frame as soon as en is set.
+            with m.State("WAIT"):
+                with m.If(self.en):
+                    m.d.comb += self.tx.eq(0)
+                    m.next = "FRAME"
+                with m.Else():
+                    m.d.sync += timer.eq(0)
+
+            with m.State("FRAME"):
+                # START bit, followed by the word.
+                with m.If(bit <= self.num_bits):
+                    m.d.comb += self.tx.eq(Cat(C(0, 1), rdport.data)
+                                           .bit_select(bit, 1))
+                with m.Else():
+                    m.d.comb += self.tx.eq(1)
+
+                with m.If(bit_done):
+                    m.d.sync += bit.eq(bit + 1)
+                    with m.If(bit == self.num_bits + 1):
+                        m.d.sync += [
+                            bit.eq(0),
+                            self.sent.eq(self.sent + 1),
+                        ]
+                        if self.idle_bits:
+                            m.next = "IDLE"
+                        else:
+                            next_word()
+
+            with m.State("IDLE"):
+                m.d.comb += self.tx.eq(1)
+
+                with m.If(bit_done):
+                    m.d.sync += idle.eq(idle + 1)
+                    with m.If(idle == self.idle_bits - 1):
+                        m.d.sync += idle.eq(0)
+                        next_word()
+
+            with m.State("DONE"):
+                m.d.comb += self.tx.eq(1)
+
+        return m
+
+
+class StreamSource(Elaboratable):
+    """Offer an incrementing count (modulo 2 ** width) on an AXI stream,
+       starting from 0, as fast as the sink accepts it."""
+    def __init__(self, width=8):
+        self.tvalid = Signal(1)
+        self.tready = Signal(1)
+        self.tdata = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.d.comb += self.tvalid.eq(1)
+        with m.If(self.tready):
+            m.d.sync += self.tdata.eq(self.tdata + 1)
+
+        return m
+
+
+class StreamSink(Elaboratable):
+    """Accept every word on an AXI stream, counting them in ``count``, and
+       counting words that don't follow the sequence from a
+       ``StreamSource`` in ``errors``."""
+    def __init__(self, width=8):
+        self.tvalid = Signal(1)
+        self.tready = Signal(1)
+        self.tdata = Signal(width)
+
+        self.count = Signal(32)
+        self.errors = Signal(32)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.d.comb += self.tready.eq(1)
+        with m.If(self.tvalid):
+            m.d.sync += self.count.eq(self.count + 1)
+            with m.If(self.tdata != self.count[:len(self.tdata)]):
+                m.d.sync += self.errors.eq(self.errors + 1)
+
+        return m
+
+
+class LinePlayer(Elaboratable):
+    """Play back a waveform on ``line``, advancing one sample per ``tick``
+       (e.g. a ``divider_tick``), then hold the line idle."""
+    def __init__(self, samples):
+        # One extra idle sample to hold once the waveform has been played.
+        self.mem = Memory(width=1, depth=len(samples) + 1,
+                          init=list(samples) + [1])
+
+        self.tick = Signal(1)
+        self.line = Signal(1, reset=1)
+        self.addr = Signal(range(len(samples) + 1))
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.rdport = rdport = self.mem.read_port(domain="comb")
+
+        m.d.comb += [
+            rdport.addr.eq(self.addr),
+            self.line.eq(rdport.data),
+        ]
+        with m.If(self.tick & (self.addr < self.mem.depth - 1)):
+            m.d.sync += self.addr.eq(self.addr + 1)
+
+        return m
@@ -0,0 +1,101 @@
+import pytest
+from amaranth import *
+
+from uart.autobaud import *
+from uart.core import Core
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("sync_char,skew",
+                         [pytest.param(c, s, marks=pytest.mark.module.with_args(AutoBaud, 16, 4, c))  # noqa: E501
+                          for c in (None, 0x55, 0x7f)
+                          for s in (-0.1, 0.0, 0.1)])
+def test_measure(sim_mod, frame_serializer, sync_char, skew):
+    """The divisor should be measured exactly from a clean frame, within the
+       skew range ShiftIn tolerates, and only lock once the frame is
+       over."""
+    sim, autobaud = sim_mod
+    # 64 clocks per bit is a divisor of 4 at 16x oversampling, or 64 with
+    # 4 fractional bits.
+    bit_period = round(64 * (1 + skew))
+    ser = frame_serializer(autobaud.rx, [sync_char or 0x55],
+                           bit_period=bit_period)
+
+    def in_proc():
+        yield ser.num_bits.eq(8)
+        yield ser.en.eq(1)
+        for _ in range(30 * bit_period):
+            if (yield autobaud.locked):
+                break
+            yield
+        else:
+            assert False, "no lock"
+
+        assert (yield autobaud.divisor) == bit_period
+        # What is left of the frame is idle.
+        while not (yield ser.sent):
+            assert (yield autobaud.rx)
+            yield
+
+    sim.run(sync_processes=[in_proc])
+
+
+@pytest.mark.parametrize("sync_char", (0x00, 0xff, 0x33, 0x100))
+def test_bad_sync_char(sync_char):
+    with pytest.raises(ValueError):
+        AutoBaud(sync_char=sync_char)
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("sync_char,skews",
+                         [pytest.param(c, s, marks=pytest.mark.module.with_args(Core, 1, oversample=4, frac_bits=4, autobaud=True, sync_char=c))  # noqa: E501
+                          for c in (None, 0x55, 0x7f)
+                          for s in ((0.1, -0.1), (-0.1, 0.1))])
+def test_renegotiate(sim_mod, line_player, sync_char, skews):
+    """A Core should lock onto the rate of the sync character, receive at
+       that rate, and lock onto a four times faster rate after baud_hunt,
+       with either rate up to 10% off nominal (and not a whole number of
+       clocks per bit)."""
+    np = pytest.importorskip("numpy")
+    from uart import model
+
+    sim, core = sim_mod
+    rng = np.random.default_rng(0)
+    data = [rng.integers(0, 256, 10, dtype=np.uint8) for _ in range(2)]
+    # Clocks per bit, and a divisor with 4 fractional bits at 4x
+    # oversampling.
+    periods = [64 * (1 + skews[0]), 16 * (1 + skews[1])]
+    divisors = [p * 16 / 4 for p in periods]
+
+    line = []
+    for (d, p) in zip(data, periods):
+        # The START bit alone needs the line idle for a frame afterwards.
+        frames = np.concatenate(([sync_char or 0x55], d)).astype(np.uint8)
+        idle = [12] + [0] * len(d)
+        line.append(model.encode(frames, oversample=p, idle_bits=idle))
+        line.append(np.ones(2000, dtype=np.uint8))
+    line_player(core.rx, C(1), np.concatenate(line).tolist())
+
+    def host_proc():
+        yield core.rx_tready.eq(1)
+        for (d, divisor) in zip(data, divisors):
+            received = []
+            while len(received) < len(d):
+                if (yield core.rx_tvalid):
+                    received.append((yield core.rx_tdata))
+                    assert (yield core.rx_tuser) == 0
+                yield
+
+            assert received == d.tolist()
+            assert (yield core.baud_locked)
+            # Within a clock over the measured span, plus rounding.
+            error = (yield core.baud_divisor) - divisor
+            assert abs(error) <= 16 / 4 / core.autobaud.span + 0.5
+
+            yield core.baud_hunt.eq(1)
+            yield
+            yield core.baud_hunt.eq(0)
+            yield
+            assert not (yield core.baud_locked)
+
+    sim.run(sync_processes=[host_proc])
@@ -0,0 +1,160 @@
+import pytest
+from amaranth import *
+from amaranth.sim import Settle
+
+from uart.bank import *
+
+
+class BankLoopback(Elaboratable):
+    """Connect the TX and RX lines of each channel of a UartBank."""
+    def __init__(self, num_channels, divisors, **kwargs):
+        self.bank = UartBank(num_channels, divisors, **kwargs)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.bank = self.bank
+        m.d.comb += self.bank.rx.eq(self.bank.tx)
+        return m
+
+
+@pytest.fixture
+def bank(sim_mod):
+    _, loopback = sim_mod
+    return loopback.bank
+
+
+@pytest.fixture
+def tx_proc(bank):
+    """Send (channel, byte) pairs on the TX stream."""
+    def task(tx_data):
+        yield bank.tx_tvalid.eq(1)
+        for (dest, b) in tx_data:
+            yield bank.tx_tdest.eq(dest)
+            yield bank.tx_tdata.eq(b)
+            yield Settle()
+            while not (yield bank.tx_tready):
+                yield
+                yield Settle()
+            yield
+        yield bank.tx_tvalid.eq(0)
+
+    return task
+
+
+@pytest.fixture
+def rx_proc(bank):
+    """Drain the RX stream, recording (cycle, channel, byte) and checking
+       that an offered byte does not change until taken."""
+    def task(received, num_bytes, ready=lambda cycle: True):
+        cycle = 0
+        offered = None
+        while len(received) < num_bytes:
+            yield bank.rx_tready.eq(ready(cycle))
+            yield Settle()
+            if (yield bank.rx_tvalid):
+                beat = ((yield bank.rx_tdest), (yield bank.rx_tdata))
+                assert offered is None or beat == offered
+                if (yield bank.rx_tready):
+                    received.append((cycle,) + beat)
+                    offered = None
+                else:
+                    offered = beat
+            cycle += 1
+            yield
+
+    return task
+
+
+@pytest.mark.module.with_args(BankLoopback, 4, (1,), oversample=4)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_channels(sim_mod, tx_proc, rx_proc):
+    """Every byte should come back on the channel it was sent on, in order
+       per channel, even with a consumer that stalls."""
+    sim, _ = sim_mod
+    tx_data = [((i * 3) % 4, (i * 37 + 11) & 0xff) for i in range(24)]
+    received = []
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def in_proc():
+        yield from rx_proc(received, len(tx_data),
+                           ready=lambda cycle: cycle % 3 != 0)
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+    for ch in range(4):
+        assert [d for (_, c, d) in received if c == ch] == \
+            [d for (c, d) in tx_data if c == ch]
+
+
+@pytest.mark.module.with_args(BankLoopback, 3, (1,), oversample=4,
+                              rx_fifo_depth=4)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_round_robin(sim_mod, bank, tx_proc, rx_proc):
+    """With bytes waiting on every channel, the RX stream should take one
+       from each channel in turn."""
+    sim, _ = sim_mod
+    tx_data = [(ch, 0x10 * ch + i) for i in range(3) for ch in range(3)]
+    received = []
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def in_proc():
+        # Wait for all the bytes to arrive before draining.
+        yield bank.rx_tready.eq(0)
+        for ch in bank.channels:
+            while (yield ch.rx_level) < 3:
+                yield
+        yield from rx_proc(received, len(tx_data))
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+    dests = [c for (_, c, _) in received]
+    assert sorted(dests[:3]) == [0, 1, 2]
+    assert dests[3:6] == dests[:3]
+    assert dests[6:] == dests[:3]
+    # One byte per cycle.
+    assert received[-1][0] - received[0][0] == len(tx_data) - 1
+
+
+@pytest.mark.module.with_args(BankLoopback, 2, (1, 2), baud_sel=(0, 1),
+                              oversample=4)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_baud_sel(sim_mod, bank, tx_proc, rx_proc):
+    """Channels on different baud rate generators should run at their own
+       rates."""
+    sim, _ = sim_mod
+    tx_data = [(0, 0x55), (1, 0x55)] * 4
+    received = []
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def in_proc():
+        yield from rx_proc(received, len(tx_data))
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+    # Frames are 40 cycles at divisor 1, and 80 cycles at divisor 2, give
+    # or take a cycle waiting for the other channel's byte to be taken.
+    (first, last) = ({}, {})
+    for (cycle, ch, d) in received:
+        assert d == 0x55
+        first.setdefault(ch, cycle)
+        last[ch] = cycle
+    assert abs((last[0] - first[0]) - 3 * 40) <= 1
+    assert abs((last[1] - first[1]) - 3 * 80) <= 1
+
+
+@pytest.mark.parametrize("args,kwargs", [
+    ((0,), {}),
+    ((2, ()), {}),
+    ((2, (1,)), {"baud_sel": (0,)}),
+    ((2, (1,)), {"baud_sel": (0, 1)}),
+    ((2, (1,)), {"rx_trigger_level": 17}),
+])
+def test_bad_config(args, kwargs):
+    with pytest.raises(ValueError):
+        UartBank(*args, **kwargs)
@@ -0,0 +1,87 @@
+import pytest
+from amaranth import *
+from amaranth.sim import Settle
+
+from uart.baud import *
+from uart.params import calc_divisor
+
+
+def tick_periods(sim, baud, divisor, num_ticks):
+    periods = []
+
+    # Set the divisor before the first clock edge.
+    def init_proc():
+        yield baud.divisor.eq(divisor)
+
+    def tick_proc():
+        last = None
+        cycle = 0
+        while len(periods) < num_ticks:
+            yield Settle()
+            if (yield baud.tick):
+                if last is not None:
+                    periods.append(cycle - last)
+                last = cycle
+            cycle += 1
+            yield
+
+    sim.run(sync_processes=[tick_proc], processes=[init_proc])
+    return periods
+
+
+@pytest.mark.module.with_args(BaudGen)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_integer_divisor(sim_mod):
+    sim, baud = sim_mod
+    assert tick_periods(sim, baud, 5, 20) == [5] * 20
+
+
+@pytest.mark.module.with_args(BaudGen, frac_bits=4)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_fractional_divisor(sim_mod):
+    sim, baud = sim_mod
+    # 3.25 clocks per tick.
+    periods = tick_periods(sim, baud, 52, 64)
+
+    assert set(periods) == {3, 4}
+    assert sum(periods) == 64 * 3.25
+
+
+@pytest.mark.module.with_args(BaudGen, oversample=4)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_tx_strobe(sim_mod):
+    sim, baud = sim_mod
+
+    def strobe_proc():
+        yield baud.divisor.eq(3)
+        ticks = 0
+        for _ in range(3 * 4 * 8):
+            yield Settle()
+            if (yield baud.tick):
+                ticks += 1
+                assert (yield baud.tx_strobe) == (ticks % 4 == 0)
+            else:
+                assert (yield baud.tx_strobe) == 0
+            yield
+
+    sim.run(sync_processes=[strobe_proc])
+
+
+@pytest.mark.parametrize("baud_rate,oversample", ((921600, 4),
+                                                  (1000000, 4),
+                                                  (115200, 16)))
+def test_calc_divisor(baud_rate, oversample):
+    int_div, int_ppm = calc_divisor(12e6, baud_rate, oversample=oversample)
+    frac_div, frac_ppm = calc_divisor(12e6, baud_rate, oversample=oversample,
+                                      frac_bits=8)
+
+    assert abs(frac_ppm) <= abs(int_ppm)
+    assert abs(frac_ppm) < 1000
+
+    actual = 12e6 * 256 / (oversample * frac_div)
+    assert actual == pytest.approx(baud_rate * (1 + frac_ppm / 1e6))
+
+
+def test_calc_divisor_out_of_range():
+    with pytest.raises(ValueError):
+        calc_divisor(12e6, 3000000, oversample=16)
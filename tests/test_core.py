@@ -0,0 +1,740 @@
+import pytest
+from amaranth import *
+from amaranth.sim import Delay, Passive, Settle
+
+from stimulus import StreamSink, StreamSource
+from uart.core import *
+
+
+class Loopback(Elaboratable):
+    """Connect the TX and RX lines of a Core, so both directions of the
+       datapath are active at once."""
+    def __init__(self, divisor, **kwargs):
+        self.core = Core(divisor, **kwargs)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.core = self.core
+        m.d.comb += self.core.rx.eq(self.core.tx)
+        if self.core.flow_control:
+            m.d.comb += self.core.cts_n.eq(self.core.rts_n)
+        return m
+
+
+@pytest.fixture
+def core(sim_mod):
+    _, loopback = sim_mod
+    return loopback.core
+
+
+@pytest.fixture
+def tx_proc(core):
+    """Feed bytes to the TX stream as fast as the core will accept them."""
+    def task(tx_data):
+        yield core.tx_tvalid.eq(1)
+        for b in tx_data:
+            yield core.tx_tdata.eq(b)
+            yield Settle()
+            while not (yield core.tx_tready):
+                yield
+                yield Settle()
+            yield
+        yield core.tx_tvalid.eq(0)
+
+    return task
+
+
+@pytest.fixture
+def rx_proc(core):
+    """Drain the RX stream every cycle, recording the cycle each byte
+       arrived."""
+    def task(received, num_bytes):
+        yield core.rx_tready.eq(1)
+        cycle = 0
+        while len(received) < num_bytes:
+            yield Settle()
+            if (yield core.rx_tvalid):
+                received.append((cycle, (yield core.rx_tdata)))
+                assert (yield core.shift_in.status.overrun) == 0
+            cycle += 1
+            yield
+
+    return task
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("divisor,oversample",
+                         [pytest.param(d, o, marks=pytest.mark.module.with_args(Loopback, d, oversample=o))  # noqa: E501
+                          for (d, o) in ((1, 16), (3, 16), (1, 4))])
+def test_full_duplex_throughput(sim_mod, divisor, oversample, tx_proc,
+                                rx_proc):
+    """Benchmark: transmit a burst of back-to-back bytes and receive them
+       simultaneously, checking that the core sustains line rate."""
+    sim, _ = sim_mod
+
+    tx_data = [(i * 37 + 11) & 0xff for i in range(32)]
+    received = []
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def in_proc():
+        yield from rx_proc(received, len(tx_data))
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+    assert [d for (_, d) in received] == tx_data
+
+    bit_period = oversample * divisor
+    # Time between first and last byte received is entirely bounded by
+    # how fast the transmitter can put frames on the line.
+    cycles_per_frame = ((received[-1][0] - received[0][0]) /
+                        (len(received) - 1))
+    bits_per_frame = cycles_per_frame / bit_period
+    print(f"\ndivisor {divisor}, {oversample}x: {bits_per_frame:.2f} bit periods/frame, "
+          f"{12e6 / cycles_per_frame:.0f} frames/s "
+          f"(line rate {12e6 / bit_period:.0f} baud)")
+
+    # START + 8 data bits + STOP, with no idle time between frames.
+    assert bits_per_frame == 10
+
+
+@pytest.mark.module.with_args(Loopback, 1, rx_fifo_depth=32)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_rx_fifo_burst(sim_mod, core, tx_proc):
+    """A stalled consumer should not lose any bytes of a burst that fits in
+       the RX FIFO."""
+    sim, _ = sim_mod
+    tx_data = list(range(0x40, 0x40 + 32))
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def in_proc():
+        yield core.rx_tready.eq(0)
+        assert (yield core.rx_almost_empty) == 1
+
+        while (yield core.rx_level) < len(tx_data):
+            yield
+
+        assert (yield core.rx_almost_full) == 1
+        assert (yield core.rx_almost_empty) == 0
+        assert (yield core.shift_in.status.overrun) == 0
+
+        received = []
+        yield core.rx_tready.eq(1)
+        yield Settle()
+        while (yield core.rx_tvalid):
+            received.append((yield core.rx_tdata))
+            yield
+            yield Settle()
+
+        assert received == tx_data
+        assert (yield core.rx_level) == 0
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+
+@pytest.mark.module.with_args(Loopback, 1)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_tx_line_utilization(sim_mod, core, tx_proc, rx_proc):
+    """Benchmark: a 1000-byte burst should keep the TX line busy 100% of the
+       time, i.e. every START bit immediately follows the previous STOP
+       bit."""
+    sim, _ = sim_mod
+    tx_data = [(i * 73 + 5) & 0xff for i in range(1000)]
+    received = []
+    frame_starts = []
+    bit_period = 16
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def in_proc():
+        yield from rx_proc(received, len(tx_data))
+
+    def line_proc():
+        yield Passive()
+        cycle = 0
+        while True:
+            yield Settle()
+            if (yield core.shift_out.valid & core.shift_out.ready):
+                frame_starts.append(cycle)
+            cycle += 1
+            yield
+
+    sim.run(sync_processes=[out_proc, in_proc, line_proc])
+
+    assert [d for (_, d) in received] == tx_data
+
+    # Each START bit begins when ShiftOut loads a frame.
+    assert len(frame_starts) == len(tx_data)
+    line_periods = (frame_starts[-1] - frame_starts[0]) // bit_period + 10
+    busy_periods = 10 * len(tx_data)
+    print(f"\n{busy_periods} of {line_periods} bit periods busy "
+          f"({100 * busy_periods / line_periods:.1f}% line utilization)")
+
+    assert (frame_starts[-1] - frame_starts[0]) % bit_period == 0
+    assert line_periods == busy_periods
+
+
+@pytest.mark.module.with_args(Core, 3.25, oversample=4, frac_bits=4)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_fractional_baud(sim_mod):
+    """921600 baud from a 12 MHz clock is 3.255 clocks per tick at 4x
+       oversampling. An integer divisor is 8% off, but a fractional divisor
+       should communicate with an ideal 921600 baud peer."""
+    sim, core = sim_mod
+    clks_per_bit = 12e6 / 921600
+    data = [0x55, 0xA3, 0x00, 0xFF, 0x0F, 0x96, 0x3C, 0x81]
+
+    # Ideal line waveform of back-to-back 8N1 frames.
+    bits = [1] * 4
+    for b in data:
+        bits += [0] + [(b >> i) & 1 for i in range(8)] + [1]
+    bits += [1] * 4
+
+    def rx_line_proc():
+        for cycle in range(int(len(bits) * clks_per_bit)):
+            yield core.rx.eq(bits[int(cycle / clks_per_bit)])
+            yield
+
+    def rx_proc():
+        received = []
+        yield core.rx_tready.eq(1)
+        while len(received) < len(data):
+            yield Settle()
+            if (yield core.rx_tvalid):
+                received.append((yield core.rx_tdata))
+            yield
+
+        assert received == data
+
+    def tx_proc():
+        yield core.tx_tvalid.eq(1)
+        for b in data:
+            yield core.tx_tdata.eq(b)
+            yield Settle()
+            while not (yield core.tx_tready):
+                yield
+                yield Settle()
+            yield
+        yield core.tx_tvalid.eq(0)
+
+    def tx_line_proc():
+        # Find the first START bit, then sample in the middle of each bit
+        # as an ideal 921600 baud receiver would.
+        while (yield core.tx):
+            yield
+        tx_bits = []
+        cycle = 0
+        while len(tx_bits) < 10 * len(data):
+            if cycle == int((len(tx_bits) + 0.5) * clks_per_bit):
+                tx_bits.append((yield core.tx))
+            cycle += 1
+            yield
+
+        for i, b in enumerate(data):
+            frame = tx_bits[10 * i:10 * (i + 1)]
+            assert frame[0] == 0
+            assert frame[9] == 1
+            assert sum(bit << n for n, bit in enumerate(frame[1:9])) == b
+
+    sim.run(sync_processes=[rx_line_proc, rx_proc, tx_proc, tx_line_proc])
+
+
+@pytest.mark.parametrize("divisor,oversample",
+                         [pytest.param(d, o, marks=pytest.mark.module.with_args(Loopback, d, oversample=o))  # noqa: E501
+                          for (d, o) in ((1, 4), (1, 16))])
+@pytest.mark.clks((1.0 / 12e6,))
+def test_soak(sim_mod, core, divisor, oversample, soak_bytes):
+    """Stream soak_bytes bytes through a loopback (3 Mbaud at 4x
+       oversampling) from a hardware source to a hardware sink, which
+       checks the sequence. Nothing is stepped from Python, so with
+       --sim-backend=cxxrtl this runs at compiled speed."""
+    sim, _ = sim_mod
+    src = StreamSource()
+    sink = StreamSink()
+    sim.add_stimulus(src, [
+        core.tx_tvalid.eq(src.tvalid),
+        core.tx_tdata.eq(src.tdata),
+        src.tready.eq(core.tx_tready),
+    ])
+    sim.add_stimulus(sink, [
+        sink.tvalid.eq(core.rx_tvalid),
+        sink.tdata.eq(core.rx_tdata),
+        core.rx_tready.eq(sink.tready),
+    ])
+
+    # Back-to-back frames, plus a few frames of latency.
+    bit_period = divisor * oversample
+    cycles = (soak_bytes + 4) * 10 * bit_period
+
+    def check_proc():
+        yield Delay(cycles / 12e6)
+
+        assert (yield sink.count) >= soak_bytes
+        assert (yield sink.errors) == 0
+        assert (yield core.shift_in.status.overrun) == 0
+        assert (yield core.shift_in.status.frame) == 0
+
+    sim.run(sync_processes=[check_proc])
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("width",
+                         [pytest.param(w, marks=pytest.mark.module.with_args(Loopback, 1, oversample=4, stream_width=w))  # noqa: E501
+                          for w in (16, 32, 64)])
+def test_wide_stream(sim_mod, core, width):
+    """Benchmark: a burst sent in wide beats should come back packed into
+       full beats, ending with a tlast beat once the line is idle, using
+       width / 8 times fewer transactions than bytes on each side."""
+    sim, _ = sim_mod
+    lanes = width // 8
+    tx_data = [(i * 29 + 3) & 0xff for i in range(lanes * 5 + 1)]
+    rx_beats = []
+    tx_beats = 0
+
+    def out_proc():
+        nonlocal tx_beats
+        yield core.tx_tvalid.eq(1)
+        for i in range(0, len(tx_data), lanes):
+            chunk = tx_data[i:i + lanes]
+            yield core.tx_tdata.eq(sum(b << (8 * n)
+                                       for (n, b) in enumerate(chunk)))
+            yield core.tx_tkeep.eq((1 << len(chunk)) - 1)
+            yield Settle()
+            while not (yield core.tx_tready):
+                yield
+                yield Settle()
+            tx_beats += 1
+            yield
+        yield core.tx_tvalid.eq(0)
+
+    def in_proc():
+        yield core.rx_tready.eq(1)
+        while not rx_beats or not rx_beats[-1][2]:
+            yield Settle()
+            if (yield core.rx_tvalid):
+                rx_beats.append(((yield core.rx_tdata), (yield core.rx_tkeep),
+                                 (yield core.rx_tlast)))
+            yield
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+    received = [(data >> (8 * n)) & 0xff for (data, keep, _) in rx_beats
+                for n in range(lanes) if keep & (1 << n)]
+    assert received == tx_data
+    assert [last for (_, _, last) in rx_beats] == [0] * 5 + [1]
+    assert [keep for (_, keep, _) in rx_beats] == \
+        [(1 << lanes) - 1] * 5 + [1]
+    assert tx_beats == len(rx_beats) == -(-len(tx_data) // lanes)
+    print(f"\n{width}-bit stream: {len(tx_data)} bytes in {tx_beats} TX "
+          f"and {len(rx_beats)} RX transactions")
+
+
+@pytest.mark.parametrize("width", (0, 24, 128))
+def test_bad_stream_width(width):
+    with pytest.raises(ValueError):
+        Core(1, stream_width=width)
+
+
+@pytest.mark.parametrize("kwargs", ({"rx_trigger_level": 0},
+                                    {"rx_trigger_level": 17},
+                                    {"rx_trigger_level": 2,
+                                     "rx_fifo_depth": 0}))
+def test_bad_trigger_level(kwargs):
+    with pytest.raises(ValueError):
+        Core(1, **kwargs)
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("trigger",
+                         [pytest.param(t, marks=pytest.mark.module.with_args(Loopback, 1, oversample=4, rx_trigger_level=t))  # noqa: E501
+                          for t in (1, 8)])
+def test_rx_irq(sim_mod, core, tx_proc, trigger):
+    """Benchmark: a host that drains the RX FIFO on each interrupt should
+       take one per trigger_level bytes, plus one for the remainder of each
+       burst after the character timeout, without losing any bytes."""
+    sim, _ = sim_mod
+    bursts = [[(i * 7 + n) & 0xff for i in range(20)] for n in range(3)]
+    received = []
+    irqs = []
+
+    def out_proc():
+        for burst in bursts:
+            yield from tx_proc(burst)
+            # Wait for the TX FIFO to drain, then idle for longer than the
+            # 40 bit character timeout (40 cycles per frame).
+            for _ in range(40 * (len(burst) + 5)):
+                yield
+
+    def host_proc():
+        while len(received) < sum(len(b) for b in bursts):
+            if (yield core.rx_irq):
+                irqs.append((yield core.rx_irq_timeout))
+                yield core.rx_tready.eq(1)
+                yield Settle()
+                while (yield core.rx_tvalid):
+                    received.append((yield core.rx_tdata))
+                    yield
+                    yield Settle()
+                yield core.rx_tready.eq(0)
+            yield
+
+    sim.run(sync_processes=[out_proc, host_proc])
+
+    assert received == [b for burst in bursts for b in burst]
+    print(f"\ntrigger level {trigger}: {len(irqs)} interrupts for "
+          f"{len(received)} bytes")
+
+    per_burst = ([0] * (20 // trigger) + [1] * (20 % trigger != 0))
+    assert irqs == per_burst * len(bursts)
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("early",
+                         [pytest.param(e, marks=pytest.mark.module.with_args(Core, 1, oversample=4, early_valid=e))  # noqa: E501
+                          for e in (False, True)])
+def test_rx_errors(sim_mod, line_player, early):
+    """Each byte should come out of the RX FIFO with its own error bits on
+       rx_tuser, as the reference model predicts, while the stream keeps
+       running. In early mode, bad STOP bits are reported on
+       rx_frame_error instead."""
+    np = pytest.importorskip("numpy")
+    from uart import model
+
+    sim, core = sim_mod
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, 100, dtype=np.uint8)
+    # Enough idle time after a frame error to resynchronize.
+    line = model.encode(data, oversample=4, idle_bits=11,
+                        breaks=rng.random(len(data)) < 0.1,
+                        corrupt_stop=rng.random(len(data)) < 0.1)
+    frames = model.decode(line, oversample=4)
+    expected = [(int(f["data"]),
+                 int(f["parity"]) | int(f["frame"]) << 1 | int(f["brk"]) << 2)
+                for f in frames]
+    bad_stops = int(np.count_nonzero(frames["frame"] | frames["brk"]))
+    if early:
+        expected = [(d, user & 1) for (d, user) in expected]
+
+    # divisor 1 at 4x oversampling ticks every cycle, so play one sample
+    # per cycle.
+    line_player(core.rx, C(1), line.tolist())
+    received = []
+    frame_errors = []
+
+    def rx_proc():
+        yield core.rx_tready.eq(1)
+        for _ in range(len(line) + 16):
+            yield Settle()
+            if (yield core.rx_tvalid):
+                received.append(((yield core.rx_tdata),
+                                 (yield core.rx_tuser)))
+            if (yield core.rx_frame_error):
+                frame_errors.append(len(received))
+            yield
+
+        assert (yield core.shift_in.status.overrun) == 0
+
+    sim.run(sync_processes=[rx_proc])
+
+    assert received == expected
+    assert len(frame_errors) == bad_stops > 0
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("flow_control",
+                         [pytest.param(f, marks=pytest.mark.module.with_args(Loopback, 1, oversample=4, flow_control=f, stats=True))  # noqa: E501
+                          for f in (False, True)])
+def test_flow_control(sim_mod, core, tx_proc, flow_control):
+    """A consumer that stalls for much longer than the RX FIFO takes to fill
+       should lose bytes to overruns without flow control, and none with
+       it. The link statistics should account for every byte."""
+    import random
+
+    sim, _ = sim_mod
+    rng = random.Random(0)
+    tx_data = [rng.randrange(256) for _ in range(100)]
+    tx_done = []
+    received = []
+    overruns = []
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+        tx_done.append(True)
+
+    def host_proc():
+        idle = 0
+        # Stop once nothing is left in flight.
+        while idle < 100:
+            for _ in range(rng.randrange(1500)):
+                if (yield core.shift_in.status.overrun):
+                    overruns.append(len(received))
+                yield
+            yield core.rx_tready.eq(1)
+            for _ in range(rng.randrange(8)):
+                yield Settle()
+                if (yield core.rx_tvalid):
+                    received.append((yield core.rx_tdata))
+                yield
+            yield core.rx_tready.eq(0)
+
+            if tx_done and not (yield core.tx_fifo.level) and \
+                    not (yield core.rx_tvalid):
+                idle += 1
+            else:
+                idle = 0
+
+        stats = core.stats
+        assert (yield stats.tx_frames) == len(tx_data)
+        assert (yield stats.rx_frames) == len(tx_data)
+        assert (yield stats.overrun) == len(tx_data) - len(received)
+        assert (yield stats.rx_high_water) == core.rx_fifo_depth
+        assert (yield stats.tx_high_water) == core.tx_fifo.depth
+
+    sim.run(sync_processes=[out_proc, host_proc])
+
+    print(f"\nflow control {flow_control}: {len(received)} of "
+          f"{len(tx_data)} bytes received")
+    if flow_control:
+        assert received == tx_data
+        assert not overruns
+    else:
+        assert len(received) < len(tx_data)
+        assert overruns
+
+
+@pytest.mark.module.with_args(Core, 1, oversample=4, flow_control=True)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_cts_between_frames(sim_mod):
+    """Deasserting cts_n should finish the frame being sent, and hold off
+       the next until cts_n is asserted again."""
+    sim, core = sim_mod
+    # 0xff frames are low only for their START bit (4 cycles).
+    low = []
+
+    def tx_proc():
+        yield core.tx_tvalid.eq(1)
+        yield core.tx_tdata.eq(0xff)
+        for _ in range(2):
+            yield Settle()
+            while not (yield core.tx_tready):
+                yield
+                yield Settle()
+            yield
+        yield core.tx_tvalid.eq(0)
+
+    def line_proc():
+        while (yield core.tx):
+            yield
+        yield core.cts_n.eq(1)
+        for _ in range(200):
+            low.append(not (yield core.tx))
+            yield
+        assert sum(low) == 4
+        # Mid-frame is too late to stop the first frame.
+        assert (yield core.tx_fifo.level) == 1
+
+        yield core.cts_n.eq(0)
+        for _ in range(80):
+            low.append(not (yield core.tx))
+            yield
+        assert sum(low) == 8
+
+    sim.run(sync_processes=[tx_proc, line_proc])
+
+
+@pytest.mark.parametrize("kwargs", ({"rts_level": 0},
+                                    {"rts_level": 16},
+                                    {"rx_fifo_depth": 0}))
+def test_bad_rts_level(kwargs):
+    with pytest.raises(ValueError):
+        Core(1, flow_control=True, **kwargs)
+
+
+# 3.6864 Mbaud at 4x oversampling from a 14.7456 MHz uart clock, with a
+# system clock both faster and slower than it.
+@pytest.mark.parametrize("sys_clk", (50e6, 6e6))
+@pytest.mark.parametrize("width",
+                         [pytest.param(w, marks=pytest.mark.module.with_args(Loopback, 1, oversample=4, stream_width=w, line_domain="uart", stats=True))  # noqa: E501
+                          for w in (8, 32)])
+def test_cdc_loopback(request, width, sys_clk):
+    """With the serial side in its own clock domain, bytes should cross both
+       ways through the asynchronous FIFOs intact, and a burst should end
+       with tlast once the line is idle. Every frame should be counted
+       across the domains."""
+    request.applymarker(pytest.mark.clks((1.0 / sys_clk,),
+                                         uart=1.0 / 14.7456e6))
+    sim, loopback = request.getfixturevalue("sim_mod")
+    core = loopback.core
+    tx_proc = request.getfixturevalue("tx_proc")
+    tx_data = [(i * 37 + 11) & 0xff for i in range(32)]
+    beats = []
+
+    def out_proc():
+        yield from tx_proc(tx_data if width == 8 else
+                           [int.from_bytes(bytes(tx_data[i:i + 4]), "little")
+                            for i in range(0, len(tx_data), 4)])
+
+    def in_proc():
+        yield core.rx_tready.eq(1)
+        received = 0
+        while received < len(tx_data):
+            yield Settle()
+            if (yield core.rx_tvalid):
+                keep = (yield core.rx_tkeep) if width > 8 else 1
+                data = (yield core.rx_tdata)
+                beats.append(([(data >> (8 * i)) & 0xff
+                               for i in range(width // 8) if keep >> i & 1],
+                              (yield core.rx_tlast)))
+                received += len(beats[-1][0])
+                assert (yield core.rx_tuser) == 0
+            yield
+
+        assert (yield core.shift_in.status.overrun) == 0
+        for _ in range(10):
+            yield
+        assert (yield core.stats.rx_frames) == len(tx_data)
+        assert (yield core.stats.tx_frames) == len(tx_data)
+
+    sim.run(sync_processes=[out_proc, in_proc])
+
+    assert [b for (data, _) in beats for b in data] == tx_data
+    if width > 8:
+        assert [last for (_, last) in beats] == \
+            [0] * (len(beats) - 1) + [1]
+
+
+@pytest.mark.module.with_args(Loopback, 1, oversample=4, rx_trigger_level=8,
+                              line_domain="uart")
+@pytest.mark.clks((1.0 / 50e6,), uart=1.0 / 14.7456e6)
+def test_cdc_flags(sim_mod, core, tx_proc):
+    """rx_level, its watermark flags and the RX interrupts should follow the
+       RX FIFO from the system clock side, including the character timeout
+       counted on the line side."""
+    sim, _ = sim_mod
+    tx_data = list(range(5))
+
+    def out_proc():
+        yield from tx_proc(tx_data)
+
+    def host_proc():
+        # Count in uart clocks, 40 per frame at 3.6864 Mbaud.
+        for _ in range(40 * len(tx_data) + 20):
+            yield
+        assert (yield core.rx_level) == len(tx_data)
+        assert (yield core.rx_almost_full) == 0
+        assert (yield core.rx_almost_empty) == 0
+        assert (yield core.rx_irq) == 0
+
+    def drain_proc():
+        # Fewer bytes than the trigger level, so wait for the 40 bit
+        # character timeout.
+        cycles = 0
+        while not (yield core.rx_irq):
+            cycles += 1
+            yield
+        assert (yield core.rx_irq_timeout) == 1
+        # Not before the last frame, and then 40 bits, in uart clocks.
+        assert cycles * 14.7456 / 50 >= 40 * len(tx_data) + 4 * 40
+        received = []
+        yield core.rx_tready.eq(1)
+        yield Settle()
+        while (yield core.rx_tvalid):
+            received.append((yield core.rx_tdata))
+            yield
+            yield Settle()
+        yield core.rx_tready.eq(0)
+        assert received == tx_data
+
+        # The FIFO's read side sees reads straight away, the line side a few
+        # clocks later.
+        assert (yield core.rx_level) == 0
+        assert (yield core.rx_almost_empty) == 1
+        for _ in range(10):
+            yield
+        assert (yield core.rx_irq) == 0
+
+    sim.run(sync_processes=[out_proc, drain_proc,
+                            (host_proc, "uart")])
+
+
+@pytest.mark.parametrize("kwargs", ({"rx_fifo_depth": 0},
+                                    {"tx_fifo_depth": 0},
+                                    {"rx_fifo_depth": 24}))
+def test_bad_cdc(kwargs):
+    with pytest.raises(ValueError):
+        Core(1, line_domain="uart", **kwargs)
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("early",
+                         [pytest.param(e, marks=pytest.mark.module.with_args(Core, 1, oversample=4, early_valid=e, stats=True))  # noqa: E501
+                          for e in (False, True)])
+def test_stats(sim_mod, line_player, early):
+    """The error counters should match the frames the reference model
+       decodes, and stats_clear should reset them."""
+    np = pytest.importorskip("numpy")
+    from uart import model
+
+    sim, core = sim_mod
+    rng = np.random.default_rng(1)
+    data = rng.integers(0, 256, 100, dtype=np.uint8)
+    line = model.encode(data, oversample=4, idle_bits=11,
+                        breaks=rng.random(len(data)) < 0.1,
+                        corrupt_stop=rng.random(len(data)) < 0.1)
+    frames = model.decode(line, oversample=4)
+    line_player(core.rx, C(1), line.tolist())
+
+    def rx_proc():
+        yield core.rx_tready.eq(1)
+        for _ in range(len(line) + 16):
+            yield
+
+        stats = core.stats
+        assert (yield stats.rx_frames) == len(frames)
+        assert (yield stats.frame) == np.count_nonzero(frames["frame"]) > 0
+        assert (yield stats.brk) == np.count_nonzero(frames["brk"]) > 0
+        assert (yield stats.parity) == 0
+        assert (yield stats.overrun) == 0
+        assert (yield stats.tx_frames) == 0
+        assert (yield stats.rx_high_water) == 1
+
+        yield core.stats_clear.eq(1)
+        yield
+        yield core.stats_clear.eq(0)
+        yield
+        assert (yield stats.as_value()) == 0
+
+    sim.run(sync_processes=[rx_proc])
+
+
+@pytest.mark.module.with_args(Core, 1, oversample=4, stats=True)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_stats_glitches(sim_mod, line_player):
+    """START bits rejected as glitches should be counted, without being
+       counted as frames."""
+    np = pytest.importorskip("numpy")
+    from uart import model
+
+    sim, core = sim_mod
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, 20, dtype=np.uint8)
+    # One glitch a bit into the idle time after each frame.
+    line = model.encode(data, oversample=4, idle_bits=4)
+    starts = 4 + np.arange(len(data)) * 14 * 4
+    line = model.glitch(line, starts + 11 * 4, width=1)
+    line_player(core.rx, C(1), line.tolist())
+
+    def rx_proc():
+        yield core.rx_tready.eq(1)
+        for _ in range(len(line) + 16):
+            yield
+
+        assert (yield core.stats.rx_frames) == len(data)
+        assert (yield core.stats.glitch) == len(data)
+        assert (yield core.stats.frame) == 0
+
+    sim.run(sync_processes=[rx_proc])
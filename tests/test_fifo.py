@@ -0,0 +1,83 @@
+import pytest
+from amaranth import *
+
+from uart.fifo import *
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("depth",
+                         [pytest.param(d, marks=pytest.mark.module.with_args(Fifo, width=8, depth=d))  # noqa: E501
+                          for d in (8, 64)])
+def test_level_and_flags(sim_mod, depth):
+    sim, fifo = sim_mod
+
+    def fifo_proc():
+        assert (yield fifo.almost_empty) == 1
+        assert (yield fifo.almost_full) == 0
+
+        yield fifo.w_en.eq(1)
+        for i in range(depth):
+            yield fifo.w_data.eq(i)
+            yield
+        yield fifo.w_en.eq(0)
+        yield
+
+        assert (yield fifo.w_rdy) == 0
+        assert (yield fifo.level) == depth
+        assert (yield fifo.almost_full) == 1
+        assert (yield fifo.almost_empty) == 0
+
+        for i in range(depth):
+            while not (yield fifo.r_rdy):
+                yield
+            assert (yield fifo.r_data) == i
+            yield fifo.r_en.eq(1)
+            yield
+            yield fifo.r_en.eq(0)
+            yield
+
+        assert (yield fifo.level) == 0
+        assert (yield fifo.almost_empty) == 1
+
+    sim.run(sync_processes=[fifo_proc])
+
+
+@pytest.mark.module.with_args(Fifo, width=8, depth=16, w_domain="line")
+@pytest.mark.clks((1.0 / 12e6,), line=1.0 / 14.7456e6)
+def test_async_level(sim_mod):
+    """An asynchronous FIFO should report its level on each side once the
+       other side's pointer has crossed over."""
+    sim, fifo = sim_mod
+
+    def write_proc():
+        yield fifo.w_en.eq(1)
+        for i in range(10):
+            yield fifo.w_data.eq(i)
+            yield
+        yield fifo.w_en.eq(0)
+        yield
+        yield
+        assert (yield fifo.w_level) == 10
+
+    def read_proc():
+        while (yield fifo.level) < 10:
+            yield
+        assert (yield fifo.almost_empty) == 0
+
+        for i in range(10):
+            assert (yield fifo.r_rdy)
+            assert (yield fifo.r_data) == i
+            yield fifo.r_en.eq(1)
+            yield
+            yield fifo.r_en.eq(0)
+            yield
+        assert (yield fifo.level) == 0
+
+    sim.run(sync_processes=[(write_proc, "line"), read_proc])
+
+
+@pytest.mark.parametrize("kwargs", ({"depth": 0},
+                                    {"depth": 12, "w_domain": "line"}))
+def test_bad_depth(kwargs):
+    with pytest.raises(ValueError):
+        Fifo(width=8, **kwargs)
@@ -0,0 +1,117 @@
+import pytest
+from amaranth.sim import Settle
+
+from uart.gearbox import *
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("width",
+                         [pytest.param(w, marks=pytest.mark.module.with_args(Packer, w, user_width=3))  # noqa: E501
+                          for w in (16, 32, 64)])
+def test_packer(sim_mod, width):
+    """Bursts should be packed into full beats, with the remainder sent
+       with tlast when flushed, even if the consumer stalls. Each byte's
+       user bits should be in the same lane of tuser."""
+    sim, packer = sim_mod
+    lanes = width // 8
+    bursts = [list(range(0x10, 0x10 + lanes * 2 + 1)),
+              list(range(0x40, 0x40 + lanes)),
+              [0x80]]
+    beats = []
+
+    def in_proc():
+        for burst in bursts:
+            yield packer.flush.eq(0)
+            for b in burst:
+                yield packer.i_data.eq(b)
+                yield packer.i_user.eq(b & 7)
+                yield packer.i_valid.eq(1)
+                yield Settle()
+                while not (yield packer.i_ready):
+                    yield
+                    yield Settle()
+                yield
+            yield packer.i_valid.eq(0)
+            for _ in range(4):
+                yield
+            yield packer.flush.eq(1)
+            for _ in range(8):
+                yield
+
+    def out_proc():
+        cycle = 0
+        while len(beats) < 5:
+            yield packer.tready.eq(cycle % 3 == 0)
+            yield Settle()
+            if (yield packer.tvalid) and (yield packer.tready):
+                beats.append(((yield packer.tdata), (yield packer.tuser),
+                               (yield packer.tkeep), (yield packer.tlast)))
+            cycle += 1
+            yield
+
+    sim.run(sync_processes=[in_proc, out_proc])
+
+    def beat(data, last):
+        return (sum(b << (8 * i) for (i, b) in enumerate(data)),
+                sum((b & 7) << (3 * i) for (i, b) in enumerate(data)),
+                (1 << len(data)) - 1, last)
+
+    b0 = bursts[0]
+    assert beats == [
+        beat(b0[:lanes], 0),
+        beat(b0[lanes:2 * lanes], 0),
+        beat(b0[2 * lanes:], 1),
+        beat(bursts[1], 1),
+        beat(bursts[2], 1),
+    ]
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("width",
+                         [pytest.param(w, marks=pytest.mark.module.with_args(Unpacker, w))  # noqa: E501
+                          for w in (16, 32, 64)])
+def test_unpacker(sim_mod, width):
+    """Bytes in lanes with tkeep set should come out in lane order."""
+    sim, unpacker = sim_mod
+    lanes = width // 8
+    beats = [(sum((0x11 * (i + 1) + n) << (8 * i) for i in range(lanes)),
+              keep)
+             for (n, keep) in enumerate((0, (1 << lanes) - 1, 1,
+                                         1 << (lanes - 1), 0b10))]
+    expected = [(data >> (8 * i)) & 0xff for (data, keep) in beats
+                for i in range(lanes) if keep & (1 << i)]
+    received = []
+
+    def in_proc():
+        yield unpacker.tvalid.eq(1)
+        for (data, keep) in beats:
+            yield unpacker.tdata.eq(data)
+            yield unpacker.tkeep.eq(keep)
+            yield Settle()
+            while not (yield unpacker.tready):
+                yield
+                yield Settle()
+            yield
+        yield unpacker.tvalid.eq(0)
+
+    def out_proc():
+        cycle = 0
+        while len(received) < len(expected):
+            yield unpacker.o_ready.eq(cycle % 2 == 0)
+            yield Settle()
+            if (yield unpacker.o_valid) and (yield unpacker.o_ready):
+                received.append((yield unpacker.o_data))
+            cycle += 1
+            yield
+
+    sim.run(sync_processes=[in_proc, out_proc])
+
+    assert received == expected
+
+
+@pytest.mark.parametrize("width", (0, 8, 24, 128))
+def test_bad_width(width):
+    with pytest.raises(ValueError):
+        Packer(width)
+    with pytest.raises(ValueError):
+        Unpacker(width)
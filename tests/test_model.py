@@ -0,0 +1,175 @@
+import pytest
+from itertools import product
+
+from uart.params import *
+
+np = pytest.importorskip("numpy")
+model = pytest.importorskip("uart.model")
+
+
+PARITIES = (None,) + tuple(ParityType)
+
+
+def config_id(config):
+    (num_data_bits, parity, num_stop_bits) = config
+    return "{}{}{}".format(num_data_bits.value + 5,
+                           "N" if parity is None else parity.name[0],
+                           num_stop_bits.value + 1)
+
+
+@pytest.fixture(params=list(product(NumDataBits, PARITIES, NumStopBits)),
+                ids=config_id)
+def config(request):
+    return dict(zip(("num_data_bits", "parity", "num_stop_bits"),
+                    request.param))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def rx_kwargs(config):
+    """decode does not care about the number of STOP bits."""
+    return {k: v for (k, v) in config.items() if k != "num_stop_bits"}
+
+
+def test_parity_bits():
+    data = np.array([0x00, 0x01, 0x03, 0xFF, 0x80], dtype=np.uint8)
+    assert model.parity_bits(data, NumDataBits.EIGHT,
+                             ParityType.EVEN).tolist() == [0, 1, 0, 0, 1]
+    assert model.parity_bits(data, NumDataBits.EIGHT,
+                             ParityType.ODD).tolist() == [1, 0, 1, 1, 0]
+    # Bits above the data width are not sent, so don't count.
+    assert model.parity_bits(data, NumDataBits.SEVEN,
+                             ParityType.EVEN).tolist() == [0, 1, 0, 1, 0]
+    assert model.parity_bits(data, NumDataBits.EIGHT,
+                             ParityType.ONE).tolist() == [1] * 5
+    assert model.parity_bits(data, NumDataBits.EIGHT,
+                             ParityType.ZERO).tolist() == [0] * 5
+
+
+def test_frame_bits():
+    bits = model.frame_bits([0x35], num_data_bits=NumDataBits.EIGHT,
+                            parity=ParityType.EVEN,
+                            num_stop_bits=NumStopBits.TWO)
+    assert bits.tolist() == [[0, 1, 0, 1, 0, 1, 1, 0, 0, 0, 1, 1]]
+
+
+@pytest.mark.parametrize("oversample", (16, 8, 4))
+def test_roundtrip(config, oversample, rng):
+    data = rng.integers(0, 256, 2000, dtype=np.uint8)
+    line = model.encode(data, oversample=oversample,
+                        idle_bits=rng.integers(0, 3, len(data)), **config)
+    frames = model.decode(line, oversample=oversample, **rx_kwargs(config))
+
+    mask = (1 << (config["num_data_bits"].value + 5)) - 1
+    assert frames["data"].tolist() == (data & mask).tolist()
+    assert not frames["parity"].any()
+    assert not frames["frame"].any()
+    assert not frames["brk"].any()
+    assert (np.diff(frames["tick"]) > 0).all()
+
+
+@pytest.mark.parametrize("skew", (-0.04, 0.04))
+def test_skew(config, skew, rng):
+    data = rng.integers(0, 256, 2000, dtype=np.uint8)
+    line = model.encode(data, skew=skew, **config)
+    frames = model.decode(line, **rx_kwargs(config))
+
+    mask = (1 << (config["num_data_bits"].value + 5)) - 1
+    assert frames["data"].tolist() == (data & mask).tolist()
+    assert not (frames["parity"] | frames["frame"] | frames["brk"]).any()
+
+
+def test_too_much_skew(rng):
+    # Back-to-back frames at 10% skew should sample the wrong bits.
+    data = rng.integers(0, 256, 200, dtype=np.uint8)
+    frames = model.decode(model.encode(data, skew=0.1))
+    assert frames["frame"].any()
+
+
+@pytest.mark.parametrize("parity", (ParityType.ODD, ParityType.EVEN,
+                                    ParityType.ONE, ParityType.ZERO))
+def test_corrupt_parity(parity, rng):
+    data = rng.integers(0, 256, 2000, dtype=np.uint8)
+    corrupt = rng.random(len(data)) < 0.3
+    frames = model.decode(model.encode(data, parity=parity,
+                                       corrupt_parity=corrupt),
+                          parity=parity)
+
+    assert frames["data"].tolist() == data.tolist()
+    assert frames["parity"].tolist() == corrupt.tolist()
+    assert not frames["frame"].any()
+
+
+def test_breaks(config, rng):
+    data = rng.integers(0, 256, 2000, dtype=np.uint8)
+    breaks = rng.random(len(data)) < 0.2
+    line = model.encode(data, breaks=breaks, idle_bits=1, **config)
+    frames = model.decode(line, **rx_kwargs(config))
+
+    mask = (1 << (config["num_data_bits"].value + 5)) - 1
+    assert frames["brk"].tolist() == breaks.tolist()
+    assert not frames["frame"][~breaks].any()
+    assert frames["data"][~breaks].tolist() == \
+        (data[~breaks] & mask).tolist()
+    assert (frames["data"][breaks] == 0).all()
+
+
+def test_corrupt_stop(rng):
+    # With enough idle time to resynchronize, every corrupted STOP bit is
+    # a frame error, followed by a frame of all ones started at the STOP
+    # bit.
+    data = rng.integers(0, 256, 500, dtype=np.uint8)
+    corrupt = rng.random(len(data)) < 0.2
+    frames = model.decode(model.encode(data, corrupt_stop=corrupt,
+                                       idle_bits=11))
+
+    expected = []
+    for (d, c) in zip(data.tolist(), corrupt.tolist()):
+        expected += [(d, c)] + [(0xff, False)] * c
+    assert list(zip(frames["data"].tolist(), frames["frame"].tolist())) == \
+        expected
+
+
+def test_frame_error():
+    # Pull the STOP bit of the second frame low. The receiver restarts
+    # straight away, taking it as the START bit of a frame, so it sees the
+    # third frame one bit late, with its last data bit as the STOP bit.
+    data = np.array([0x11, 0x22, 0x33], dtype=np.uint8)
+    bits = model.frame_bits(data)
+    bits[1, -1] = 0
+    line = np.repeat(np.concatenate(([1], bits.ravel(), [1])), 16)
+    frames = model.decode(line)
+
+    assert frames["data"].tolist() == [0x11, 0x22, 0x33 << 1]
+    assert frames["frame"].tolist() == [False, True, True]
+
+
+@pytest.mark.parametrize("oversample", (16, 8, 4))
+def test_glitches(oversample, rng):
+    # A glitch on an idle line shorter than half a bit is ignored.
+    data = rng.integers(0, 256, 200, dtype=np.uint8)
+    line = model.encode(data, oversample=oversample, idle_bits=4)
+    frame_len = 10 * oversample
+    starts = oversample + np.arange(len(data)) * 14 * oversample
+    idle = starts + frame_len + oversample
+    line = model.glitch(line, idle, width=max(1, oversample // 2 - 2))
+    frames = model.decode(line, oversample=oversample)
+
+    assert frames["data"].tolist() == data.tolist()
+    assert not (frames["parity"] | frames["frame"] | frames["brk"]).any()
+
+
+def test_empty():
+    assert len(model.decode(np.ones(100, dtype=np.uint8))) == 0
+    assert len(model.decode(np.zeros(0, dtype=np.uint8))) == 0
+
+
+def test_truncated():
+    data = np.arange(10, dtype=np.uint8)
+    line = model.encode(data)
+    # Cut off during the last frame's STOP bit.
+    frames = model.decode(line[:len(line) - 24])
+    assert frames["data"].tolist() == data[:-1].tolist()
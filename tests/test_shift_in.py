@@ -1,19 +1,37 @@
 import pytest
+import random
 from amaranth import *
-from amaranth.sim import Passive
+from amaranth.sim import Passive, Settle
 from itertools import chain, filterfalse, product, repeat
 
 from uart.params import *
 from uart.rx import *
 
 
+@pytest.fixture(params=(16, 8, 4), ids=lambda o: f"{o}x")
+def oversample(request):
+    """Run every ShiftIn scenario at each supported oversampling ratio."""
+    return request.param
+
+
+@pytest.fixture(params=(False, True), ids=("unrolled", "compact"))
+def compact(request):
+    """Run every ShiftIn scenario against both ShiftInFSM implementations."""
+    return request.param
+
+
+@pytest.fixture
+def module_kwargs(oversample, compact):
+    return {"oversample": oversample, "compact": compact}
+
+
 @pytest.fixture
-def rx_bit_period(request):
+def rx_bit_period(request, oversample):
     """Calculate how many clock cycles should elapse before asserting
        divider_tick for ShiftIn."""
     clk_period = request.node.get_closest_marker("clks").args[0][0]
     baud = request.param
-    return int(1 / (16 * clk_period * baud))
+    return int(1 / (oversample * clk_period * baud))
 
 
 @pytest.fixture
@@ -26,23 +44,11 @@ def tx_bit_period(request):
 
 
 @pytest.fixture
-def div_proc(sim_mod, rx_bit_period):
-    """Simulate divider_tick for ShiftIn. Simulates a timing generator supplied
-       with a baud rate divisor register."""
+def div_gen(sim_mod, tick_gen, rx_bit_period):
+    """Drive divider_tick for ShiftIn from a hardware timing generator
+       supplied with a baud rate divisor."""
     _, shift_in = sim_mod
-
-    def task():
-        yield Passive()
-        while True:
-            yield shift_in.divider_tick.eq(0)
-            # A divide-by-n counter requires n - 1 ticks per period.
-            for _ in range(rx_bit_period - 1):
-                yield
-
-            yield shift_in.divider_tick.eq(1)
-            yield
-
-    return task
+    return tick_gen(shift_in.divider_tick, rx_bit_period)
 
 
 @pytest.fixture
@@ -60,90 +66,71 @@ def init(sim_mod):
 
 
 @pytest.fixture
-def shift_bit(sim_mod, tx_bit_period):
-    """Simulate transmitting a bit to the receiver."""
-    _, shift_in = sim_mod
-
-    def task(bit):
-        # Prepare sample
-        yield shift_in.rx.eq(bit)
-
-        # No clock dividers here, so no need for -1.
-        for _ in range(tx_bit_period):
-            yield
-
-    return task
-
-
-@pytest.fixture
-def write_data(sim_mod, shift_bit):
-    """Simulate transmitting a word to the receiver."""
-    _, shift_in = sim_mod
-
-    def task(dat):
-        # Start
-        yield from shift_bit(0)
+def write_data(sim_mod, frame_serializer, tx_bit_period):
+    """Transmit words to the receiver from a hardware serializer. Set en on
+       the returned serializer to start."""
+    sim, shift_in = sim_mod
 
-        # num_data_bits is 0-3; we need 5-8.
-        for _ in range((yield shift_in.num_data_bits) + 5 +
-                       int((yield shift_in.parity.enabled))):
-            bit = dat & 0x01
-            yield from shift_bit(bit)
+    def make(words, *, num_bits=None, **kwargs):
+        ser = frame_serializer(shift_in.rx, words, bit_period=tx_bit_period,
+                               **kwargs)
+        if num_bits is None:
+            # num_data_bits is 0-3; we need 5-8.
+            num_bits = (shift_in.num_data_bits + 5 +
+                        shift_in.parity.enabled)
+        sim.add_stimulus(connections=[ser.num_bits.eq(num_bits)])
+        return ser
 
-            dat = dat >> 1
+    return make
 
-        # Stop
-        yield from shift_bit(1)
 
-    return task
+def wait_sent(ser, num_frames):
+    """Wait until the serializer has finished sending num_frames frames."""
+    while (yield ser.sent) < num_frames:
+        yield
 
 
 @pytest.fixture
-def take_proc(sim_mod, stop_take):
-    """Convenience procedure to empty data when available."""
-    _, shift_in = sim_mod
-
-    def task():
-        yield Passive()
-        while True:
-            if (yield shift_in.status.ready) and not (yield stop_take):  # noqa: E501
-                yield shift_in.rd_data.eq(1)
-            else:
-                yield shift_in.rd_data.eq(0)
-            yield
-
-    return task
+def take(sim_mod, stop_take):
+    """Empty data when available, unless stop_take is set."""
+    sim, shift_in = sim_mod
+    sim.add_stimulus(connections=[
+        shift_in.rd_data.eq(shift_in.status.ready & ~stop_take)
+    ])
 
 
 @pytest.fixture
 def stop_take():
-    """Signal which controls take_proc fixture."""
+    """Signal which controls take fixture."""
     stop_take = Signal(1, reset=1)
     return stop_take
 
 
-@pytest.mark.module(ShiftIn())
+@pytest.mark.module.with_args(ShiftIn)
 @pytest.mark.clks((1.0 / 12e6,))
 @pytest.mark.parametrize("rx_data,rx_bit_period,tx_bit_period",
                          zip((0xAA, 0x55, 0x00, 0xFF),
                              repeat(375000),
                              repeat(375000)),
                          indirect=["rx_bit_period", "tx_bit_period"])
-def test_shift_in(sim_mod, rx_data, take_proc, div_proc,
-                  shift_bit, write_data, stop_take, init):
+def test_shift_in(sim_mod, rx_data, take, div_gen, write_data, stop_take,
+                  init, tx_bit_period):
     sim, shift_in = sim_mod
+    # Test two bytes just in case- found a nice bug when creating the
+    # frame tests.
+    ser = write_data([rx_data] * 2, idle_bits=2)
 
     def in_proc():
+        yield ser.en.eq(1)
         yield from init()
 
-        # Test two bytes just in case- found a nice bug when creating the
-        # frame tests.
-        for _ in range(2):
-            yield from write_data(rx_data)
+        for i in range(2):
+            yield from wait_sent(ser, i + 1)
             assert (yield shift_in.data == rx_data)
 
             # Test that data isn't being overwritten now that rx is done.
-            yield from shift_bit(1)
+            for _ in range(tx_bit_period):
+                yield
             assert (yield shift_in.data == rx_data)
 
             yield stop_take.eq(0)
@@ -155,24 +142,26 @@ def test_shift_in(sim_mod, rx_data, take_proc, div_proc,
             assert (yield shift_in.status.brk == 0)
             assert (yield shift_in.status.frame == 0)
 
-    sim.run(sync_processes=[in_proc, div_proc, take_proc])
+    sim.run(sync_processes=[in_proc])
 
 
-@pytest.mark.module(ShiftIn())
+@pytest.mark.module.with_args(ShiftIn)
 @pytest.mark.clks((1.0 / 12e6,))
 @pytest.mark.parametrize("data_size,rx_bit_period,tx_bit_period",
                          zip(NumDataBits,
                              repeat(375000),
                              repeat(375000)),
                          indirect=["rx_bit_period", "tx_bit_period"])
-def test_data_width(sim_mod, data_size, take_proc, div_proc, write_data,
+def test_data_width(sim_mod, data_size, take, div_gen, write_data,
                     stop_take, init):
     sim, shift_in = sim_mod
+    ser = write_data([0xff])
 
     def in_proc():
+        yield ser.en.eq(1)
         yield from init(data_bits=data_size)
 
-        yield from write_data(0xff)
+        yield from wait_sent(ser, 1)
         yield stop_take.eq(0)
         for _ in range(3):
             yield
@@ -186,7 +175,7 @@ def test_data_width(sim_mod, data_size, take_proc, div_proc, write_data,
         else:
             assert (yield shift_in.data == 0xff)
 
-    sim.run(sync_processes=[in_proc, div_proc, take_proc])
+    sim.run(sync_processes=[in_proc])
 
 
 @pytest.fixture
@@ -236,7 +225,7 @@ def parity_scenarios():
                        product(data_values, parity_types, corrupt))
 
 
-@pytest.mark.module(ShiftIn())
+@pytest.mark.module.with_args(ShiftIn)
 @pytest.mark.clks((1.0 / 12e6,))
 @pytest.mark.parametrize("data_and_parity_status,rx_bit_period,tx_bit_period",
                          zip(parity_scenarios(),
@@ -244,12 +233,13 @@ def parity_scenarios():
                              repeat(375000)),
                          indirect=["data_and_parity_status", "rx_bit_period",
                                    "tx_bit_period"])
-def test_parity(sim_mod, data_and_parity_status, take_proc, div_proc,
+def test_parity(sim_mod, data_and_parity_status, take, div_gen,
                 write_data, stop_take, init):
     sim, shift_in = sim_mod
     raw_data, parity_type, expected_parity_error = data_and_parity_status
 
     expected_data = raw_data & ~(1 << 7)
+    ser = write_data([raw_data])
 
     def in_proc():
         if parity_type:
@@ -257,9 +247,10 @@ def test_parity(sim_mod, data_and_parity_status, take_proc, div_proc,
         else:
             parity = Parity.const({"enabled": 0})
 
+        yield ser.en.eq(1)
         yield from init(data_bits=NumDataBits.SEVEN, parity=parity)
 
-        yield from write_data(raw_data)
+        yield from wait_sent(ser, 1)
         yield stop_take.eq(0)
         for _ in range(3):
             yield
@@ -270,11 +261,13 @@ def test_parity(sim_mod, data_and_parity_status, take_proc, div_proc,
         if expected_parity_error is False:
             assert (yield shift_in.data == expected_data)
 
-    sim.run(sync_processes=[in_proc, div_proc, take_proc])
+    sim.run(sync_processes=[in_proc])
 
 
-@pytest.mark.module(ShiftIn())
+@pytest.mark.module.with_args(ShiftIn)
 @pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.trace("rx", "divider_tick", "shift_fsm.fsm_state", "status",
+                   trigger="status.frame", pre=2000, post=500)
 @pytest.mark.parametrize("test_glitch, rx_bit_period,tx_bit_period",
                          ((False, 375000, 375000 * 0.9),
                           (False, 375000, 375000 * 1.10),
@@ -282,19 +275,13 @@ def test_parity(sim_mod, data_and_parity_status, take_proc, div_proc,
                          # Will not cause a frame error.
                          # (True, 375000, 375000 * 1.10),),
                          indirect=["rx_bit_period", "tx_bit_period"])
-def test_frame(sim_mod, take_proc, div_proc, write_data, stop_take,
+def test_frame(sim_mod, take, div_gen, write_data, stop_take,
                test_glitch, init):
     sim, shift_in = sim_mod
-
-    def write_proc():
-        if test_glitch:
-            yield from write_data(0x55)
-        else:
-            yield Passive()
-            while True:
-                yield from write_data(0x55)
+    ser = write_data([0x55], loop=not test_glitch)
 
     def in_proc():
+        yield ser.en.eq(1)
         yield from init()
 
         yield stop_take.eq(0)
@@ -328,27 +315,33 @@ def test_frame(sim_mod, take_proc, div_proc, write_data, stop_take,
             if not test_glitch:
                 assert False
 
-    sim.run(sync_processes=[in_proc, div_proc, take_proc, write_proc])
+    sim.run(sync_processes=[in_proc])
 
 
-@pytest.mark.module(ShiftIn())
+@pytest.mark.module.with_args(ShiftIn)
 @pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.trace("rx", "divider_tick", "shift_fsm.fsm_state", "status",
+                   trigger="status.brk", pre=2000, post=500)
 @pytest.mark.parametrize("rx_bit_period,tx_bit_period",
                          ((375000, 375000),),
                          indirect=["rx_bit_period", "tx_bit_period"])
-def test_break(sim_mod, take_proc, div_proc, shift_bit, stop_take, init):
+def test_break(sim_mod, take, div_gen, write_data, stop_take, init):
     sim, shift_in = sim_mod
+    # START plus 9 zero bits is 10 bits of zeros, followed by STOP.
+    ser = write_data([0], num_bits=9)
 
     def in_proc():
+        yield ser.en.eq(1)
         yield from init()
 
-        for _ in range(10):
-            yield from shift_bit(0)
+        yield
+        while not (yield ser.tx):
+            yield
 
         assert (yield shift_in.status.ready == 0)
         assert (yield shift_in.status.brk == 0)
 
-        yield from shift_bit(1)
+        yield from wait_sent(ser, 1)
 
         assert (yield shift_in.status.ready == 1)
         assert (yield shift_in.status.brk == 1)
@@ -360,4 +353,197 @@ def test_break(sim_mod, take_proc, div_proc, shift_bit, stop_take, init):
         assert (yield shift_in.status.ready == 0)
         assert (yield shift_in.status.brk == 1)
 
-    sim.run(sync_processes=[in_proc, div_proc, take_proc])
+    sim.run(sync_processes=[in_proc])
+
+
+@pytest.mark.parametrize("oversample", (0, 2, 12))
+def test_bad_oversample(oversample):
+    with pytest.raises(ValueError):
+        ShiftIn(oversample)
+
+
+class Lockstep(Elaboratable):
+    """The unrolled ShiftInFSM, and a variant of it (e.g. compact), driven by
+       the same inputs."""
+    def __init__(self, oversample, **variant):
+        self.unrolled = ShiftIn(oversample, compact=False)
+        self.variant = ShiftIn(oversample, **variant)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.unrolled = self.unrolled
+        m.submodules.variant = self.variant
+
+        for port in ("rx", "num_data_bits", "parity", "divider_tick",
+                     "rd_data", "rd_status"):
+            m.d.comb += getattr(self.variant, port).eq(
+                getattr(self.unrolled, port))
+
+        return m
+
+
+@pytest.mark.module.with_args(Lockstep)
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("module_kwargs,seed",
+                         [({"oversample": o, **v}, s)
+                          for o in (16, 8, 4)
+                          for v in ({"compact": True}, {"pipelined": True},
+                                    {"compact": True, "pipelined": True})
+                          for s in range(2)])
+def test_fsm_lockstep(sim_mod, module_kwargs, seed, tick_gen):
+    """Both FSMs should produce identical outputs every cycle, for random
+       line activity (skewed frames, glitches, breaks) and settings."""
+    sim, lockstep = sim_mod
+    shift_in = lockstep.unrolled
+    tick_gen(shift_in.divider_tick, 32 // module_kwargs["oversample"])
+    rng = random.Random(seed)
+
+    def line_proc():
+        for _ in range(25):
+            yield shift_in.num_data_bits.eq(rng.choice(list(NumDataBits)))
+            yield shift_in.parity.eq(rng.choice(
+                [Parity.const({"enabled": 0})] +
+                [Parity.const({"enabled": 1, "kind": k.value})
+                 for k in ParityType]))
+
+            bit_period = int(32 * rng.uniform(0.9, 1.1))
+            for _ in range(rng.randrange(1, 14)):
+                bit = rng.random() < 0.5
+                if rng.random() < 0.1:
+                    # Glitch or break.
+                    length = rng.choice((1, 2, 10 * bit_period))
+                else:
+                    length = bit_period
+                yield shift_in.rx.eq(bit)
+                for _ in range(length):
+                    yield
+
+            yield shift_in.rx.eq(1)
+            for _ in range(rng.randrange(0, 4 * bit_period)):
+                yield
+
+    def check_proc():
+        yield Passive()
+        while True:
+            yield shift_in.rd_data.eq(rng.random() < 0.2)
+            yield shift_in.rd_status.eq(rng.random() < 0.05)
+            yield Settle()
+            assert (yield lockstep.unrolled.data) == \
+                (yield lockstep.variant.data)
+            assert (yield lockstep.unrolled.status.as_value()) == \
+                (yield lockstep.variant.status.as_value())
+            assert (yield lockstep.unrolled.shift_fsm.data_out) == \
+                (yield lockstep.variant.shift_fsm.data_out)
+            yield
+
+    sim.run(sync_processes=[line_proc, check_proc])
+
+
+@pytest.mark.module.with_args(ShiftIn)
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("parity,skew",
+                         [(None, 0.0), (ParityType.EVEN, 0.03),
+                          (ParityType.ONE, -0.03)])
+def test_reference_model(sim_mod, oversample, parity, skew, tick_gen,
+                         line_player):
+    """ShiftIn should receive exactly what the reference model decodes from
+       a random waveform with skew, parity errors, breaks and glitches, on
+       the same divider_tick."""
+    np = pytest.importorskip("numpy")
+    from uart import model
+
+    sim, shift_in = sim_mod
+    rng = np.random.default_rng(oversample)
+    data = rng.integers(0, 256, 40, dtype=np.uint8)
+    line = model.encode(data, oversample=oversample, skew=skew,
+                        parity=parity, idle_bits=rng.integers(0, 3, 40),
+                        breaks=rng.random(40) < 0.1,
+                        corrupt_parity=rng.random(40) < 0.2)
+    line = model.glitch(line, rng.integers(0, len(line), 12),
+                        width=rng.integers(1, oversample))
+    expected = model.decode(line, oversample=oversample, parity=parity)
+
+    tick = tick_gen(shift_in.divider_tick, 2).tick
+    player = line_player(shift_in.rx, tick, line.tolist())
+    sim.add_stimulus(connections=[
+        shift_in.rd_data.eq(shift_in.status.ready),
+        shift_in.rd_status.eq(shift_in.status.ready),
+    ])
+
+    received = []
+
+    def rx_proc():
+        yield shift_in.num_data_bits.eq(NumDataBits.EIGHT)
+        yield shift_in.parity.eq(Parity.const({
+            "enabled": parity is not None,
+            "kind": (parity or ParityType.ODD).value}))
+        while True:
+            addr = yield player.addr
+            if (yield shift_in.status.ready):
+                # addr has already moved on from the tick of wr_out.
+                received.append((addr - 1,
+                                 (yield shift_in.data),
+                                 (yield shift_in.status.parity),
+                                 (yield shift_in.status.frame),
+                                 (yield shift_in.status.brk)))
+            if addr == len(line):
+                break
+            yield
+
+    sim.run(sync_processes=[rx_proc])
+
+    assert received == [tuple(int(f) for f in frame) for frame in expected]
+
+
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("early",
+                         [pytest.param(e, marks=pytest.mark.module.with_args(ShiftIn, early=e))  # noqa: E501
+                          for e in (False, True)])
+def test_early_valid(sim_mod, oversample, early, tick_gen, frame_serializer,
+                     init):
+    """Benchmark: in early mode, each byte should be ready as soon as its
+       last data bit is shifted in, with a framing error reported
+       separately after the STOP bit. Measures START bit to ready latency
+       in clocks."""
+    sim, shift_in = sim_mod
+    tick_gen(shift_in.divider_tick, 1)
+    # A ninth data bit of 0 lands in the receiver's STOP bit.
+    words = [0x1a5, 0x05a]
+    ser = frame_serializer(shift_in.rx, words, bit_period=oversample,
+                           idle_bits=2)
+    frame_len = (1 + 9 + 1 + 2) * oversample
+    latencies = []
+    stops = []
+
+    def in_proc():
+        yield from init()
+        yield ser.num_bits.eq(9)
+        yield ser.en.eq(1)
+        yield shift_in.rd_data.eq(1)
+        yield shift_in.rd_status.eq(1)
+        # The START bit goes out on the cycle after en is set.
+        cycle = -1
+        while len(stops) < len(words) or len(latencies) < len(words):
+            yield Settle()
+            if (yield shift_in.status.ready):
+                latencies.append(cycle - len(latencies) * frame_len)
+                assert (yield shift_in.data) == words[len(latencies) - 1] & \
+                    0xff
+            if (yield shift_in.stop_valid):
+                stops.append((yield shift_in.shift_fsm.status.frame))
+            cycle += 1
+            yield
+
+    sim.run(sync_processes=[in_proc])
+
+    print(f"\n{oversample}x {'early' if early else 'normal'}: {latencies} "
+          "clocks from START to ready")
+    assert stops == [0, 1]
+    if early:
+        # Ready as the STOP bit starts (the START bit is sampled late at low
+        # oversampling ratios).
+        assert all(lat <= 9 * oversample + 1 for lat in latencies)
+    else:
+        # No sooner than the middle of the STOP bit.
+        assert all(lat >= 9 * oversample + oversample // 2
+                   for lat in latencies)
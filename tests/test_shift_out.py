@@ -1,10 +1,12 @@
 import pytest
 from amaranth import *
+from amaranth.sim import Settle
 
 from uart.core import *
+from uart.params import NumDataBits, NumStopBits, ParityType
 
 
-@pytest.mark.module(ShiftOut())
+@pytest.mark.module.with_args(ShiftOut)
 @pytest.mark.clks((1.0 / 12e6,))
 def test_shift_out(sim_mod):
     sim, shift_out = sim_mod
@@ -33,3 +35,86 @@ def test_shift_out(sim_mod):
         assert (yield shift_out.ready == 1)
 
     sim.run(sync_processes=[out_proc])
+
+
+@pytest.mark.module.with_args(ShiftOut)
+@pytest.mark.clks((1.0 / 12e6,))
+def test_back_to_back(sim_mod):
+    sim, shift_out = sim_mod
+
+    def out_proc():
+        def load(data):
+            yield shift_out.data.eq(data)
+            yield shift_out.valid.eq(1)
+            yield
+            yield shift_out.valid.eq(0)
+
+        yield from load(0xAA)
+        yield Settle()
+        frame = []
+        for _ in range(10):
+            frame.append((yield shift_out.out))
+            yield shift_out.shift.eq(1)
+            yield
+            yield shift_out.shift.eq(0)
+            yield Settle()
+
+            # The shift that ends the STOP bit can load the next frame.
+            if len(frame) == 10:
+                assert (yield shift_out.ready == 1)
+            else:
+                assert (yield shift_out.ready == 0)
+
+        assert frame == [0, 0, 1, 0, 1, 0, 1, 0, 1, 1]
+
+    sim.run(sync_processes=[out_proc])
+
+
+@pytest.mark.module.with_args(ShiftOut)
+@pytest.mark.clks((1.0 / 12e6,))
+@pytest.mark.parametrize("num_data_bits", list(NumDataBits))
+@pytest.mark.parametrize("parity", [None] + list(ParityType))
+@pytest.mark.parametrize("num_stop_bits", list(NumStopBits))
+def test_frame_format(sim_mod, num_data_bits, parity, num_stop_bits):
+    """Frames should match the reference model's in every format, back to
+       back."""
+    np = pytest.importorskip("numpy")
+    from uart import model
+
+    sim, shift_out = sim_mod
+    data = [0x00, 0xff, 0xa5, 0x3c, 0x81]
+    bits = model.frame_bits(data, num_data_bits=num_data_bits, parity=parity,
+                            num_stop_bits=num_stop_bits)
+
+    def out_proc():
+        yield shift_out.num_data_bits.eq(num_data_bits)
+        yield shift_out.parity.enabled.eq(parity is not None)
+        yield shift_out.parity.kind.eq(parity or 0)
+        yield shift_out.num_stop_bits.eq(num_stop_bits)
+        yield shift_out.valid.eq(1)
+        line = []
+        for b in data:
+            yield shift_out.data.eq(b)
+            yield Settle()
+            while not (yield shift_out.ready):
+                line.append((yield shift_out.out))
+                yield shift_out.shift.eq(1)
+                yield
+                yield shift_out.shift.eq(0)
+                yield
+                yield Settle()
+            yield
+        yield shift_out.valid.eq(0)
+        yield Settle()
+        while not (yield shift_out.ready):
+            line.append((yield shift_out.out))
+            yield shift_out.shift.eq(1)
+            yield
+            yield shift_out.shift.eq(0)
+            yield
+            yield Settle()
+        line.append((yield shift_out.out))
+
+        assert line[1:] == np.concatenate((bits.ravel(), [1])).tolist()
+
+    sim.run(sync_processes=[out_proc])
@@ -0,0 +1,79 @@
+from collections import deque
+
+from amaranth.sim import Passive
+from vcd import VCDWriter
+
+
+__all__ = ["Tracer"]
+
+
+class Tracer:
+    """Sample a few signals once per clock cycle, for writing a VCD of just
+       those signals rather than dumping every signal of the design.
+
+    ``signals`` maps names to the values to record. By default, every cycle
+    of the run is kept. If ``trigger`` is given, only the ``pre`` cycles
+    before it is first nonzero and the ``post`` cycles after are kept. If
+    ``ring`` is given, only the last ``ring`` cycles are kept (e.g. to see
+    what led up to a failing assertion).
+    """
+    def __init__(self, signals, *, trigger=None, pre=0, post=0, ring=None):
+        self.signals = dict(signals)
+        self.trigger = trigger
+        self.post = post
+        self.triggered_at = None
+
+        if ring is not None:
+            self.samples = deque(maxlen=ring)
+        elif trigger is not None:
+            self.samples = deque(maxlen=pre + 1)
+        else:
+            self.samples = deque()
+
+    def process(self):
+        """A sync process to add to the simulation."""
+        yield Passive()
+        cycle = 0
+        while True:
+            sample = []
+            for value in self.signals.values():
+                sample.append((yield value))
+            self.samples.append((cycle, sample))
+
+            if self.triggered_at is None and self.trigger is not None and \
+                    (yield self.trigger):
+                self.triggered_at = cycle
+                self.samples = deque(self.samples)
+            if self.triggered_at is not None and \
+                    cycle - self.triggered_at >= self.post:
+                return
+
+            yield
+            cycle += 1
+
+    def write_vcd(self, vcd_file, clk_period):
+        """Write the cycles kept to ``vcd_file``, with cycle ``n`` at ``n``
+           clock periods of ``clk_period`` seconds."""
+        period = int(round(clk_period * 1e12))
+        start = self.samples[0][0] * period if self.samples else 0
+        with open(vcd_file, "w") as fp, \
+                VCDWriter(fp, timescale="1 ps",
+                          init_timestamp=start) as writer:
+            vars = []
+            for (name, value) in self.signals.items():
+                decoder = getattr(value, "decoder", None)
+                if decoder is not None:
+                    var = writer.register_var("top", name, "string")
+                else:
+                    var = writer.register_var("top", name, "wire",
+                                              size=len(value))
+                vars.append((var, decoder))
+            if self.triggered_at is not None:
+                trigger = writer.register_var("top", "trigger", "event")
+
+            for (cycle, sample) in self.samples:
+                for ((var, decoder), v) in zip(vars, sample):
+                    writer.change(var, cycle * period,
+                                  decoder(v) if decoder else v)
+                if cycle == self.triggered_at:
+                    writer.change(trigger, cycle * period, True)
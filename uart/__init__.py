@@ -1,3 +1,4 @@
 # importlib will import __init__, so make sure everything we want to
 # export is visible here.
 from .core import Core  # noqa:F401
+from .bank import UartBank  # noqa:F401
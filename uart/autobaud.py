@@ -0,0 +1,156 @@
+from typing import Optional
+
+from amaranth import *
+
+
+def sync_span(sync_char: Optional[int]):
+    """
+    Return the number of bit periods from the START bit's falling edge to
+    the last falling edge of a frame of ``sync_char``, and the number of
+    falling edges after the first. With no ``sync_char``, only the START bit
+    is measured (a span of one bit, ending at a rising edge).
+    """
+    if sync_char is None:
+        return (1, 0)
+
+    if sync_char not in range(256):
+        raise ValueError(f"sync character must be a byte, not {sync_char}")
+    # START bit, data LSB first, STOP bit.
+    bits = [0] + [(sync_char >> i) & 1 for i in range(8)] + [1]
+    falls = [i for i in range(1, len(bits)) if bits[i - 1] and not bits[i]]
+    if not falls or falls[-1] & (falls[-1] - 1):
+        raise ValueError(f"sync character {sync_char:#04x} must have falling "
+                         "edges a power of two bit periods apart (e.g. "
+                         "0x55 or 0x7f)")
+
+    return (falls[-1], len(falls))
+
+
+class AutoBaud(Elaboratable):
+    """
+    Measure the baud rate of ``rx`` in clock cycles, and derive a ``BaudGen``
+    divisor for ``oversample`` ticks per bit with ``frac_bits`` fractional
+    bits.
+
+    With a ``sync_char`` (e.g. 0x55 or 0x7f), the time from the START bit
+    to the last falling edge of the character is measured, a power of two
+    bit periods (8 for 0x55 and 0x7f), which averages out edge jitter and
+    skew between the bits. Without one, only the START bit is measured, so
+    the first character must have its LSB set, and the line must then be
+    idle for ten bit periods.
+
+    ``locked`` asserts once a rate has been measured, when the rest of the
+    character has been received (so a receiver switching to ``divisor``
+    then will see an idle line), and holds ``divisor`` until ``hunt``
+    starts another measurement. Measurements too fast or too slow for a
+    16-bit divisor are discarded. ``rx`` must already be synchronized to
+    our clock.
+    """
+    def __init__(self, oversample: int = 16, frac_bits: int = 0,
+                 sync_char: Optional[int] = 0x55):
+        (self.span, self.num_falls) = sync_span(sync_char)
+        self.oversample = oversample
+        self.frac_bits = frac_bits
+        self.sync_char = sync_char
+
+        self.rx = Signal(1, reset=1)
+        self.hunt = Signal(1)
+        self.locked = Signal(1)
+        self.divisor = Signal(16 + frac_bits)
+
+    def elaborate(self, platform):
+        # Clocks per span, to divisor: divide by oversample * span, both
+        # powers of two, keeping frac_bits.
+        shift = (self.oversample * self.span).bit_length() - 1 - \
+            self.frac_bits
+        # Wide enough for any 16-bit divisor.
+        count = Signal(16 + self.frac_bits + shift)
+        falls = Signal(range(self.num_falls + 1))
+        # With a carry out, to catch rounding up to 2**16.
+        measured = Signal(len(self.divisor) + 1)
+        # Enough for ten measured bit periods.
+        idle = Signal(len(count) + 4)
+        rx_prev = Signal(1, reset=1)
+        fell = Signal(1)
+        rose = Signal(1)
+
+        ###
+
+        m = Module()
+
+        m.d.sync += rx_prev.eq(self.rx)
+        m.d.comb += [
+            fell.eq(rx_prev & ~self.rx),
+            rose.eq(~rx_prev & self.rx),
+        ]
+
+        # Round to nearest.
+        if shift > 0:
+            m.d.comb += measured.eq((count + (1 << (shift - 1))) >> shift)
+        else:
+            m.d.comb += measured.eq(count << -shift)
+
+        with m.FSM():
+            # Measure from a falling edge, not from the line already being
+            # low.
+            with m.State("WAIT-IDLE"):
+                with m.If(self.rx):
+                    m.next = "HUNT"
+
+            with m.State("HUNT"):
+                m.d.sync += [
+                    count.eq(1),
+                    falls.eq(self.num_falls),
+                ]
+                with m.If(fell):
+                    m.next = "MEASURE"
+
+            with m.State("MEASURE"):
+                m.d.sync += count.eq(count + 1)
+
+                if self.num_falls:
+                    end = fell & (falls == 1)
+                    with m.If(fell):
+                        m.d.sync += falls.eq(falls - 1)
+                else:
+                    end = rose
+
+                with m.If(count == 2**len(count) - 1):
+                    # Too slow (or a break).
+                    m.next = "WAIT-IDLE"
+                with m.Elif(end):
+                    # Too fast (e.g. a glitch) or too slow?
+                    with m.If((measured < (1 << self.frac_bits)) |
+                              measured[-1]):
+                        m.next = "WAIT-IDLE"
+                    with m.Else():
+                        m.d.sync += [
+                            self.divisor.eq(measured),
+                            idle.eq(0),
+                        ]
+                        m.next = "SETTLE"
+
+            # Wait for the end of the character.
+            with m.State("SETTLE"):
+                if self.num_falls:
+                    # There are no falling edges after the last one, so the
+                    # line stays high after the next rising edge.
+                    with m.If(self.rx):
+                        m.d.sync += self.locked.eq(1)
+                        m.next = "LOCKED"
+                else:
+                    # There may be more START-like zero bits in the data.
+                    with m.If(~self.rx):
+                        m.d.sync += idle.eq(0)
+                    with m.Elif(idle == (count << 3) + (count << 1)):
+                        m.d.sync += self.locked.eq(1)
+                        m.next = "LOCKED"
+                    with m.Else():
+                        m.d.sync += idle.eq(idle + 1)
+
+            with m.State("LOCKED"):
+                with m.If(self.hunt):
+                    m.d.sync += self.locked.eq(0)
+                    m.next = "WAIT-IDLE"
+
+        return m
@@ -0,0 +1,152 @@
+from .params import RxErrors
+from .baud import BaudGen
+from .core import Channel
+
+from typing import Optional, Sequence, Union
+
+from amaranth import *
+
+
+class UartBank(Elaboratable):
+    """
+    ``num_channels`` UARTs behind a single pair of AXI-stream interfaces.
+
+    The channels share a small number of baud rate generators, one per entry
+    of ``divisors`` (a ``None`` entry creates a runtime ``divisors[i]``
+    port). ``baud_sel`` gives the generator each channel runs from, and
+    defaults to the first for all channels. Each channel otherwise has the
+    datapath of a ``Core``, configured with the remaining parameters.
+
+    ``tx``, ``rx`` and ``brk`` have one bit per channel. A byte on the TX
+    stream is sent on channel ``tx_tdest``. Bytes received on any channel are
+    presented on the RX stream with their channel in ``rx_tdest``; channels
+    with data take turns (round robin), so a busy channel cannot starve the
+    others. ``rx_tuser`` has the byte's ``RxErrors``. ``rx_irq`` has each
+    channel's receive interrupt (see ``Core``), all with the same
+    ``rx_trigger_level``.
+    """
+    def __init__(self, num_channels: int,
+                 divisors: Sequence[Optional[Union[int, float]]] = (None,),
+                 *, baud_sel: Optional[Sequence[int]] = None,
+                 oversample: int = 16, frac_bits: int = 0,
+                 compact_fsm: bool = False,
+                 rx_fifo_depth: int = 16, tx_fifo_depth: int = 16,
+                 rx_trigger_level: int = 1, rx_char_timeout: int = 40):
+        if num_channels < 1:
+            raise ValueError("UartBank must have at least one channel, not "
+                             f"{num_channels}")
+        if not divisors:
+            raise ValueError("UartBank must have at least one baud rate "
+                             "generator")
+        if baud_sel is None:
+            baud_sel = (0,) * num_channels
+        if len(baud_sel) != num_channels:
+            raise ValueError(f"baud_sel has {len(baud_sel)} entries for "
+                             f"{num_channels} channels")
+        for sel in baud_sel:
+            if sel not in range(len(divisors)):
+                raise ValueError(f"baud_sel entry {sel} does not select one "
+                                 f"of {len(divisors)} baud rate generators")
+        if rx_trigger_level not in range(1, max(rx_fifo_depth, 1) + 1):
+            raise ValueError(f"rx_trigger_level must be from 1 to the RX "
+                             f"FIFO depth, not {rx_trigger_level}")
+
+        self.num_channels = num_channels
+        self.baud_sel = tuple(baud_sel)
+        self.rx_trigger_level = rx_trigger_level
+
+        self.tx = Signal(num_channels)
+        self.rx = Signal(num_channels, reset=(1 << num_channels) - 1)
+        self.brk = Signal(num_channels)
+        self.rx_irq = Signal(num_channels)
+
+        self.tx_tvalid = Signal(1)
+        self.tx_tready = Signal(1)
+        self.tx_tdata = Signal(8)
+        self.tx_tdest = Signal(range(num_channels))
+
+        self.rx_tvalid = Signal(1)
+        self.rx_tready = Signal(1)
+        self.rx_tdata = Signal(8)
+        self.rx_tuser = Signal(RxErrors)
+        self.rx_tdest = Signal(range(num_channels))
+
+        self.divisors = []
+        for divisor in divisors:
+            if divisor:
+                self.divisors.append(C(round(divisor * (1 << frac_bits)),
+                                       16 + frac_bits))
+            else:
+                self.divisors.append(Signal(16 + frac_bits))
+
+        self.bauds = [BaudGen(oversample, frac_bits) for _ in divisors]
+        self.channels = [Channel(oversample=oversample,
+                                 compact_fsm=compact_fsm,
+                                 rx_fifo_depth=rx_fifo_depth,
+                                 tx_fifo_depth=tx_fifo_depth,
+                                 rx_char_timeout=rx_char_timeout)
+                         for _ in range(num_channels)]
+
+    # Top-level ports of a standalone UartBank, e.g. for conversion to
+    # Verilog.
+    def ports(self):
+        ios = [self.tx, self.rx, self.brk, self.rx_irq,
+               self.tx_tvalid, self.tx_tready,
+               self.tx_tdata, self.tx_tdest, self.rx_tvalid, self.rx_tready,
+               self.rx_tdata, self.rx_tuser.as_value(), self.rx_tdest]
+        ios += [d for d in self.divisors if isinstance(d, Signal)]
+
+        return ios
+
+    def elaborate(self, platform):
+        rx_valid = Cat(ch.rx_tvalid for ch in self.channels)
+        rx_data = Array(ch.rx_tdata for ch in self.channels)
+        rx_user = Array(ch.rx_tuser for ch in self.channels)
+        tx_ready = Array(ch.tx_tready for ch in self.channels)
+
+        ###
+
+        m = Module()
+
+        for (i, (baud, divisor)) in enumerate(zip(self.bauds, self.divisors)):
+            m.submodules[f"baud_{i}"] = baud
+            m.d.comb += baud.divisor.eq(divisor)
+
+        for (i, (ch, sel)) in enumerate(zip(self.channels, self.baud_sel)):
+            m.submodules[f"channel_{i}"] = ch
+            m.d.comb += [
+                ch.tick.eq(self.bauds[sel].tick),
+                ch.tx_strobe.eq(self.bauds[sel].tx_strobe),
+                ch.rx.eq(self.rx[i]),
+                self.tx[i].eq(ch.tx),
+                self.brk[i].eq(ch.brk),
+                self.rx_irq[i].eq(ch.rx_irq),
+                ch.rx_trigger_level.eq(self.rx_trigger_level),
+
+                ch.tx_tdata.eq(self.tx_tdata),
+                ch.tx_tvalid.eq(self.tx_tvalid & (self.tx_tdest == i)),
+                ch.rx_tready.eq(self.rx_tready & (self.rx_tdest == i)),
+            ]
+
+        m.d.comb += [
+            self.tx_tready.eq(tx_ready[self.tx_tdest]),
+            self.rx_tvalid.eq(rx_valid.bit_select(self.rx_tdest, 1)),
+            self.rx_tdata.eq(rx_data[self.rx_tdest]),
+            self.rx_tuser.eq(rx_user[self.rx_tdest]),
+        ]
+
+        # RX arbiter- stay on a channel until its byte is taken, then move
+        # to the next channel after it with data. The channel (and so
+        # rx_tdata) only changes when no byte is being offered, as AXI-stream
+        # requires.
+        with m.If(~self.rx_tvalid | self.rx_tready):
+            with m.Switch(self.rx_tdest):
+                for curr in range(self.num_channels):
+                    with m.Case(curr):
+                        # Highest priority last, so it wins.
+                        for offset in reversed(range(1, self.num_channels)):
+                            nxt = (curr + offset) % self.num_channels
+                            with m.If(rx_valid[nxt]):
+                                m.d.sync += self.rx_tdest.eq(nxt)
+
+        return m
@@ -0,0 +1,60 @@
+from amaranth import *
+
+
+class BaudGen(Elaboratable):
+    """
+    Baud rate timing generator shared by the receiver and transmitter.
+
+    ``tick`` asserts once every ``divisor`` clock cycles, and is meant to
+    drive ``ShiftIn.divider_tick`` (``oversample`` times the baud rate).
+    ``tx_strobe`` asserts once every ``oversample`` ``tick``s (at the baud
+    rate), coincident with a ``tick``, and is meant to drive
+    ``ShiftOut.shift``.
+
+    A ``divisor`` of 0 behaves like a divisor of 65536.
+
+    If ``frac_bits`` is nonzero, ``divisor`` is a fixed-point number with
+    ``frac_bits`` fractional bits (see ``params.calc_divisor``). The
+    fractional part is added to a phase accumulator every ``tick``; each
+    carry out lengthens the next ``tick`` period by one clock, so the
+    average period is exactly ``divisor / 2**frac_bits`` clocks.
+    """
+    def __init__(self, oversample: int = 16, frac_bits: int = 0):
+        self.oversample = oversample
+        self.frac_bits = frac_bits
+        self.divisor = Signal(16 + frac_bits)
+
+        self.tick = Signal(1)
+        self.tx_strobe = Signal(1)
+
+    def elaborate(self, platform):
+        int_part = self.divisor[self.frac_bits:]
+        frac_part = self.divisor[:self.frac_bits]
+        count = Signal(16)
+        phase = Signal(self.frac_bits)
+        phase_next = Signal(self.frac_bits + 1)
+        prescale = Signal(range(self.oversample))
+
+        ###
+
+        m = Module()
+
+        m.d.comb += phase_next.eq(phase + frac_part)
+
+        # A divide-by-n counter requires n - 1 ticks per period.
+        with m.If(count == 0):
+            m.d.comb += self.tick.eq(1)
+            m.d.sync += [
+                count.eq(int_part - 1 + phase_next[-1]),
+                phase.eq(phase_next[:self.frac_bits]),
+            ]
+        with m.Else():
+            m.d.sync += count.eq(count - 1)
+
+        with m.If(self.tick):
+            m.d.sync += prescale.eq(prescale + 1)
+
+        m.d.comb += self.tx_strobe.eq(self.tick &
+                                      (prescale == self.oversample - 1))
+
+        return m
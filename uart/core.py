@@ -1,83 +1,704 @@
 from .params import *
+from .autobaud import AutoBaud
+from .baud import BaudGen
+from .fifo import Fifo
+from .gearbox import STREAM_WIDTHS, Packer, Unpacker
+from .rx import ShiftIn
+from .stats import Stats
 
-from typing import Optional
+from typing import Optional, Union
 
 from amaranth import *
+from amaranth.lib.cdc import FFSynchronizer, PulseSynchronizer
 
 
 class ShiftOut(Elaboratable):
+    """
+    Transmitter, sending each byte of ``data`` as a frame of
+    ``num_data_bits`` data bits (LSB first), a ``parity`` bit if enabled,
+    and ``num_stop_bits`` STOP bits, a bit per ``shift``. The frame format
+    defaults to 8N1, and is taken with each byte.
+    """
     def __init__(self):
-        self._view = Signal(BackingStore, reset={"start": 1})
+        # START, 8 data bits, parity and 2 STOP bits. Shifting in ones leaves
+        # the line idle.
+        self._shreg = Signal(12, reset=(1 << 12) - 1)
         self.out = Signal(1)
         self.shift = Signal(1)
 
+        self.num_data_bits = Signal(NumDataBits, reset=NumDataBits.EIGHT)
+        self.parity = Signal(Parity)
+        self.num_stop_bits = Signal(NumStopBits)
+
         # AXI stream interface
         self.valid = Signal(1)
         self.ready = Signal(1)
-        self.data = Signal.like(self._view.payload)
+        self.data = Signal(8)
+
+    def ports(self):
+        return [self.out, self.shift, self.valid, self.ready, self.data,
+                self.num_data_bits, self.parity.as_value(),
+                self.num_stop_bits]
 
     def elaborate(self, platform):
-        shreg_len = len(Value.cast(self._view))
-        count = Signal(range(shreg_len))
+        shreg = self._shreg
+        count = Signal(range(len(shreg) + 1))
+        frame = Signal.like(shreg)
+        frame_len = Signal.like(count)
+        data_ones = Signal(1)
+        parity_bit = Signal(1)
 
         ###
 
         m = Module()
 
-        m.d.comb += self.out.eq(self._view.as_value()[0])
+        m.d.comb += self.out.eq(shreg[0])
+
+        with m.Switch(self.parity.kind):
+            with m.Case(ParityType.ODD):
+                m.d.comb += parity_bit.eq(~data_ones)
+            with m.Case(ParityType.EVEN):
+                m.d.comb += parity_bit.eq(data_ones)
+            with m.Case(ParityType.ONE):
+                m.d.comb += parity_bit.eq(1)
+
+        # Pad each format out with ones, which double as the second STOP
+        # bit.
+        def ones(width):
+            return C((1 << width) - 1, width)
+
+        with m.Switch(self.num_data_bits):
+            for bits in NumDataBits:
+                nd = bits.value + 5
+                with m.Case(bits):
+                    m.d.comb += data_ones.eq(self.data[:nd].xor())
+                    with m.If(self.parity.enabled):
+                        m.d.comb += [
+                            frame.eq(Cat(C(0, 1), self.data[:nd], parity_bit,
+                                         ones(len(shreg) - nd - 2))),
+                            frame_len.eq(nd + 3 + self.num_stop_bits),
+                        ]
+                    with m.Else():
+                        m.d.comb += [
+                            frame.eq(Cat(C(0, 1), self.data[:nd],
+                                         ones(len(shreg) - nd - 1))),
+                            frame_len.eq(nd + 2 + self.num_stop_bits),
+                        ]
 
         with m.If(count == 0):
             m.d.comb += self.ready.eq(1)
         with m.Elif(self.shift):
+            # The STOP bit ends with this shift, so the next frame's START
+            # bit can follow it without any idle time.
+            with m.If(count == 1):
+                m.d.comb += self.ready.eq(1)
+
             m.d.sync += [
-                self._view.as_value()[0:-1].eq(self._view.as_value()[1:]),
+                shreg[0:-1].eq(shreg[1:]),
                 count.eq(count - 1)
             ]
 
         with m.If(self.valid & self.ready):
             m.d.sync += [
-                self._view.start.eq(0),
-                self._view.payload.eq(self.data),
-                self._view.stop.eq(1),
-                count.eq(shreg_len)
+                shreg.eq(frame),
+                count.eq(frame_len)
             ]
 
         return m
 
 
-# Core we want to share with the world. Must be visible in __init__.py due
-# to importlib limitations.
-class Core(Elaboratable):
-    def __init__(self, divisor: Optional[int] = None):
-        self.out = Signal(1)
+class Channel(Elaboratable):
+    """
+    Receive and transmit datapath of one UART, with AXI-stream TX and RX
+    interfaces, timed by an external ``BaudGen``: ``tick`` drives the
+    receiver and ``tx_strobe`` the transmitter. ``rx_sync`` is ``rx``
+    synchronized to our clock; while ``rx_enable`` is clear, the receiver
+    sees an idle line instead.
+
+    The serial side (and ``tick``, ``tx_strobe``, ``rx_sync`` and
+    ``rx_enable``) runs in ``line_domain``, and the streams and status in
+    ``sync``. See ``Core`` for the other parameters and ports.
+    """
+    def __init__(self, *, oversample: int = 16, compact_fsm: bool = False,
+                 rx_fifo_depth: int = 16, tx_fifo_depth: int = 16,
+                 stream_width: int = 8, rx_idle_timeout: int = 20,
+                 rx_char_timeout: int = 40, flow_control: bool = False,
+                 early_valid: bool = False, line_domain: str = "sync",
+                 pipelined_fsm: bool = False, stats: bool = False):
+        self.line_domain = line_domain
+        self.tick = Signal(1)
+        self.tx_strobe = Signal(1)
 
         self.tx = Signal(1)
-        self.rx = Signal(1)
+        self.rx = Signal(1, reset=1)
         self.brk = Signal(1)
+        self.rx_sync = Signal(1, reset=1)
+        self.rx_enable = Signal(1, reset=1)
+        self.rx_frame_error = Signal(1)
+
+        lanes = stream_width // 8
+        self.stream_width = stream_width
+        self.rx_idle_timeout = rx_idle_timeout
 
         self.tx_tvalid = Signal(1)
         self.tx_tready = Signal(1)
-        self.tx_tdata = Signal(8)
+        self.tx_tdata = Signal(stream_width)
+        self.tx_tkeep = Signal(lanes, reset=(1 << lanes) - 1)
 
         self.rx_tvalid = Signal(1)
         self.rx_tready = Signal(1)
-        self.rx_tdata = Signal(8)
+        self.rx_tdata = Signal(stream_width)
+        self.rx_tuser = Signal(Shape.cast(RxErrors).width * lanes)
+        self.rx_tkeep = Signal(lanes)
+        self.rx_tlast = Signal(1)
 
-        if divisor:
-            self.divisor = C(divisor, 16)
+        # Without a FIFO, ShiftIn holds one byte.
+        self.rx_fifo_depth = rx_fifo_depth
+        self.rx_level = Signal(range(max(rx_fifo_depth, 1) + 1))
+        self.rx_almost_full = Signal(1)
+        self.rx_almost_empty = Signal(1)
+
+        self.rx_char_timeout = rx_char_timeout
+        self.rx_trigger_level = Signal.like(self.rx_level)
+        self.rx_irq = Signal(1)
+        self.rx_irq_timeout = Signal(1)
+
+        self.flow_control = flow_control
+        self.rts_level = Signal.like(self.rx_level)
+        self.rts_n = Signal(1)
+        self.cts_n = Signal(1)
+
+        self.stats = Signal(LinkStats)
+        self.stats_clear = Signal(1)
+
+        self.shift_in = ShiftIn(oversample, compact_fsm, early_valid,
+                                pipelined_fsm)
+        self.shift_out = ShiftOut()
+        if rx_fifo_depth:
+            self.rx_fifo = Fifo(width=8 + Shape.cast(RxErrors).width,
+                                depth=rx_fifo_depth, w_domain=line_domain)
         else:
-            self.divisor = Signal(16)
-        self.counter = Signal(range(12000000))
+            self.rx_fifo = None
+        if tx_fifo_depth:
+            self.tx_fifo = Fifo(width=8, depth=tx_fifo_depth,
+                                r_domain=line_domain)
+        else:
+            self.tx_fifo = None
+        if stream_width > 8:
+            self.packer = Packer(stream_width,
+                                 user_width=Shape.cast(RxErrors).width)
+            self.unpacker = Unpacker(stream_width)
+        else:
+            self.packer = None
+            self.unpacker = None
+        self.counters = Stats() if stats else None
 
     def elaborate(self, platform):
+        # Byte-wide streams between the FIFOs and the gearbox.
+        rx_valid = Signal(1)
+        rx_ready = Signal(1)
+        rx_data = Signal(8)
+        rx_errors = Signal(RxErrors)
+        tx_valid = Signal(1)
+        tx_ready = Signal(1)
+        tx_data = Signal(8)
+        char_idle = Signal(range(self.rx_char_timeout + 1))
+        rx_irq_level = Signal(1)
+        cts_sync_n = Signal(1)
+        tx_go = Signal(1)
+        frame_error = Signal(1)
+        rx_read = Signal(1)
+        ld = self.line_domain
+        cdc = ld != "sync"
 
         ###
 
         m = Module()
 
+        # Bring a line_domain level to sync. Only registers may cross, so
+        # that the synchronizer never sees a glitch.
+        def to_sync(name, value):
+            if not cdc:
+                return value
+            reg = Signal(1, name=f"{name}_{ld}")
+            synced = Signal(1, name=name)
+            m.d[ld] += reg.eq(value)
+            m.submodules[f"{name}_cdc"] = FFSynchronizer(reg, synced)
+            return synced
+
+        # Bring a line_domain pulse to sync.
+        def pulse_to_sync(name, value):
+            if not cdc:
+                return value
+            m.submodules[f"{name}_cdc"] = sync = \
+                PulseSynchronizer(i_domain=ld, o_domain="sync")
+            m.d.comb += sync.i.eq(value)
+            return sync.o
+
+        if cdc:
+            m.submodules.shift_in = DomainRenamer(ld)(self.shift_in)
+            m.submodules.shift_out = DomainRenamer(ld)(self.shift_out)
+        else:
+            m.submodules.shift_in = self.shift_in
+            m.submodules.shift_out = self.shift_out
+
+        # RX path- rx is asynchronous to our clock.
+        m.submodules.rx_sync = FFSynchronizer(self.rx, self.rx_sync,
+                                              o_domain=ld, reset=1)
+
+        m.d.comb += [
+            self.shift_in.rx.eq(self.rx_sync | ~self.rx_enable),
+            self.shift_in.divider_tick.eq(self.tick),
+            self.shift_in.num_data_bits.eq(NumDataBits.EIGHT),
+            self.shift_in.parity.eq(Parity.const({"enabled": 0})),
+            self.brk.eq(to_sync("brk", self.shift_in.status.brk)),
+        ]
+
+        # In early mode, bytes have already been passed on by the time their
+        # STOP bit is sampled.
+        m.d.comb += frame_error.eq(self.shift_in.stop_valid &
+                                   (self.shift_in.shift_fsm.status.frame |
+                                    self.shift_in.shift_fsm.status.brk))
+        if cdc:
+            m.submodules.frame_error_cdc = frame_error_cdc = \
+                PulseSynchronizer(i_domain=ld, o_domain="sync")
+            m.d.comb += [
+                frame_error_cdc.i.eq(frame_error),
+                self.rx_frame_error.eq(frame_error_cdc.o),
+            ]
+        else:
+            m.d.sync += self.rx_frame_error.eq(frame_error)
+
+        if self.rx_fifo:
+            m.submodules.rx_fifo = self.rx_fifo
+
+            # Drain ShiftIn into the FIFO as soon as a byte is ready, so that
+            # ShiftIn only overruns if the FIFO is full.
+            m.d.comb += [
+                self.rx_fifo.w_data.eq(Cat(self.shift_in.data,
+                                           self.shift_in.errors)),
+                self.rx_fifo.w_en.eq(self.shift_in.status.ready),
+                self.shift_in.rd_data.eq(self.rx_fifo.w_en &
+                                         self.rx_fifo.w_rdy),
+
+                rx_valid.eq(self.rx_fifo.r_rdy),
+                Cat(rx_data, rx_errors).eq(self.rx_fifo.r_data),
+                self.rx_fifo.r_en.eq(rx_ready),
+
+                self.rx_level.eq(self.rx_fifo.level),
+                self.rx_almost_full.eq(self.rx_fifo.almost_full),
+                self.rx_almost_empty.eq(self.rx_fifo.almost_empty),
+            ]
+        else:
+            m.d.comb += [
+                rx_valid.eq(self.shift_in.status.ready),
+                rx_data.eq(self.shift_in.data),
+                rx_errors.eq(self.shift_in.errors),
+                self.shift_in.rd_data.eq(rx_valid & rx_ready),
+
+                self.rx_level.eq(self.shift_in.status.ready),
+                self.rx_almost_full.eq(self.shift_in.status.ready),
+                self.rx_almost_empty.eq(~self.shift_in.status.ready),
+            ]
+
+        if self.packer:
+            idle_bits = Signal(range(self.rx_idle_timeout + 1))
+
+            # Pack bytes into wider beats, and end a burst (with tlast) when
+            # the line has been idle for rx_idle_timeout bit periods.
+            m.submodules.packer = self.packer
+            with m.If(self.shift_in.status.ready):
+                m.d[ld] += idle_bits.eq(0)
+            with m.Elif(self.tx_strobe &
+                        (idle_bits != self.rx_idle_timeout)):
+                m.d[ld] += idle_bits.eq(idle_bits + 1)
+
+            m.d.comb += [
+                self.packer.i_data.eq(rx_data),
+                self.packer.i_user.eq(rx_errors),
+                self.packer.i_valid.eq(rx_valid),
+                rx_ready.eq(self.packer.i_ready),
+                self.packer.flush.eq(
+                    to_sync("line_idle", idle_bits == self.rx_idle_timeout)),
+
+                self.rx_tdata.eq(self.packer.tdata),
+                self.rx_tuser.eq(self.packer.tuser),
+                self.rx_tkeep.eq(self.packer.tkeep),
+                self.rx_tlast.eq(self.packer.tlast),
+                self.rx_tvalid.eq(self.packer.tvalid),
+                self.packer.tready.eq(self.rx_tready),
+            ]
+        else:
+            m.d.comb += [
+                self.rx_tdata.eq(rx_data),
+                self.rx_tuser.eq(rx_errors),
+                self.rx_tkeep.eq(1),
+                self.rx_tvalid.eq(rx_valid),
+                rx_ready.eq(self.rx_tready),
+            ]
+
+        # RX interrupt, as in a 16550: when rx_trigger_level bytes are
+        # buffered, or when fewer bytes have been waiting for
+        # rx_char_timeout bit periods without any being received or read.
+        # Across clock domains, reads are seen as the RX FIFO's level going
+        # down on the line side.
+        if cdc:
+            w_level_prev = Signal.like(self.rx_fifo.w_level)
+            m.d[ld] += w_level_prev.eq(self.rx_fifo.w_level)
+            m.d.comb += rx_read.eq(self.rx_fifo.w_level < w_level_prev)
+        else:
+            m.d.comb += rx_read.eq(rx_valid & rx_ready)
+
+        with m.If(self.shift_in.status.ready | rx_read):
+            m.d[ld] += char_idle.eq(0)
+        with m.Elif(self.tx_strobe & (char_idle != self.rx_char_timeout)):
+            m.d[ld] += char_idle.eq(char_idle + 1)
+
+        m.d.comb += [
+            rx_irq_level.eq(self.rx_level >= self.rx_trigger_level),
+            self.rx_irq_timeout.eq(
+                (self.rx_level != 0) & ~rx_irq_level &
+                to_sync("char_timeout", char_idle == self.rx_char_timeout)),
+            self.rx_irq.eq(rx_irq_level | self.rx_irq_timeout),
+        ]
+
+        # Flow control- ask the far end to stop once rts_level bytes are
+        # buffered. cts_n is asynchronous to our clock, and only holds off
+        # the next frame, as ShiftOut only takes a byte between frames.
+        if self.flow_control:
+            m.submodules.cts_sync = FFSynchronizer(self.cts_n, cts_sync_n,
+                                                   o_domain=ld)
+            m.d.comb += self.rts_n.eq(self.rx_fifo.w_level >= self.rts_level)
+
+        # TX path- only accept a new frame on a bit boundary, so that the
+        # START bit lasts a full bit period.
+        m.d.comb += [
+            self.tx.eq(self.shift_out.out),
+            self.shift_out.shift.eq(self.tx_strobe),
+            tx_go.eq(self.tx_strobe & ~cts_sync_n),
+        ]
+
+        if self.tx_fifo:
+            m.submodules.tx_fifo = self.tx_fifo
+
+            # The FIFO is first-word-fallthrough, so the next frame is
+            # already staged at its output when the STOP bit ends.
+            m.d.comb += [
+                self.tx_fifo.w_data.eq(tx_data),
+                self.tx_fifo.w_en.eq(tx_valid),
+                tx_ready.eq(self.tx_fifo.w_rdy),
+
+                self.shift_out.data.eq(self.tx_fifo.r_data),
+                self.shift_out.valid.eq(self.tx_fifo.r_rdy & tx_go),
+                self.tx_fifo.r_en.eq(self.shift_out.ready & tx_go),
+            ]
+        else:
+            m.d.comb += [
+                self.shift_out.data.eq(tx_data),
+                self.shift_out.valid.eq(tx_valid & tx_go),
+                tx_ready.eq(self.shift_out.ready & tx_go),
+            ]
+
+        if self.unpacker:
+            m.submodules.unpacker = self.unpacker
+            m.d.comb += [
+                self.unpacker.tdata.eq(self.tx_tdata),
+                self.unpacker.tkeep.eq(self.tx_tkeep),
+                self.unpacker.tvalid.eq(self.tx_tvalid),
+                self.tx_tready.eq(self.unpacker.tready),
+
+                tx_data.eq(self.unpacker.o_data),
+                tx_valid.eq(self.unpacker.o_valid),
+                self.unpacker.o_ready.eq(tx_ready),
+            ]
+        else:
+            m.d.comb += [
+                tx_data.eq(self.tx_tdata),
+                tx_valid.eq(self.tx_tvalid),
+                self.tx_tready.eq(tx_ready),
+            ]
+
+        # Link statistics, counted in sync. A frame is counted once its STOP
+        # bit has been sampled, whether or not it was good.
+        if self.counters:
+            m.submodules.counters = self.counters
+
+            fsm_status = self.shift_in.shift_fsm.status
+            stop_valid = self.shift_in.stop_valid
+            events = {
+                "rx_frames": stop_valid,
+                "tx_frames": self.shift_out.valid & self.shift_out.ready,
+                "overrun": self.shift_in.lost,
+                "parity": stop_valid & fsm_status.parity,
+                "frame": stop_valid & fsm_status.frame,
+                "brk": stop_valid & fsm_status.brk,
+                "glitch": self.shift_in.glitch,
+            }
+            for (name, event) in events.items():
+                m.d.comb += getattr(self.counters, name).eq(
+                    pulse_to_sync(f"stats_{name}", event))
+
+            m.d.comb += [
+                self.counters.rx_level.eq(self.rx_level),
+                self.counters.clear.eq(self.stats_clear),
+                self.stats.eq(self.counters.stats),
+            ]
+            if self.tx_fifo:
+                m.d.comb += self.counters.tx_level.eq(self.tx_fifo.w_level)
+
+        return m
+
+
+# Core we want to share with the world. Must be visible in __init__.py due
+# to importlib limitations.
+class Core(Elaboratable):
+    """
+    UART with AXI-stream TX and RX interfaces.
+
+    The receiver samples ``rx`` ``oversample`` times per bit, so the baud rate
+    is ``clk_rate / (oversample * divisor)``. Lower oversampling ratios allow
+    higher baud rates for a given clock, at the cost of tolerance to skew.
+    ``compact_fsm`` selects the smaller counter-based receiver FSM, and
+    ``pipelined_fsm`` one with registered sample and shift points (see
+    ``ShiftInFSM``).
+
+    If ``frac_bits`` is nonzero, the divisor has ``frac_bits`` fractional
+    bits, and a constant ``divisor`` may be given as a ``float``. The runtime
+    ``divisor`` port is then a raw fixed-point value (see
+    ``params.calc_divisor``).
+
+    Received bytes are buffered in a FIFO of ``rx_fifo_depth`` entries
+    (0 disables the FIFO) before being presented on ``rx_t*``. ``rx_level``
+    is the number of buffered bytes, and ``rx_almost_full``/``rx_almost_empty``
+    compare it against watermarks (see ``Fifo``).
+
+    Bytes to transmit are buffered in a FIFO of ``tx_fifo_depth`` entries
+    (0 disables the FIFO). As long as the TX FIFO is not empty, frames are
+    sent back-to-back with no idle time between them.
+
+    ``stream_width`` (8, 16, 32 or 64) is the width of ``rx_tdata`` and
+    ``tx_tdata``, first byte in the least significant byte lane. Wider
+    streams carry several bytes per beat, with ``tkeep`` marking the valid
+    byte lanes. Received bytes are packed into full beats, except at the end
+    of a burst: once the line has been idle for ``rx_idle_timeout`` bit
+    periods, the bytes received so far are sent with ``rx_tlast`` set. Byte
+    lanes of ``tx_tdata`` with ``tx_tkeep`` clear are not sent.
+
+    Each received byte carries its own error bits (an ``RxErrors``) through
+    the RX FIFO, presented on ``rx_tuser`` (one ``RxErrors`` per byte lane).
+    So bad bytes can be dropped individually, without stopping the stream.
+
+    ``rx_irq`` is a 16550-style receive interrupt. It asserts while at least
+    ``rx_trigger_level`` bytes are buffered (``None`` creates a runtime
+    ``rx_trigger_level`` port). It also asserts, with ``rx_irq_timeout``,
+    while fewer bytes are buffered but none have been received or read for
+    ``rx_char_timeout`` bit periods, so that the end of a burst is not left
+    waiting. So a host can take one interrupt per burst rather than one per
+    byte.
+
+    If ``flow_control`` is set, the core has active-low ``rts_n`` and
+    ``cts_n`` pins for RTS/CTS hardware flow control. ``rts_n`` deasserts
+    while at least ``rts_level`` bytes are buffered in the RX FIFO (by
+    default, one less than its depth). The FIFO entries above ``rts_level``
+    must hold the frames the far end sends before it sees ``rts_n``; a
+    ``Core`` sends at most one. While ``cts_n`` is deasserted, no new frame
+    is started, but a frame already being sent is finished. So the line can
+    run at full speed to a consumer that stalls, without overruns.
+
+    If ``autobaud`` is set, the baud rate is measured from the first
+    character received (see ``AutoBaud``), ``sync_char`` (0x55 by default),
+    or just its START bit if ``sync_char`` is ``None``. Until then, nothing
+    is received, and the transmitter runs from ``divisor``. Once the rate
+    is measured, ``baud_locked`` asserts, and the measured divisor (also on
+    ``baud_divisor``) is used instead of ``divisor``. Asserting
+    ``baud_hunt`` (e.g. after agreeing a new rate with the far end) unlocks
+    it and measures the rate of the next character.
+
+    If ``early_valid`` is set, each received byte is passed on as soon as
+    its last data bit is received, half a bit period sooner than otherwise
+    (see ``ShiftIn``). ``rx_tuser`` then only reports parity errors, and
+    ``rx_frame_error`` pulses instead if the STOP bit of the last byte
+    turns out to be bad (a framing error or break).
+
+    Everything runs in the ``sync`` domain by default, so the baud rate is
+    derived from the system clock. If ``line_domain`` is another domain
+    (e.g. ``"uart"``, from a clock that divides evenly into standard baud
+    rates), the baud rate generator and the serial side of the core run in
+    it instead, and the RX and TX FIFOs (which must then be powers of two
+    deep) are asynchronous FIFOs between the two domains. The streams and
+    the status outputs stay in ``sync``: ``rx_level`` and the flags derived
+    from it are those of the read side of the RX FIFO, and the other flags
+    go through synchronizers. The divisor, flow control and autobaud ports
+    belong to ``line_domain``.
+
+    If ``stats`` is set, ``stats`` has link health counters (a
+    ``LinkStats``, see ``Stats``): frames received and sent, overruns,
+    parity errors, framing errors, breaks, START bits rejected as glitches,
+    and the high-water marks of the RX and TX FIFOs. Asserting
+    ``stats_clear`` resets them. Both are in ``sync``.
+    """
+    def __init__(self, divisor: Optional[Union[int, float]] = None, *,
+                 oversample: int = 16, frac_bits: int = 0,
+                 compact_fsm: bool = False,
+                 rx_fifo_depth: int = 16, tx_fifo_depth: int = 16,
+                 stream_width: int = 8, rx_idle_timeout: int = 20,
+                 rx_trigger_level: Optional[int] = 1,
+                 rx_char_timeout: int = 40, flow_control: bool = False,
+                 rts_level: Optional[int] = None, autobaud: bool = False,
+                 sync_char: Optional[int] = 0x55, early_valid: bool = False,
+                 line_domain: str = "sync", pipelined_fsm: bool = False,
+                 stats: bool = False):
+        if stream_width not in STREAM_WIDTHS:
+            raise ValueError(f"stream_width must be one of {STREAM_WIDTHS}, "
+                             f"not {stream_width}")
+        if rx_trigger_level is not None and \
+                rx_trigger_level not in range(1, max(rx_fifo_depth, 1) + 1):
+            raise ValueError(f"rx_trigger_level must be from 1 to the RX "
+                             f"FIFO depth, not {rx_trigger_level}")
+        if line_domain != "sync":
+            for depth in (rx_fifo_depth, tx_fifo_depth):
+                if not depth or depth & (depth - 1):
+                    raise ValueError(f"a Core with its own line_domain needs "
+                                     f"RX and TX FIFOs a power of two deep "
+                                     f"to cross clock domains, not {depth}")
+        if flow_control:
+            if rts_level is None:
+                rts_level = rx_fifo_depth - 1
+            if rts_level not in range(1, rx_fifo_depth):
+                raise ValueError(f"rts_level must be from 1 to one less than "
+                                 f"the RX FIFO depth, not {rts_level}")
+
+        self.out = Signal(1)
+
+        self.channel = Channel(oversample=oversample, compact_fsm=compact_fsm,
+                               rx_fifo_depth=rx_fifo_depth,
+                               tx_fifo_depth=tx_fifo_depth,
+                               stream_width=stream_width,
+                               rx_idle_timeout=rx_idle_timeout,
+                               rx_char_timeout=rx_char_timeout,
+                               flow_control=flow_control,
+                               early_valid=early_valid,
+                               line_domain=line_domain,
+                               pipelined_fsm=pipelined_fsm,
+                               stats=stats)
+        self.stream_width = stream_width
+
+        self.tx = self.channel.tx
+        self.rx = self.channel.rx
+        self.brk = self.channel.brk
+
+        self.tx_tvalid = self.channel.tx_tvalid
+        self.tx_tready = self.channel.tx_tready
+        self.tx_tdata = self.channel.tx_tdata
+        self.tx_tkeep = self.channel.tx_tkeep
+
+        self.rx_tvalid = self.channel.rx_tvalid
+        self.rx_tready = self.channel.rx_tready
+        self.rx_tdata = self.channel.rx_tdata
+        self.rx_tuser = self.channel.rx_tuser
+        self.rx_tkeep = self.channel.rx_tkeep
+        self.rx_tlast = self.channel.rx_tlast
+
+        self.rx_fifo_depth = rx_fifo_depth
+        self.rx_level = self.channel.rx_level
+        self.rx_almost_full = self.channel.rx_almost_full
+        self.rx_almost_empty = self.channel.rx_almost_empty
+
+        if rx_trigger_level is None:
+            self.rx_trigger_level = Signal.like(self.channel.rx_trigger_level)
+        else:
+            self.rx_trigger_level = C(rx_trigger_level,
+                                      len(self.channel.rx_trigger_level))
+        self.rx_irq = self.channel.rx_irq
+        self.rx_irq_timeout = self.channel.rx_irq_timeout
+
+        self.flow_control = flow_control
+        self.rts_level = rts_level
+        self.rts_n = self.channel.rts_n
+        self.cts_n = self.channel.cts_n
+
+        self.early_valid = early_valid
+        self.rx_frame_error = self.channel.rx_frame_error
+
+        self.has_stats = stats
+        self.stats = self.channel.stats
+        self.stats_clear = self.channel.stats_clear
+
+        if divisor:
+            self.divisor = C(round(divisor * (1 << frac_bits)),
+                             16 + frac_bits)
+        else:
+            self.divisor = Signal(16 + frac_bits)
+        self.counter = Signal(range(12000000))
+
+        self.line_domain = line_domain
+        self.baud = BaudGen(oversample, frac_bits)
+        if autobaud:
+            self.autobaud = AutoBaud(oversample, frac_bits, sync_char)
+            self.baud_hunt = Signal(1)
+            self.baud_locked = Signal(1)
+            self.baud_divisor = Signal(16 + frac_bits)
+        else:
+            self.autobaud = None
+        self.shift_in = self.channel.shift_in
+        self.shift_out = self.channel.shift_out
+        self.rx_fifo = self.channel.rx_fifo
+        self.tx_fifo = self.channel.tx_fifo
+
+    # Top-level ports of a standalone Core, e.g. for conversion to Verilog.
+    def ports(self):
+        ios = [self.tx, self.rx, self.brk, self.tx_tvalid, self.tx_tready,
+               self.tx_tdata, self.rx_tvalid, self.rx_tready, self.rx_tdata,
+               self.rx_level, self.rx_almost_full, self.rx_almost_empty]
+        ios += [self.rx_tuser, self.rx_irq, self.rx_irq_timeout]
+        if self.stream_width > 8:
+            ios += [self.tx_tkeep, self.rx_tkeep, self.rx_tlast]
+        if self.flow_control:
+            ios += [self.rts_n, self.cts_n]
+        if self.autobaud:
+            ios += [self.baud_hunt, self.baud_locked, self.baud_divisor]
+        if self.early_valid:
+            ios.append(self.rx_frame_error)
+        if self.has_stats:
+            ios += [self.stats.as_value(), self.stats_clear]
+        if isinstance(self.divisor, Signal):
+            ios.append(self.divisor)
+        if isinstance(self.rx_trigger_level, Signal):
+            ios.append(self.rx_trigger_level)
+
+        return ios
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.baud = DomainRenamer(self.line_domain)(self.baud)
+        m.submodules.channel = self.channel
+
         m.d.sync += [self.counter.eq(self.counter + 1)]
 
         with m.If(self.counter == 12000000):
             m.d.sync += [self.out.eq(~self.out)]
 
+        if self.autobaud:
+            m.submodules.autobaud = \
+                DomainRenamer(self.line_domain)(self.autobaud)
+            m.d.comb += [
+                self.autobaud.rx.eq(self.channel.rx_sync),
+                self.autobaud.hunt.eq(self.baud_hunt),
+                self.baud_locked.eq(self.autobaud.locked),
+                self.baud_divisor.eq(self.autobaud.divisor),
+                self.channel.rx_enable.eq(self.baud_locked),
+                self.baud.divisor.eq(Mux(self.baud_locked, self.baud_divisor,
+                                         self.divisor)),
+            ]
+        else:
+            m.d.comb += self.baud.divisor.eq(self.divisor)
+
+        m.d.comb += [
+            self.channel.tick.eq(self.baud.tick),
+            self.channel.tx_strobe.eq(self.baud.tx_strobe),
+            self.channel.rx_trigger_level.eq(self.rx_trigger_level),
+        ]
+        if self.flow_control:
+            m.d.comb += self.channel.rts_level.eq(self.rts_level)
+
         return m
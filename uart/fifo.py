@@ -0,0 +1,95 @@
+from amaranth import *
+from amaranth.lib.fifo import AsyncFIFO, SyncFIFO, SyncFIFOBuffered
+
+
+class Fifo(Elaboratable):
+    """
+    Synchronous first-word-fallthrough FIFO with fill level and watermark
+    flags.
+
+    Shallow FIFOs are built from a ``SyncFIFO`` (LUTs/FFs). FIFOs deeper than
+    ``bram_threshold`` entries use a ``SyncFIFOBuffered``, whose synchronous
+    read port infers block RAM.
+
+    ``almost_full`` asserts when ``level >= almost_full_level``, and
+    ``almost_empty`` asserts when ``level <= almost_empty_level``. They default
+    to 3/4 and 1/4 of ``depth``, respectively.
+
+    If ``w_domain`` and ``r_domain`` differ, the FIFO is an ``AsyncFIFO``
+    (whose depth must be a power of two) crossing between them. ``level``
+    and the watermark flags are then as seen from ``r_domain``, and
+    ``w_level`` as seen from ``w_domain``; both lag the other side by a few
+    cycles. For a synchronous FIFO, ``w_level`` is ``level``.
+    """
+    bram_threshold = 16
+
+    def __init__(self, *, width, depth, almost_full_level=None,
+                 almost_empty_level=None, w_domain="sync", r_domain="sync"):
+        if depth < 1:
+            raise ValueError(f"FIFO depth must be at least 1, not {depth}")
+        if w_domain != r_domain and depth & (depth - 1):
+            raise ValueError(f"asynchronous FIFO depth must be a power of "
+                             f"two, not {depth}")
+
+        self.width = width
+        self.depth = depth
+
+        if almost_full_level is None:
+            almost_full_level = depth - depth // 4
+        if almost_empty_level is None:
+            almost_empty_level = depth // 4
+        self.almost_full_level = almost_full_level
+        self.almost_empty_level = almost_empty_level
+        self.w_domain = w_domain
+        self.r_domain = r_domain
+
+        self.w_data = Signal(width)
+        self.w_en = Signal(1)
+        self.w_rdy = Signal(1)
+
+        self.r_data = Signal(width)
+        self.r_en = Signal(1)
+        self.r_rdy = Signal(1)
+
+        self.level = Signal(range(depth + 1))
+        self.w_level = Signal(range(depth + 1))
+        self.almost_full = Signal(1)
+        self.almost_empty = Signal(1)
+
+    def elaborate(self, platform):
+        ###
+
+        m = Module()
+
+        if self.w_domain != self.r_domain:
+            # Reads from block RAM, if the depth warrants it.
+            m.submodules.fifo = fifo = AsyncFIFO(width=self.width,
+                                                 depth=self.depth,
+                                                 w_domain=self.w_domain,
+                                                 r_domain=self.r_domain)
+            level = fifo.r_level
+            w_level = fifo.w_level
+        else:
+            if self.depth > self.bram_threshold:
+                fifo = SyncFIFOBuffered(width=self.width, depth=self.depth)
+            else:
+                fifo = SyncFIFO(width=self.width, depth=self.depth)
+            m.submodules.fifo = DomainRenamer(self.w_domain)(fifo)
+            level = w_level = fifo.level
+
+        m.d.comb += [
+            fifo.w_data.eq(self.w_data),
+            fifo.w_en.eq(self.w_en),
+            self.w_rdy.eq(fifo.w_rdy),
+
+            self.r_data.eq(fifo.r_data),
+            fifo.r_en.eq(self.r_en),
+            self.r_rdy.eq(fifo.r_rdy),
+
+            self.level.eq(level),
+            self.w_level.eq(w_level),
+            self.almost_full.eq(level >= self.almost_full_level),
+            self.almost_empty.eq(level <= self.almost_empty_level),
+        ]
+
+        return m
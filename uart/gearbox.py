@@ -0,0 +1,153 @@
+from amaranth import *
+
+
+# Widths of the AXI stream interfaces a Core can have, in bits.
+STREAM_WIDTHS = (8, 16, 32, 64)
+
+
+def _check_width(width):
+    if width not in STREAM_WIDTHS[1:]:
+        raise ValueError(f"gearbox width must be one of {STREAM_WIDTHS[1:]}, "
+                         f"not {width}")
+
+
+class Packer(Elaboratable):
+    """
+    Pack a stream of bytes into a ``width``-bit AXI stream, first byte in
+    the least significant byte lane.
+
+    A full beat is held until the next byte arrives. If ``flush`` is
+    asserted while there are no more bytes (e.g. when the line has been
+    idle for a while), the bytes packed so far are sent as a beat with
+    ``tlast`` set and ``tkeep`` marking the valid bytes. So ``tlast`` marks
+    the end of every burst of bytes, and every beat but the last of a burst
+    is full.
+
+    ``user_width`` bits of ``i_user`` go with each byte, into the matching
+    lane of ``tuser``.
+    """
+    def __init__(self, width, user_width=0):
+        _check_width(width)
+        self.width = width
+        self.user_width = user_width
+
+        self.i_data = Signal(8)
+        self.i_user = Signal(user_width)
+        self.i_valid = Signal(1)
+        self.i_ready = Signal(1)
+        self.flush = Signal(1)
+
+        self.tdata = Signal(width)
+        self.tuser = Signal(user_width * (width // 8))
+        self.tkeep = Signal(width // 8)
+        self.tlast = Signal(1)
+        self.tvalid = Signal(1)
+        self.tready = Signal(1)
+
+    def elaborate(self, platform):
+        lanes = self.width // 8
+        lane_width = 8 + self.user_width
+        acc = Signal(lanes * lane_width)
+        lane_in = Cat(self.i_data, self.i_user)
+        count = Signal(range(lanes + 1))
+        full = Signal(1)
+        out_free = Signal(1)
+        keep = Array(C((1 << n) - 1, lanes) for n in range(lanes + 1))
+
+        ###
+
+        m = Module()
+
+        m.d.comb += [
+            full.eq(count == lanes),
+            out_free.eq(~self.tvalid | self.tready),
+            self.i_ready.eq(~full | out_free),
+        ]
+
+        with m.If(self.tvalid & self.tready):
+            m.d.sync += self.tvalid.eq(0)
+
+        out = Cat(self.tdata, self.tuser)
+        acc_lanes = [acc.word_select(n, lane_width) for n in range(lanes)]
+        acc_out = Cat(Cat(lane[:8] for lane in acc_lanes),
+                      Cat(lane[8:] for lane in acc_lanes))
+
+        with m.If(self.i_valid & self.i_ready):
+            with m.If(full):
+                # The burst goes on, so the held beat is not the last.
+                m.d.sync += [
+                    out.eq(acc_out),
+                    self.tkeep.eq(keep[lanes]),
+                    self.tlast.eq(0),
+                    self.tvalid.eq(1),
+                    acc.eq(lane_in),
+                    count.eq(1),
+                ]
+            with m.Elif(count == 0):
+                # Byte lanes not kept read as zero.
+                m.d.sync += [
+                    acc.eq(lane_in),
+                    count.eq(1),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    acc.word_select(count, lane_width).eq(lane_in),
+                    count.eq(count + 1),
+                ]
+        with m.Elif(self.flush & (count != 0) & out_free):
+            m.d.sync += [
+                out.eq(acc_out),
+                self.tkeep.eq(keep[count]),
+                self.tlast.eq(1),
+                self.tvalid.eq(1),
+                count.eq(0),
+            ]
+
+        return m
+
+
+class Unpacker(Elaboratable):
+    """
+    Unpack a ``width``-bit AXI stream into a stream of bytes, least
+    significant byte lane first. Byte lanes with ``tkeep`` clear are
+    skipped.
+    """
+    def __init__(self, width):
+        _check_width(width)
+        self.width = width
+
+        self.tdata = Signal(width)
+        self.tkeep = Signal(width // 8)
+        self.tvalid = Signal(1)
+        self.tready = Signal(1)
+
+        self.o_data = Signal(8)
+        self.o_valid = Signal(1)
+        self.o_ready = Signal(1)
+
+    def elaborate(self, platform):
+        beat = Signal(self.width)
+        keep = Signal(self.width // 8)
+
+        ###
+
+        m = Module()
+
+        m.d.comb += [
+            self.tready.eq(keep == 0),
+            self.o_data.eq(beat[:8]),
+            self.o_valid.eq(keep[0]),
+        ]
+
+        with m.If(self.tvalid & self.tready):
+            m.d.sync += [
+                beat.eq(self.tdata),
+                keep.eq(self.tkeep),
+            ]
+        with m.Elif((keep != 0) & (~keep[0] | self.o_ready)):
+            m.d.sync += [
+                beat.eq(beat[8:]),
+                keep.eq(keep[1:]),
+            ]
+
+        return m
@@ -1,3 +1,10 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from importlib import metadata
+
 from .core import *
 
 from amaranth.back import verilog
@@ -10,22 +17,153 @@ class UartGenerator(Generator):
     def __init__(self):
         super().__init__()
         self.divisor = self.config.get('divisor', None)
+        self.oversample = self.config.get('oversample', 16)
+        self.frac_bits = self.config.get('frac_bits', 0)
+        self.compact_fsm = self.config.get('compact_fsm', False)
+        self.clk_rate = self.config.get('clk_rate', None)
+        self.baud_rate = self.config.get('baud_rate', None)
+        self.max_baud_error = self.config.get('max_baud_error', 20000)
+        self.rx_fifo_depth = self.config.get('rx_fifo_depth', 16)
+        self.tx_fifo_depth = self.config.get('tx_fifo_depth', 16)
+        self.stream_width = self.config.get('stream_width', 8)
+        self.rx_idle_timeout = self.config.get('rx_idle_timeout', 20)
+        self.rx_trigger_level = self.config.get('rx_trigger_level', 1)
+        self.rx_char_timeout = self.config.get('rx_char_timeout', 40)
+        self.flow_control = self.config.get('flow_control', False)
+        self.rts_level = self.config.get('rts_level', None)
+        self.autobaud = self.config.get('autobaud', False)
+        self.sync_char = self.config.get('sync_char', 0x55)
+        self.early_valid = self.config.get('early_valid', False)
+        self.line_domain = self.config.get('line_domain', 'sync')
+        self.pipelined_fsm = self.config.get('pipelined_fsm', False)
+        self.stats = self.config.get('stats', False)
+        self.cache = self.config.get('cache', True)
+        self.cache_dir = self.config.get('cache_dir', None)
 
     def run(self):
-        files = self.gen_core()
+        self.check_divisor()
+        files = self.gen_core_cached() if self.cache else self.gen_core()
         self.add_files(files)
 
+    # Derive the divisor from clk_rate and baud_rate if given, and make sure
+    # the resulting baud rate is within tolerance.
+    def check_divisor(self):
+        if self.clk_rate is None or self.baud_rate is None:
+            return
+
+        if self.divisor is None:
+            raw, ppm = calc_divisor(self.clk_rate, self.baud_rate,
+                                    oversample=self.oversample,
+                                    frac_bits=self.frac_bits)
+            self.divisor = raw / (1 << self.frac_bits)
+        else:
+            scale = 1 << self.frac_bits
+            divisor = round(self.divisor * scale) / scale
+            actual = self.clk_rate / (self.oversample * divisor)
+            ppm = (actual - self.baud_rate) / self.baud_rate * 1e6
+
+        print(f"amaranth_uart: divisor {self.divisor} gives {self.baud_rate} baud "
+              f"with {ppm:+.0f} ppm error")
+        if abs(ppm) > self.max_baud_error:
+            raise ValueError(f"{self.baud_rate} baud error of {ppm:+.0f} ppm "
+                             f"exceeds max_baud_error ({self.max_baud_error} "
+                             "ppm); try increasing frac_bits")
+
+    # Parameters that the generated netlist depends on. clk_rate and baud_rate
+    # only matter through the divisor.
+    def core_params(self):
+        return {
+            "divisor": self.divisor,
+            "oversample": self.oversample,
+            "frac_bits": self.frac_bits,
+            "compact_fsm": self.compact_fsm,
+            "rx_fifo_depth": self.rx_fifo_depth,
+            "tx_fifo_depth": self.tx_fifo_depth,
+            "stream_width": self.stream_width,
+            "rx_idle_timeout": self.rx_idle_timeout,
+            "rx_trigger_level": self.rx_trigger_level,
+            "rx_char_timeout": self.rx_char_timeout,
+            "flow_control": self.flow_control,
+            "rts_level": self.rts_level,
+            "autobaud": self.autobaud,
+            "sync_char": self.sync_char,
+            "early_valid": self.early_valid,
+            "line_domain": self.line_domain,
+            "pipelined_fsm": self.pipelined_fsm,
+            "stats": self.stats,
+        }
+
+    # Hash the parameters, the sources of this package and the Amaranth
+    # version, which together determine the generated netlist.
+    def cache_key(self):
+        h = hashlib.sha256()
+        h.update(json.dumps(self.core_params(), sort_keys=True).encode())
+        h.update(metadata.version("amaranth").encode())
+
+        pkg_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(pkg_dir)):
+            if name.endswith(".py"):
+                with open(os.path.join(pkg_dir, name), "rb") as fp:
+                    h.update(name.encode() + b"\0" + fp.read())
+
+        return h.hexdigest()
+
+    def default_cache_dir(self):
+        base = os.environ.get("XDG_CACHE_HOME",
+                              os.path.join(os.path.expanduser("~"), ".cache"))
+        return os.path.join(base, "amaranth_uart")
+
+    # Reuse a previously generated netlist with the same cache key, or
+    # generate one and add it to the cache.
+    def gen_core_cached(self):
+        cache_dir = self.cache_dir or self.default_cache_dir()
+        key = self.cache_key()
+        cached = os.path.join(cache_dir, key + ".v")
+
+        if os.path.exists(cached):
+            print(f"amaranth_uart: cache hit ({key[:16]}), using {cached}")
+            shutil.copyfile(cached, self.output_file)
+            return self.core_files()
+
+        print(f"amaranth_uart: cache miss ({key[:16]}), generating "
+              f"{self.output_file}")
+        files = self.gen_core()
+
+        # Write to a temporary file first, so that concurrent builds never
+        # see a partial netlist.
+        os.makedirs(cache_dir, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(self.output_file, tmp)
+        os.replace(tmp, cached)
+
+        return files
+
+    def core_files(self):
+        return [{self.output_file: {"file_type": "verilogSource"}}]
+
     # Generate a core to be included in another project.
     def gen_core(self):
-        m = Core(self.divisor)
-
-        ios = [m.tx, m.rx, m.brk, m.tx_tvalid, m.tx_tready, m.tx_tdata,
-               m.rx_tvalid, m.rx_tready, m.rx_tdata]
+        m = Core(self.divisor, oversample=self.oversample,
+                 frac_bits=self.frac_bits, compact_fsm=self.compact_fsm,
+                 rx_fifo_depth=self.rx_fifo_depth,
+                 tx_fifo_depth=self.tx_fifo_depth,
+                 stream_width=self.stream_width,
+                 rx_idle_timeout=self.rx_idle_timeout,
+                 rx_trigger_level=self.rx_trigger_level,
+                 rx_char_timeout=self.rx_char_timeout,
+                 flow_control=self.flow_control,
+                 rts_level=self.rts_level,
+                 autobaud=self.autobaud, sync_char=self.sync_char,
+                 early_valid=self.early_valid,
+                 line_domain=self.line_domain,
+                 pipelined_fsm=self.pipelined_fsm,
+                 stats=self.stats)
 
         with open(self.output_file, "w") as fp:
-            fp.write(str(verilog.convert(m, name="uart", ports=ios)))
+            fp.write(str(verilog.convert(m, name="uart", ports=m.ports())))
 
-        return [{"uart.v": {"file_type": "verilogSource"}}]
+        return self.core_files()
 
 
 def generate_fusesoc_core():
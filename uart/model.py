@@ -0,0 +1,239 @@
+"""
+Reference model of the UART line protocol, operating on whole NumPy arrays
+of words and line samples at a time. Requires NumPy, which the gateware
+itself does not.
+
+A line waveform is an array of ``uint8`` samples of ``rx``, one per
+``divider_tick`` of ``ShiftIn`` (so ``oversample`` samples per bit at the
+nominal baud rate). ``decode`` follows the sampling points of
+``ShiftInFSM`` exactly, so for any waveform it predicts what ``ShiftIn``
+receives, and at which tick.
+"""
+
+import numpy as np
+
+from .params import NumDataBits, NumStopBits, ParityType
+
+
+__all__ = ["FRAME_DTYPE", "parity_bits", "frame_bits", "encode", "glitch",
+           "decode"]
+
+
+# Per-frame results of decode: the tick at which ShiftInFSM asserts wr_out,
+# the data, and the ShiftInStatus error bits.
+FRAME_DTYPE = np.dtype([
+    ("tick", np.int64),
+    ("data", np.uint8),
+    ("parity", np.bool_),
+    ("frame", np.bool_),
+    ("brk", np.bool_),
+])
+
+
+def _num_bits(num_data_bits):
+    return NumDataBits(num_data_bits).value + 5
+
+
+def parity_bits(data, num_data_bits=NumDataBits.EIGHT, kind=ParityType.EVEN):
+    """Return the parity bit to send with each word of ``data``."""
+    data = np.asarray(data, dtype=np.uint8)
+    kind = ParityType(kind)
+    if kind == ParityType.ONE:
+        return np.ones_like(data)
+    if kind == ParityType.ZERO:
+        return np.zeros_like(data)
+
+    masked = data & np.uint8((1 << _num_bits(num_data_bits)) - 1)
+    ones = np.unpackbits(masked[:, None], axis=1).sum(axis=1) & 1
+    if kind == ParityType.ODD:
+        ones ^= 1
+    return ones.astype(np.uint8)
+
+
+def frame_bits(data, *, num_data_bits=NumDataBits.EIGHT, parity=None,
+               num_stop_bits=NumStopBits.ONE, breaks=None,
+               corrupt_parity=None, corrupt_stop=None):
+    """
+    Return an array with one row of line bits per word of ``data``: the
+    START bit, data bits LSB first, a parity bit if ``parity`` is a
+    ``ParityType``, and the STOP bit(s).
+
+    Rows where ``breaks`` is set are all zeros (a break condition). Rows where
+    ``corrupt_parity`` is set have their parity bit inverted, and rows where
+    ``corrupt_stop`` is set have their first STOP bit cleared (a frame
+    error).
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    nd = _num_bits(num_data_bits)
+    ns = NumStopBits(num_stop_bits).value + 1
+    cols = [np.zeros((len(data), 1), dtype=np.uint8),
+            (data[:, None] >> np.arange(nd, dtype=np.uint8)) & 1]
+    if parity is not None:
+        par = parity_bits(data, num_data_bits, parity)
+        if corrupt_parity is not None:
+            par = par ^ np.asarray(corrupt_parity, dtype=np.uint8)
+        cols.append(par[:, None])
+    cols.append(np.ones((len(data), ns), dtype=np.uint8))
+    bits = np.concatenate(cols, axis=1)
+
+    if corrupt_stop is not None:
+        bits[np.asarray(corrupt_stop, dtype=bool), -ns] = 0
+    if breaks is not None:
+        bits[np.asarray(breaks, dtype=bool)] = 0
+    return bits
+
+
+def encode(data, *, oversample=16, skew=0.0, idle_bits=0, lead_bits=1,
+           **kwargs):
+    """
+    Encode ``data`` into a line waveform sampled ``oversample`` times per
+    nominal bit period. Keyword arguments are passed to ``frame_bits``.
+
+    ``skew`` is the fractional error of the transmitter's bit period (0.1
+    is 10% slow, -0.1 is 10% fast). ``idle_bits`` (a scalar, or one per
+    word) is the number of idle bit periods after each frame, and
+    ``lead_bits`` those before the first.
+    """
+    bits = frame_bits(data, **kwargs)
+    (num_frames, frame_len) = bits.shape
+
+    # Place each frame after the previous one and its idle bits.
+    idle = np.broadcast_to(np.asarray(idle_bits, dtype=np.int64),
+                           (num_frames,))
+    starts = lead_bits + np.concatenate(([0], np.cumsum(frame_len + idle)))
+    stream = np.ones(starts[-1], dtype=np.uint8)
+    stream[(starts[:-1, None] + np.arange(frame_len)).ravel()] = bits.ravel()
+
+    # Sample the bit stream at each tick of the receiver.
+    period = oversample * (1 + skew)
+    ticks = np.arange(int(np.ceil(len(stream) * period)))
+    return stream[np.minimum((ticks / period).astype(np.int64),
+                             len(stream) - 1)]
+
+
+def glitch(line, ticks, width=1):
+    """Return a copy of ``line`` pulled low for ``width`` ticks from each of
+       ``ticks``."""
+    line = np.array(line, dtype=np.uint8)
+    index = (np.asarray(ticks, dtype=np.int64)[:, None] +
+             np.arange(width)).ravel()
+    line[index[index < len(line)]] = 0
+    return line
+
+
+def decode(line, *, num_data_bits=NumDataBits.EIGHT, parity=None,
+           oversample=16):
+    """
+    Decode a line waveform as ``ShiftIn`` configured with ``num_data_bits``
+    and ``parity`` (a ``ParityType`` or ``None``) would, returning an array of
+    ``FRAME_DTYPE``, one per frame it receives (including those with errors).
+    Like ``ShiftIn``, only the first STOP bit is checked. Frames cut off by
+    the end of the waveform are not returned.
+    """
+    x = np.asarray(line, dtype=np.uint8)
+    length = len(x)
+    nd = _num_bits(num_data_bits)
+    nbits = 1 + nd + (parity is not None) + 1
+
+    # Sample and scheduling offsets, as in ShiftInFSM.
+    sample_point = oversample // 2 - 1
+    start_bias = max(0, 2 - sample_point)
+    recover_bias = max(-2, 2 - sample_point)
+
+    # rx_prev resets to 1, so a line that starts low has a falling edge.
+    prev = np.concatenate(([1], x[:-1]))
+    edges = np.flatnonzero((x == 0) & (prev == 1))
+    highs = np.flatnonzero(x == 1)
+
+    def next_edge(ticks):
+        i = np.searchsorted(edges, ticks)
+        return np.where(i < len(edges), edges[np.minimum(i, len(edges) - 1)],
+                        -1)
+
+    def evaluate(sched, bias):
+        """Follow the frame scheduled at tick ``sched`` with ``bias``
+           through to its outcome, for many frames at once."""
+        samples_at = (sched + bias + sample_point)[:, None] + \
+            oversample * np.arange(nbits)
+        wr_out = samples_at[:, -1] + 1
+        valid = wr_out < length
+        samples = x[np.minimum(samples_at, length - 1)]
+
+        glitched = samples[:, 0] == 1
+        rx_zero = ~samples.any(axis=1)
+        frame = ~rx_zero & (samples[:, -1] == 0)
+
+        data = (samples[:, 1:1 + nd].astype(np.uint16) <<
+                np.arange(nd, dtype=np.uint16)).sum(axis=1)
+        if parity is None:
+            parity_err = np.zeros(len(sched), dtype=bool)
+        elif parity in (ParityType.ODD, ParityType.EVEN):
+            ones = samples[:, 1:2 + nd].sum(axis=1) & 1
+            parity_err = ones != (parity == ParityType.ODD)
+        else:
+            parity_err = samples[:, 1 + nd] != (parity == ParityType.ONE)
+
+        # A break holds wr_out until the line is released.
+        i = np.searchsorted(highs, wr_out)
+        released = i < len(highs)
+        release = highs[np.minimum(i, len(highs) - 1)]
+        wr_out = np.where(rx_zero, release, wr_out)
+        valid &= ~rx_zero | released
+
+        # What the FSM does next: go back to IDLE after a glitch, restart
+        # straight away after a frame error or an early START bit, or go
+        # back to IDLE.
+        line_low = x[np.minimum(wr_out, length - 1)] == 0
+        restart = ~rx_zero & (frame | line_low)
+        idle_at = np.where(glitched, sched + bias + oversample, wr_out + 1)
+        nxt_tick = np.where(restart & ~glitched, wr_out, next_edge(idle_at))
+        nxt_recover = restart & ~glitched & frame
+        nxt_tick = np.where(glitched | valid, nxt_tick, -1)
+
+        out = np.zeros(len(sched), dtype=FRAME_DTYPE)
+        out["tick"] = wr_out
+        out["data"] = data
+        out["parity"] = parity_err
+        out["frame"] = frame
+        out["brk"] = rx_zero
+        return (out, valid & ~glitched, nxt_tick, nxt_recover)
+
+    # Every frame starts either at a falling edge seen in IDLE, or with
+    # recover_bias straight after a frame error. Evaluate frames at every
+    # falling edge, and then at every recovery point found, until there are
+    # no new ones. A node's key is its tick, and whether it is a recovery.
+    recovered = np.zeros(length + 1, dtype=bool)
+    todo = edges * 2
+    results = []
+    while len(todo):
+        (out, valid, nxt_tick, nxt_recover) = evaluate(
+            todo // 2, np.where(todo & 1, recover_bias, start_bias))
+        nxt = np.where(nxt_tick < 0, -1, nxt_tick * 2 + nxt_recover)
+        results.append((todo, out, valid, nxt))
+        found = nxt_tick[nxt_recover & (nxt_tick >= 0)]
+        found = found[~recovered[found]]
+        recovered[found] = True
+        todo = np.unique(found) * 2 + 1
+
+    if not results:
+        return np.zeros(0, dtype=FRAME_DTYPE)
+
+    node = np.concatenate([r[0] for r in results])
+    order = np.argsort(node)
+    node = node[order]
+    out = np.concatenate([r[1] for r in results])[order]
+    valid = np.concatenate([r[2] for r in results])[order]
+    nxt = np.concatenate([r[3] for r in results])[order]
+
+    # The frames received are the chain of nodes starting from the first
+    # falling edge. Mark it by pointer doubling, with an extra node for
+    # "end of waveform" that points to itself.
+    end = len(node)
+    jump = np.append(np.where(nxt >= 0, np.searchsorted(node, nxt), end), end)
+    on_chain = np.zeros(end + 1, dtype=bool)
+    on_chain[0] = True
+    while jump[0] != end:
+        on_chain[jump[on_chain]] = True
+        jump = jump[jump]
+
+    return out[on_chain[:end] & valid]
@@ -4,10 +4,25 @@ from amaranth import *
 from amaranth.lib import data
 
 
-class BackingStore(data.Struct):
-    start: unsigned(1)
-    payload: unsigned(8)
-    stop: unsigned(1)
+def calc_divisor(clk_rate, baud_rate, *, oversample=16, frac_bits=0):
+    """
+    Calculate the ``BaudGen`` divisor which best approximates ``baud_rate``
+    from ``clk_rate``.
+
+    The divisor is fixed-point, with ``frac_bits`` fractional bits. Returns a
+    tuple of the raw divisor and the error of the resulting baud rate in
+    parts-per-million (positive if the resulting baud rate is too fast).
+    """
+    scale = 1 << frac_bits
+    divisor = round(clk_rate * scale / (oversample * baud_rate))
+
+    if divisor < scale or divisor >= (1 << 16) * scale:
+        raise ValueError(f"cannot generate {baud_rate} baud from a "
+                         f"{clk_rate} Hz clock with {oversample}x "
+                         "oversampling")
+
+    actual = clk_rate * scale / (oversample * divisor)
+    return (divisor, (actual - baud_rate) / baud_rate * 1e6)
 
 
 class NumDataBits(enum.Enum):
@@ -40,3 +55,25 @@ class ShiftInStatus(data.Struct):
     parity: unsigned(1)
     frame: unsigned(1)
     brk: unsigned(1)
+
+
+# Errors of a single received character, as carried with it through the RX
+# FIFO (and on rx_tuser).
+class RxErrors(data.Struct):
+    parity: unsigned(1)
+    frame: unsigned(1)
+    brk: unsigned(1)
+
+
+# Link health counters of a Core (see stats.Stats). The frame counters wrap,
+# the error counters saturate, and the high-water marks are FIFO levels.
+class LinkStats(data.Struct):
+    rx_frames: unsigned(32)
+    tx_frames: unsigned(32)
+    overrun: unsigned(16)
+    parity: unsigned(16)
+    frame: unsigned(16)
+    brk: unsigned(16)
+    glitch: unsigned(16)
+    rx_high_water: unsigned(16)
+    tx_high_water: unsigned(16)
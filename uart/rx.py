@@ -7,7 +7,29 @@ from amaranth import *
 
 
 class ShiftIn(Elaboratable):
-    def __init__(self):
+    """
+    Receiver, sampling ``rx`` ``oversample`` times per bit. ``divider_tick``
+    should assert at ``oversample`` times the baud rate. ``compact`` selects
+    the counter-based ``ShiftInFSM``, and ``pipelined`` its shorter timing
+    path.
+
+    The error bits of ``status`` are those of the last frame received, until
+    ``rd_status`` clears them. ``errors`` has the error bits of ``data``, and
+    is only updated along with it, so it can be buffered with ``data``.
+
+    By default, ``data`` is only ready once the STOP bit has been sampled
+    (and a break released). If ``early`` is set, ``data`` is ready as soon as
+    the last data (or parity) bit has been shifted in, half a bit period
+    sooner, with ``errors`` only reporting parity. The framing and break bits
+    of ``status`` are then updated separately, when ``stop_valid`` asserts.
+
+    ``lost`` pulses when a byte is written over one that was never read
+    (setting the ``overrun`` bit of ``status``), and ``glitch`` when a START
+    bit is rejected as a glitch.
+    """
+    def __init__(self, oversample: int = 16, compact: bool = False,
+                 early: bool = False, pipelined: bool = False):
+        self.early = early
         self.rx = Signal(1, reset=1)
 
         self.num_data_bits = Signal(NumDataBits)
@@ -18,8 +40,18 @@ class ShiftIn(Elaboratable):
         self.rd_status = Signal(1)
         self.data = Signal(8)
         self.status = Signal(ShiftInStatus)
+        self.errors = Signal(RxErrors)
+        self.stop_valid = Signal(1)
+        self.lost = Signal(1)
+        self.glitch = Signal(1)
 
-        self.shift_fsm = ShiftInFSM()
+        self.shift_fsm = ShiftInFSM(oversample, compact, pipelined)
+
+    def ports(self):
+        return [self.rx, self.num_data_bits, self.parity.as_value(),
+                self.divider_tick, self.rd_data, self.rd_status, self.data,
+                self.status.as_value(), self.errors.as_value(),
+                self.stop_valid, self.lost, self.glitch]
 
     def elaborate(self, platform):
 
@@ -32,6 +64,7 @@ class ShiftIn(Elaboratable):
             self.shift_fsm.rx.eq(self.rx),
             self.shift_fsm.num_data_bits.eq(self.num_data_bits),
             self.shift_fsm.parity.eq(self.parity),
+            self.glitch.eq(self.shift_fsm.glitch & self.divider_tick),
         ]
 
         with m.If(self.rd_data):
@@ -45,12 +78,9 @@ class ShiftIn(Elaboratable):
                 self.status.brk.eq(0)
             ]
 
-        # Highest priority b/c it's bad to lose data!
-        with m.If(self.shift_fsm.wr_out & self.divider_tick):
-            m.d.sync += [
-                self.status.eq(self.shift_fsm.status),
-                self.status.overrun.eq(self.status.ready & ~self.rd_data)
-            ]
+        def write_data():
+            m.d.comb += self.lost.eq(self.status.ready & ~self.rd_data)
+            m.d.sync += self.status.overrun.eq(self.lost)
 
             with m.Switch(self.num_data_bits):
                 for bits in NumDataBits:
@@ -58,6 +88,34 @@ class ShiftIn(Elaboratable):
                         valid = slice(3 - bits.value, None)
                         m.d.sync += self.data.eq(self.shift_fsm.shreg[valid])
 
+        # Highest priority b/c it's bad to lose data!
+        if self.early:
+            with m.If(self.shift_fsm.data_out & self.divider_tick):
+                m.d.sync += [
+                    self.status.ready.eq(1),
+                    self.status.parity.eq(self.shift_fsm.parity_error),
+                    self.errors.eq(0),
+                    self.errors.parity.eq(self.shift_fsm.parity_error),
+                ]
+                write_data()
+
+            with m.If(self.shift_fsm.wr_out & self.divider_tick):
+                m.d.comb += self.stop_valid.eq(1)
+                m.d.sync += [
+                    self.status.frame.eq(self.shift_fsm.status.frame),
+                    self.status.brk.eq(self.shift_fsm.status.brk),
+                ]
+        else:
+            with m.If(self.shift_fsm.wr_out & self.divider_tick):
+                m.d.comb += self.stop_valid.eq(1)
+                m.d.sync += [
+                    self.status.eq(self.shift_fsm.status),
+                    self.errors.parity.eq(self.shift_fsm.status.parity),
+                    self.errors.frame.eq(self.shift_fsm.status.frame),
+                    self.errors.brk.eq(self.shift_fsm.status.brk),
+                ]
+                write_data()
+
         return m
 
 
@@ -65,15 +123,48 @@ class ShiftInFSM(Elaboratable):
     """
     This module requires an EnableInserter that asserts once every
     divider cycles to work as intended.
+
+    ``oversample`` is the number of enabled cycles per bit, and must be a
+    power of two of at least 4. Each bit is sampled in its middle and shifted
+    in at its end.
+
+    By default, the FSM has a separate set of states for every data bit. If
+    ``compact`` is set, all data bits share one set of states and a bit
+    counter instead, which decodes to much less logic. Both are cycle-for-cycle
+    identical.
+
+    The sample and shift points of each bit are a fixed offset from where
+    the START bit was detected. By default they are recomputed from that
+    point every cycle, an adder in front of the comparators that decide the
+    next state. If ``pipelined`` is set, they are computed once, when the
+    START bit is detected, and held in registers instead, so that the
+    comparators only see registers. This takes a few more flip-flops, and
+    is cycle-for-cycle identical.
+
+    ``data_out`` asserts for the first cycle of the STOP bit, when ``shreg``
+    and ``parity_error`` are final. ``wr_out`` asserts once the STOP bit has
+    been sampled, with the full ``status``. ``glitch`` asserts when a START
+    bit is rejected, because the line was high again by its middle.
     """
-    def __init__(self):
+    def __init__(self, oversample: int = 16, compact: bool = False,
+                 pipelined: bool = False):
+        if oversample < 4 or oversample & (oversample - 1):
+            raise ValueError("oversample must be a power of two >= 4, "
+                             f"not {oversample}")
+
+        self.oversample = oversample
+        self.compact = compact
+        self.pipelined = pipelined
         self.rx = Signal(1)
         self.shreg = Signal(8)
 
         self.num_data_bits = Signal(NumDataBits)
         self.parity = Signal(Parity)
 
+        self.data_out = Signal(1)
+        self.parity_error = Signal(1)
         self.wr_out = Signal(1)
+        self.glitch = Signal(1)
         self.data = Signal(8)
         self.status = Signal(ShiftInStatus)
 
@@ -92,22 +183,57 @@ class ShiftInFSM(Elaboratable):
         schedule_sample_shift = Signal(1)
 
         # Internal signals.
-        parity_error = Signal.like(rx_parity)
+        parity_error = self.parity_error
         rx_prev = Signal.like(self.rx, reset=1)
-        rclk_count = Signal(4)
-        rclk_bias = Signal(4)
+        rclk_count = Signal(range(self.oversample))
+        rclk_bias = Signal.like(rclk_count)
+        bit_count = Signal(3)
+
+        # Sample in the middle of each bit, and shift at the end.
+        sample_point = self.oversample // 2 - 1
+        shift_point = self.oversample - 1
+
+        # Each bit needs at least one cycle between entering a *_1 state and
+        # sample_imminent. At low oversampling ratios, delay the sample point
+        # of the START bit rather than missing it.
+        start_bias = max(0, 2 - sample_point)
+        recover_bias = max(-2, 2 - sample_point)
 
         ###
 
         m = Module()
 
-        m.d.comb += [
-            rx_negedge.eq(~self.rx & rx_prev),
-            # Anticipate that the sample should happen at the end of the
-            # _next_ cycle, hence "-1".
-            sample_imminent.eq(rclk_count == (rclk_bias + 7 - 1)[:4]),
-            shift_imminent.eq(rclk_count == (rclk_bias + 15 - 1)[:4]),
-        ]
+        m.d.comb += rx_negedge.eq(~self.rx & rx_prev)
+
+        # Anticipate that the sample should happen at the end of the _next_
+        # cycle, hence "-1".
+        if self.pipelined:
+            width = len(rclk_count)
+            sample_at = Signal.like(rclk_count,
+                                    reset=(sample_point - 1) % 2**width)
+            shift_at = Signal.like(rclk_count,
+                                   reset=(shift_point - 1) % 2**width)
+
+            def set_bias(bias):
+                m.d.sync += [
+                    sample_at.eq((rclk_count + (bias + sample_point - 1))[:width]),  # noqa: E501
+                    shift_at.eq((rclk_count + (bias + shift_point - 1))[:width]),  # noqa: E501
+                ]
+
+            m.d.comb += [
+                sample_imminent.eq(rclk_count == sample_at),
+                shift_imminent.eq(rclk_count == shift_at),
+            ]
+        else:
+            def set_bias(bias):
+                m.d.sync += rclk_bias.eq(rclk_count + bias)
+
+            m.d.comb += [
+                sample_imminent.eq(rclk_count ==
+                                   (rclk_bias + sample_point - 1)[:len(rclk_count)]),  # noqa: E501
+                shift_imminent.eq(rclk_count ==
+                                  (rclk_bias + shift_point - 1)[:len(rclk_count)]),  # noqa: E501
+            ]
         m.d.sync += [
             rx_prev.eq(self.rx),
             rclk_count.eq(rclk_count + 1)
@@ -135,18 +261,19 @@ class ShiftInFSM(Elaboratable):
                 rx_tmp.eq(0),
                 rx_parity.eq(0),
                 rx_zero.eq(1),
-                rclk_bias.eq(rclk_count),
                 parity_error.eq(0)
             ]
 
             # If we're trying to schedule an RX due to frame error, go straight
             # to START state. Assume line went low one cycle before it was
             # detected (two cycles before this one).
-            # Else: Schedule sample at 8 clock cycles from now.
+            # Else: Schedule sample at half a bit from now.
             with m.If(self.status.frame):
-                m.d.sync += rclk_bias.eq(rclk_count - 2)
+                set_bias(recover_bias)
             with m.Else():
-                m.d.sync += rclk_bias.eq(rclk_count)
+                set_bias(start_bias)
+
+        m.d.sync += self.data_out.eq(0)
 
         with m.FSM():
             def per_bit_state(curr_prefix,
@@ -178,36 +305,13 @@ class ShiftInFSM(Elaboratable):
                     m.d.comb += schedule_sample_shift.eq(1)
                     m.next = "START_1"
 
-            # Don't bother doing an xfer if the sampled start bit wasn't 0.
-            def check_for_start_glitch():
-                with m.If(rx_tmp == 1):
-                    m.next = "IDLE"
-                with m.Else():
-                    m.next = "DATA_BIT_0_1"
-
-            per_bit_state("START", check_for_start_glitch, suppress_shift=True)  # noqa: E501
-            per_bit_state("DATA_BIT_0", "DATA_BIT_1")
-            per_bit_state("DATA_BIT_1", "DATA_BIT_2")
-            per_bit_state("DATA_BIT_2", "DATA_BIT_3")
-            per_bit_state("DATA_BIT_3", "DATA_BIT_4")
-
-            def check_if_last_data_bit(next_prefix, num_bits: NumDataBits):
-                with m.If(self.num_data_bits == num_bits):
-                    check_parity_or_stop()
-                with m.Else():
-                    m.next = f"{next_prefix}_1"
-
             def check_parity_or_stop():
                 with m.If(self.parity.enabled):
                     m.next = "PARITY_1"
                 with m.Else():
+                    m.d.sync += self.data_out.eq(1)
                     m.next = "STOP_1"
 
-            per_bit_state("DATA_BIT_4", partial(check_if_last_data_bit, "DATA_BIT_5", NumDataBits.FIVE))  # noqa: E501
-            per_bit_state("DATA_BIT_5", partial(check_if_last_data_bit, "DATA_BIT_6", NumDataBits.SIX))  # noqa: E501
-            per_bit_state("DATA_BIT_6", partial(check_if_last_data_bit, "DATA_BIT_7", NumDataBits.SEVEN))  # noqa: E501
-            per_bit_state("DATA_BIT_7", check_parity_or_stop)
-
             def check_parity_error():
                 with m.Switch(self.parity.kind):
                     with m.Case(ParityType.ODD):
@@ -218,8 +322,59 @@ class ShiftInFSM(Elaboratable):
                         m.d.sync += parity_error.eq(rx_tmp != 1)
                     with m.Case(ParityType.ZERO):
                         m.d.sync += parity_error.eq(rx_tmp != 0)
+                m.d.sync += self.data_out.eq(1)
                 m.next = "STOP_1"
 
+            if self.compact:
+                # Don't bother doing an xfer if the sampled start bit wasn't 0.
+                def check_for_start_glitch():
+                    with m.If(rx_tmp == 1):
+                        m.d.comb += self.glitch.eq(1)
+                        m.next = "IDLE"
+                    with m.Else():
+                        m.d.sync += bit_count.eq(0)
+                        m.next = "DATA_1"
+
+                # The last data bit index is 4 to 7 for 5 to 8 data bits,
+                # which is just num_data_bits with bit 2 set. Like the
+                # unrolled FSM, never go past 8 data bits, even if
+                # num_data_bits changes mid-frame.
+                def check_if_last_data_bit():
+                    with m.If((bit_count == Cat(self.num_data_bits, C(1, 1))) |
+                              (bit_count == 7)):
+                        check_parity_or_stop()
+                    with m.Else():
+                        m.d.sync += bit_count.eq(bit_count + 1)
+                        m.next = "DATA_1"
+
+                per_bit_state("START", check_for_start_glitch, suppress_shift=True)  # noqa: E501
+                per_bit_state("DATA", check_if_last_data_bit)
+            else:
+                # Don't bother doing an xfer if the sampled start bit wasn't 0.
+                def check_for_start_glitch():
+                    with m.If(rx_tmp == 1):
+                        m.d.comb += self.glitch.eq(1)
+                        m.next = "IDLE"
+                    with m.Else():
+                        m.next = "DATA_BIT_0_1"
+
+                per_bit_state("START", check_for_start_glitch, suppress_shift=True)  # noqa: E501
+                per_bit_state("DATA_BIT_0", "DATA_BIT_1")
+                per_bit_state("DATA_BIT_1", "DATA_BIT_2")
+                per_bit_state("DATA_BIT_2", "DATA_BIT_3")
+                per_bit_state("DATA_BIT_3", "DATA_BIT_4")
+
+                def check_if_last_data_bit(next_prefix, num_bits: NumDataBits):  # noqa: E501
+                    with m.If(self.num_data_bits == num_bits):
+                        check_parity_or_stop()
+                    with m.Else():
+                        m.next = f"{next_prefix}_1"
+
+                per_bit_state("DATA_BIT_4", partial(check_if_last_data_bit, "DATA_BIT_5", NumDataBits.FIVE))  # noqa: E501
+                per_bit_state("DATA_BIT_5", partial(check_if_last_data_bit, "DATA_BIT_6", NumDataBits.SIX))  # noqa: E501
+                per_bit_state("DATA_BIT_6", partial(check_if_last_data_bit, "DATA_BIT_7", NumDataBits.SEVEN))  # noqa: E501
+                per_bit_state("DATA_BIT_7", check_parity_or_stop)
+
             per_bit_state("PARITY", check_parity_error, suppress_shift=True)  # noqa: E501
 
             # STOP bit is special, handle manually.
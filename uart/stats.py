@@ -0,0 +1,59 @@
+from .params import LinkStats
+
+from amaranth import *
+
+
+# Event inputs of Stats, in the order of the LinkStats counters they drive.
+EVENTS = ("rx_frames", "tx_frames", "overrun", "parity", "frame", "brk",
+          "glitch")
+
+
+class Stats(Elaboratable):
+    """
+    Count link events into ``stats`` (a ``LinkStats``), one input pulse
+    each: frames received (including bad ones) and sent, bytes lost to
+    overruns, parity errors, framing errors, breaks, and START bits rejected
+    as glitches. ``rx_level`` and ``tx_level`` are tracked for their
+    high-water marks.
+
+    The frame counters wrap, so a host can trend them by taking the
+    difference between reads. The error counters saturate, so that a burst
+    of errors can't wrap back to a clean count. ``clear`` resets the counters
+    (to any event in the same cycle) and the high-water marks (to the
+    current levels).
+    """
+    def __init__(self):
+        for name in EVENTS:
+            setattr(self, name, Signal(1, name=name))
+        self.rx_level = Signal(16)
+        self.tx_level = Signal(16)
+        self.clear = Signal(1)
+
+        self.stats = Signal(LinkStats)
+
+    def ports(self):
+        return [getattr(self, name) for name in EVENTS] + \
+            [self.rx_level, self.tx_level, self.clear, self.stats.as_value()]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        for name in EVENTS:
+            event = getattr(self, name)
+            count = getattr(self.stats, name)
+
+            with m.If(self.clear):
+                m.d.sync += count.eq(event)
+            with m.Elif(event):
+                if name.endswith("_frames"):
+                    m.d.sync += count.eq(count + 1)
+                else:
+                    with m.If(count != 2**len(count) - 1):
+                        m.d.sync += count.eq(count + 1)
+
+        for (level, mark) in ((self.rx_level, self.stats.rx_high_water),
+                              (self.tx_level, self.stats.tx_high_water)):
+            with m.If(self.clear | (level > mark)):
+                m.d.sync += mark.eq(level)
+
+        return m